@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Flask under sync gunicorn workers against the ASGI app under uvicorn ones.
+
+    python -m benchmarks.asgi --workers 8 --connections 64 --duration 20
+"""
+import random
+
+from .common import argument_parser, prepared_app, report, seed_customers
+from .server import gunicorn, http_load
+
+
+STACKS = {
+    'sync': ('src:create_app()', 'sync'),
+    'asgi': ('src.asgi:create_asgi_app()', 'uvicorn.workers.UvicornWorker'),
+}
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument(
+        '--stacks', nargs='+', choices=list(STACKS), default=list(STACKS),
+    )
+    args = parser.parse_args()
+
+    def transfer(_):
+        sender_id, recipient_id = \
+            random.sample(range(1, args.customers + 1), 2)
+        return (
+            'POST',
+            f'/v1/customer/{sender_id}/transfer',
+            {'customer_id': recipient_id, 'amount': 1},
+        )
+
+    def balance(_):
+        customer_id = random.randint(1, args.customers)
+        return 'GET', f'/v1/customer/{customer_id}/balance', None
+
+    results = {}
+    for stack in args.stacks:
+        application, worker_class = STACKS[stack]
+        with prepared_app():
+            seed_customers(args.customers, amount=10 ** 9)
+            with gunicorn(application, args.port, args.workers, worker_class):
+                for name, request in (
+                        ('transfer', transfer), ('balance', balance),
+                ):
+                    results[f'{stack}/{name}'] = http_load(
+                        args.port, request, args.connections, args.duration,
+                    )
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Balance read throughput with and without the per-worker customers cache.
+
+    python -m benchmarks.balance_cache --customers 1000 --write-ratio 0.01
+
+Cache counters are only collected with ``--processes 1``.
+"""
+import random
+
+from src.api.balances import customers
+
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--write-ratio', type=float, default=0.0)
+    args = parser.parse_args()
+
+    def request(client, _):
+        customer_id = 1 + random.randrange(args.customers)
+        if random.random() < args.write_ratio:
+            return client.post(
+                f'/v1/customer/{customer_id}/replenishment',
+                json={'amount': 1},
+            )
+        return client.get(f'/v1/customer/{customer_id}/balance')
+
+    results = {}
+    maxsize = customers.maxsize
+    for name, cache_size in (('database', 0), ('cache', maxsize)):
+        customers.clear()
+        customers.maxsize = cache_size
+        hits, misses = customers.hits, customers.misses
+        with prepared_app() as app:
+            seed_customers(args.customers)
+            results[name] = run_load(
+                app, request, args.threads, args.duration, args.processes,
+            )
+        results[name]['cache_hits'] = customers.hits - hits
+        results[name]['cache_misses'] = customers.misses - misses
+    customers.maxsize = maxsize
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=wildcard-import,unused-wildcard-import
+# The production gunicorn config that also leaves a mark with its boot time
+# in BOOT_MARKS_DIR once a worker is ready, see benchmarks.worker_boot.
+import os
+import time
+
+import gunicorn_conf
+from gunicorn_conf import *  # noqa: F401,F403
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+    gunicorn_conf.post_fork(server, worker)
+
+
+def post_worker_init(worker):
+    path = os.path.join(os.environ['BOOT_MARKS_DIR'], str(worker.pid))
+    with open(f'{path}.tmp', 'w') as mark:
+        mark.write(str(time.perf_counter() - worker.forked_at))
+    os.rename(f'{path}.tmp', path)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from alembic.command import downgrade, upgrade
+from alembic.config import Config as AlembicConfig
+from sqlalchemy import text
+
+from src import create_app
+from src.extensions import db
+
+
+def argument_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    return parser
+
+
+@contextmanager
+def prepared_app(revision: str = 'head', **config):
+    # The database is migrated from scratch and dropped afterwards, so never
+    # point SQLALCHEMY_DATABASE_URI at anything but a scratch database.
+    app = create_app()
+    app.config.update(config)
+    alembic_config = AlembicConfig('migrations/alembic-unittest.ini')
+    with app.app_context():
+        upgrade(alembic_config, revision)
+        try:
+            yield app
+        finally:
+            db.session.remove()
+            downgrade(alembic_config, 'base')
+
+
+def seed_customers(count: int, amount: int = 0):
+    # pylint: disable=no-member
+    db.session.execute(
+        text(
+            'INSERT INTO customers (name, created_at, deleted) '
+            "SELECT 'customer-' || n, now(), false "
+            'FROM generate_series(1, :count) AS n'
+        ),
+        {'count': count},
+    )
+    db.session.execute(
+        text(
+            'INSERT INTO wallets (customer_id, amount) '
+            'SELECT id, :amount FROM customers ORDER BY id'
+        ),
+        {'amount': amount},
+    )
+    db.session.commit()
+
+
+def percentile(values: List[float], rank: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * rank))]
+
+
+def drive(app, request: Callable, threads: int, deadline: float):
+    # Every thread gets its own test client and calls ``request(client, n)``
+    # until the deadline; ``request`` returns the response.
+    lock = threading.Lock()
+    latencies: List[float] = []
+    codes: Dict[int, int] = {}
+
+    def worker(number):
+        local_latencies = []
+        local_codes: Dict[int, int] = {}
+        step = 0
+        with app.test_client() as client:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                response = request(client, number * 1_000_000 + step)
+                local_latencies.append(time.perf_counter() - started)
+                local_codes[response.status_code] = \
+                    local_codes.get(response.status_code, 0) + 1
+                step += 1
+        with lock:
+            latencies.extend(local_latencies)
+            for code, count in local_codes.items():
+                codes[code] = codes.get(code, 0) + count
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(threads)))
+    return latencies, codes
+
+
+def run_load(
+        app,
+        request: Callable,
+        threads: int,
+        duration: float,
+        processes: int = 1,
+) -> Dict[str, float]:
+    # With several processes every one of them drives its own ``threads``,
+    # so the client side isn't limited by a single interpreter lock.
+    started = time.monotonic()
+    deadline = started + duration
+    if processes == 1:
+        latencies, codes = drive(app, request, threads, deadline)
+    else:
+        results = multiprocessing.get_context('fork').Queue()
+
+        def child(number):
+            # pylint: disable=no-member
+            db.engine.dispose()
+            results.put(drive(app, request, threads, deadline))
+
+        children = [
+            multiprocessing.get_context('fork').Process(
+                target=child, args=(number,),
+            )
+            for number in range(processes)
+        ]
+        for process in children:
+            process.start()
+        latencies, codes = [], {}
+        for _ in children:
+            child_latencies, child_codes = results.get()
+            latencies.extend(child_latencies)
+            for code, count in child_codes.items():
+                codes[code] = codes.get(code, 0) + count
+        for process in children:
+            process.join()
+    elapsed = time.monotonic() - started
+
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'codes': codes,
+    }
+
+
+def report(results: Dict[str, Dict]):
+    print(json.dumps(results, indent=2, sort_keys=True))
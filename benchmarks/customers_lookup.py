@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""A page of customers by one lookup against a call per customer.
+
+    python -m benchmarks.customers_lookup --customers 100000 --page-size 100
+
+Every request renders one page of ``--page-size`` random customers, the
+reported rps are pages per second. Individual calls are measured with the
+customers cache off and on.
+"""
+import random
+
+from src.api.balances import customers
+
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    def page():
+        return random.sample(range(1, args.customers + 1), args.page_size)
+
+    def individual(client, _):
+        for customer_id in page():
+            response = client.get(f'/v1/customer/{customer_id}')
+        return response
+
+    def lookup(client, _):
+        return client.post('/v1/customers/lookup', json={'ids': page()})
+
+    results = {}
+    maxsize = customers.maxsize
+    with prepared_app() as app:
+        seed_customers(args.customers)
+        for name, request, cache_size in (
+                ('individual', individual, 0),
+                ('individual cached', individual, maxsize),
+                ('lookup', lookup, 0),
+        ):
+            customers.clear()
+            customers.maxsize = cache_size
+            results[name] = run_load(
+                app, request, args.threads, args.duration, args.processes,
+            )
+    customers.maxsize = maxsize
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
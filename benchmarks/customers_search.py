@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Customer name search latency against an ILIKE scan.
+
+    python -m benchmarks.customers_search --customers 10000000
+
+Names are made of three random syllables, a first name and the number of
+the customer, every 50th customer is deleted. ``ilike`` is a page of the
+scan support tools used to run, ``prefix`` and ``prefix next page`` go
+through ix_customers_name_prefix. ``fuzzy`` looks for a surname with a typo
+in it: a trigram search over ix_customers_name_trgm where the database has
+pg_trgm, otherwise the substring scan it falls back to (``trigram`` in the
+report). Queries run one after another, ``plan`` is the scan a sample
+query of the kind starts with.
+"""
+import random
+import re
+import time
+
+from sqlalchemy import text
+
+from src.api.search import search_customers, search_query, trigram_enabled
+from src.extensions import db
+
+from .common import argument_parser, percentile, prepared_app, report
+
+
+SYLLABLES = [
+    'ба', 'ва', 'га', 'да', 'жи', 'за', 'ки', 'ла', 'ма', 'на',
+    'по', 'ра', 'со', 'та', 'фе', 'хо', 'це', 'ше', 'ще', 'ю',
+    'бо', 'ве', 'го', 'ду', 'ле', 'ми', 'но', 'ру', 'се', 'ту',
+]
+FIRST_NAMES = [
+    'Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена', 'Павел',
+    'Наталья', 'Андрей',
+]
+SEED_STATEMENT = text('''
+INSERT INTO customers (name, created_at, deleted)
+SELECT
+    initcap(
+        (CAST(:syllables AS text[]))[1 + n % 30]
+        || (CAST(:syllables AS text[]))[1 + n / 30 % 30]
+        || (CAST(:syllables AS text[]))[1 + n / 900 % 30]
+    ) || 'ов ' || (CAST(:first_names AS text[]))[1 + n / 27000 % 10]
+    || ' ' || n,
+    now(),
+    n % 50 = 0
+FROM generate_series(1, :count) AS n
+''')
+SCAN = re.compile(r'(Seq Scan|Index( Only)? Scan|Bitmap Index Scan) \S+ \S+')
+ILIKE_STATEMENT = text('''
+SELECT id, name FROM customers
+WHERE name ILIKE :pattern AND deleted = false
+ORDER BY id
+LIMIT :limit
+''')
+
+
+def surname() -> str:
+    return ''.join(random.choice(SYLLABLES) for _ in range(3)) + 'ов'
+
+
+def typo(word: str) -> str:
+    position = random.randrange(len(word))
+    return word[:position] + random.choice('абвгдеклмнопрст') + \
+        word[position + 1:]
+
+
+def timed(func, queries: int):
+    latencies = []
+    for _ in range(queries):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    return {
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def plan(query, params=None) -> str:
+    # pylint: disable=no-member
+    if not isinstance(query, str):
+        query = str(query.compile(
+            dialect=db.engine.dialect, compile_kwargs={'literal_binds': True},
+        ))
+    rows = db.session.execute(text('EXPLAIN ' + query), params).fetchall()
+    # The first scan node, from the top.
+    for row in rows:
+        scan = SCAN.search(row[0])
+        if scan:
+            return scan.group(0)
+    return rows[0][0]
+
+
+def main():
+    # pylint: disable=no-member
+    parser = argument_parser(__doc__)
+    parser.add_argument('--customers', type=int, default=10_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    def prefix():
+        return surname()[:3]
+
+    def next_page():
+        q = prefix()
+        _, cursor = search_customers(q, 'prefix', args.limit)
+        if cursor:
+            search_customers(q, 'prefix', args.limit, cursor)
+
+    results = {}
+    with prepared_app():
+        db.session.execute(SEED_STATEMENT, {
+            'syllables': SYLLABLES,
+            'first_names': FIRST_NAMES,
+            'count': args.customers,
+        })
+        db.session.commit()
+        db.session.execute(text('ANALYZE customers'))
+
+        results['ilike'] = timed(
+            lambda: db.session.execute(ILIKE_STATEMENT, {
+                'pattern': prefix() + '%', 'limit': args.limit,
+            }).fetchall(),
+            args.queries,
+        )
+        results['ilike']['plan'] = plan(
+            ILIKE_STATEMENT.text, {'pattern': 'Баб%', 'limit': args.limit},
+        )
+        results['prefix'] = timed(
+            lambda: search_customers(prefix(), 'prefix', args.limit),
+            args.queries,
+        )
+        results['prefix']['plan'] = \
+            plan(search_query('баб', 'prefix', args.limit))
+        results['prefix next page'] = timed(next_page, args.queries)
+        results['fuzzy'] = timed(
+            lambda: search_customers(typo(surname()), 'fuzzy', args.limit),
+            args.queries,
+        )
+        results['fuzzy']['plan'] = \
+            plan(search_query('бабапов', 'fuzzy', args.limit))
+        results['fuzzy']['trigram'] = trigram_enabled()
+        db.session.rollback()
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Replenishments with and without group commit, by batch window.
+
+    python -m benchmarks.group_commit --threads 32 --windows 0 1 2 5 10
+
+``off`` is every request committing its own transaction. Other rows are
+group commit with the window in milliseconds: requests of the threads of
+one process wait for the committer, which commits whatever arrived within
+the window. ``commits_per_s`` counts database commits, ``mean_batch`` the
+replenishments one of them carried. Replenishments go to ``--hot`` random
+customers, so some of a group share a wallet.
+"""
+import random
+import threading
+
+from sqlalchemy import event
+
+from src.extensions import db
+
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+
+
+def main():
+    # pylint: disable=no-member
+    parser = argument_parser(__doc__)
+    parser.add_argument('--customers', type=int, default=10_000)
+    parser.add_argument('--hot', type=int, default=100)
+    parser.add_argument(
+        '--windows', type=float, nargs='+', default=[0, 1, 2, 5, 10],
+    )
+    parser.add_argument('--max-size', type=int, default=500)
+    args = parser.parse_args()
+
+    lock = threading.Lock()
+    commits = [0]
+
+    def count_commit(_):
+        with lock:
+            commits[0] += 1
+
+    def replenishment(client, _):
+        return client.post(
+            f'/v1/customer/{random.randint(1, args.hot)}/replenishment',
+            json={'amount': 1},
+        )
+
+    modes = [('off', None)] + [
+        (f'{window:g}ms', window) for window in args.windows
+    ]
+    results = {}
+    with prepared_app() as app:
+        seed_customers(args.customers)
+        event.listen(db.engine, 'commit', count_commit)
+        for name, window in modes:
+            app.config['REPLENISHMENT_GROUP_COMMIT'] = window is not None
+            app.config['REPLENISHMENT_GROUP_WINDOW'] = (window or 0) / 1000
+            app.config['REPLENISHMENT_GROUP_MAX_SIZE'] = args.max_size
+            app.extensions.pop('group_committer', None)
+            commits[0] = 0
+            result = run_load(
+                app, replenishment, args.threads, args.duration,
+            )
+            elapsed = result['requests'] / (result['rps'] or 1)
+            results[name] = {
+                **result,
+                'commits_per_s': round(commits[0] / elapsed, 1),
+                'mean_batch': round(result['requests'] / (commits[0] or 1), 1),
+            }
+        event.remove(db.engine, 'commit', count_commit)
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Credit throughput to one hot customer depending on its wallet shards.
+
+    python -m benchmarks.hot_wallet --shards 0 4 16 --threads 32
+"""
+from src.api.wallets import lock_wallets, rebalance_wallet
+from src.extensions import db
+
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+
+
+HOT_RECIPIENT_ID = 1
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--senders', type=int, default=1000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 4, 16])
+    args = parser.parse_args()
+
+    def request(client, number):
+        sender_id = 2 + number % args.senders
+        return client.post(
+            f'/v1/customer/{sender_id}/transfer',
+            json={'customer_id': HOT_RECIPIENT_ID, 'amount': 1},
+        )
+
+    results = {}
+    for shards in args.shards:
+        with prepared_app() as app:
+            # pylint: disable=no-member
+            seed_customers(args.senders + 1, amount=10 ** 9)
+            wallet = lock_wallets((HOT_RECIPIENT_ID,))[HOT_RECIPIENT_ID]
+            rebalance_wallet(wallet, shards)
+            db.session.commit()
+            results[f'shards={shards}'] = run_load(
+                app, request, args.threads, args.duration, args.processes,
+            )
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Replenishments retried with a small set of Idempotency-Key values.
+
+    python -m benchmarks.idempotency --keys 100 --threads 32
+"""
+from src.api.idempotency import replays
+from src.api.models import OperationModel
+
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--keys', type=int, default=100)
+    parser.add_argument('--customers', type=int, default=10)
+    args = parser.parse_args()
+
+    def request(client, number):
+        key = number % args.keys
+        customer_id = 1 + key % args.customers
+        return client.post(
+            f'/v1/customer/{customer_id}/replenishment',
+            json={'amount': 1},
+            headers={'Idempotency-Key': f'benchmark-{key}'},
+        )
+
+    results = {}
+    maxsize = replays.maxsize
+    for name, cache_size in (('postgres', 0), ('cache', maxsize)):
+        replays.clear()
+        replays.maxsize = cache_size
+        with prepared_app() as app:
+            seed_customers(args.customers)
+            results[name] = run_load(
+                app, request, args.threads, args.duration, args.processes,
+            )
+            # Every key must have been executed exactly once.
+            results[name]['operations'] = OperationModel.query.count()
+    replays.maxsize = maxsize
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Ledger check throughput and memory on a large consistent history.
+
+    python -m benchmarks.ledger_check --rows 10000000 --customers 100000 \\
+        --workers 4
+
+Runs a full check with one and with ``--workers`` processes, then an
+incremental one over ``--increment`` new operations. Peak RSS is taken
+from the process and its workers.
+"""
+import resource
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from src.api.reconciliation import check_ledger
+from src.extensions import db
+
+from .common import argument_parser, prepared_app, report, seed_customers
+
+
+SEED_CHUNK = 1_000_000
+
+
+def seed_chains(start: int, rows: int, customers: int, since: datetime):
+    # pylint: disable=no-member
+    # Operation n is the (n // customers)-th credit of 1 to wallet
+    # 1 + n % customers, wallets end up with the number of their operations.
+    for offset in range(start, start + rows, SEED_CHUNK):
+        db.session.execute(
+            text(
+                'INSERT INTO operations (transaction, wallet_id, amount_was, '
+                'amount_become, operation_amount, processed_at) '
+                'SELECT md5(n::text)::uuid, 1 + n % :customers, '
+                'n / :customers, n / :customers + 1, 1, '
+                "CAST(:since AS timestamp) + n * interval '1 millisecond' "
+                'FROM generate_series(:start, :stop) AS n'
+            ),
+            {
+                'customers': customers,
+                'since': since,
+                'start': offset,
+                'stop': min(start + rows, offset + SEED_CHUNK) - 1,
+            },
+        )
+        db.session.commit()
+    total = start + rows
+    db.session.execute(
+        text(
+            'UPDATE wallets SET amount = :total / :customers '
+            '+ CASE WHEN id - 1 < :total % :customers THEN 1 ELSE 0 END'
+        ),
+        {'total': total, 'customers': customers},
+    )
+    db.session.execute(text('ANALYZE operations'))
+    db.session.commit()
+
+
+def max_rss_mb() -> float:
+    return round(max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    ) / 1024, 1)
+
+
+def timed_check(workers: int) -> dict:
+    started = time.perf_counter()
+    result = check_ledger(workers, lag=0)
+    elapsed = time.perf_counter() - started
+    return {
+        'operations': result.operations,
+        'problems': len(result.problems),
+        'seconds': round(elapsed, 2),
+        'operations_per_s': round(result.operations / elapsed),
+        'max_rss_mb': max_rss_mb(),
+    }
+
+
+def reset():
+    # pylint: disable=no-member
+    db.session.execute(text('TRUNCATE ledger_checks, ledger_chains'))
+    db.session.commit()
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--increment', type=int, default=100_000)
+    args = parser.parse_args()
+
+    since = datetime.utcnow() - timedelta(days=30)
+    results = {'rss_before_mb': max_rss_mb()}
+    with prepared_app():
+        seed_customers(args.customers)
+        seed_chains(0, args.rows, args.customers, since)
+        results['full'] = timed_check(1)
+        reset()
+        results[f'full_{args.workers}_workers'] = timed_check(args.workers)
+        seed_chains(args.rows, args.increment, args.customers, since)
+        results['incremental'] = timed_check(args.workers)
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Replay rate of the ledger rules on the in-memory backend.
+
+    python -m benchmarks.ledger_replay --customers 1000000 --operations 1000000
+
+Replays uniform transfers with 10% of replenishments between
+``--customers`` wallets, the rules are the ones the API runs against
+Postgres. Transactions are made up front, the way a replay takes them from
+the recorded operations. No database is needed. ``buffer_bytes`` is the
+size of the recorded operations, ``rss_mb`` the peak memory of the process.
+"""
+import argparse
+import random
+import resource
+import time
+from uuid import UUID
+
+from src import ledger
+from src.exceptions import BillingError
+from src.ledger import MemoryLedger
+
+from .common import report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--customers', type=int, default=1_000_000)
+    parser.add_argument('--operations', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    memory = MemoryLedger.load(
+        (n, n, 1000) for n in range(1, args.customers + 1)
+    )
+    actions = [
+        (
+            random.random() < 0.1,
+            random.randint(1, args.customers),
+            random.randint(1, args.customers),
+            random.randint(1, 100),
+            UUID(int=n),
+        )
+        for n in range(args.operations)
+    ]
+
+    failed = 0
+    started = time.perf_counter()
+    for replenishment, sender_id, recipient_id, amount, transaction in \
+            actions:
+        try:
+            if replenishment:
+                ledger.replenish(memory, sender_id, amount, transaction)
+            else:
+                ledger.transfer(
+                    memory, sender_id, recipient_id, amount, transaction,
+                )
+        except BillingError:
+            failed += 1
+    elapsed = time.perf_counter() - started
+
+    report({
+        'operations': args.operations,
+        'failed': failed,
+        'recorded': len(memory.wallet_ids),
+        'buffer_bytes': memory.buffer_size,
+        'rss_mb': round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        ),
+        'seconds': round(elapsed, 2),
+        'operations_per_second': round(args.operations / elapsed),
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""End-to-end load scenarios against the /v1 API under gunicorn.
+
+    python -m benchmarks.load --customers 100000 --workers 8 \\
+        --connections 64 --duration 30 --output report.json
+    python -m benchmarks.load --env TRANSFER_ENGINE=cte \\
+        --baseline report.json
+
+Scenarios run one after another against the same seeded database:
+
+- ``uniform_transfers`` - transfers between random customers;
+- ``hot_recipient`` - random customers transfer to customer 1;
+- ``replenishment_storm`` - replenishments of ``--hot`` customers;
+- ``read_heavy`` - ``GET /v1/customer/<id>`` with 5% of replenishments.
+
+Every scenario is warmed up for ``--warmup`` seconds first. Deadlocks,
+transactions and statements by kind are the deltas of the workers' own
+/metrics over the measured part. ``--env`` settings go to the workers and
+into the report, ``--baseline`` adds the change against an earlier one.
+"""
+import json
+import platform
+import random
+import subprocess
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from .common import argument_parser, prepared_app, seed_customers
+from .server import gunicorn, http_load
+
+
+SCENARIOS = (
+    'uniform_transfers', 'hot_recipient', 'replenishment_storm', 'read_heavy',
+)
+READ_HEAVY_WRITE_RATIO = 0.05
+
+
+def scrape(port: int) -> Dict[str, Dict[str, float]]:
+    # Counters summed by the label the report is interested in.
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as page:
+        text = page.read().decode()
+    totals: Dict[str, Dict[str, float]] = defaultdict(
+        lambda: defaultdict(float),
+    )
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name == 'billing_db_statement_duration_seconds_count':
+                totals['statements'][sample.labels['statement']] += \
+                    sample.value
+            elif sample.name == 'billing_db_transactions_total':
+                totals['transactions'][sample.labels['outcome']] += \
+                    sample.value
+            elif sample.name == 'billing_errors_total':
+                totals['errors'][sample.labels['error']] += sample.value
+    return totals
+
+
+def delta(after: Dict[str, float], before: Dict[str, float]) -> Dict:
+    return {
+        key: int(value - before.get(key, 0))
+        for key, value in sorted(after.items())
+        if value - before.get(key, 0)
+    }
+
+
+def summarize(result: Dict, before: Dict, after: Dict) -> Dict:
+    requests = result['requests'] or 1
+    failed = sum(
+        count for code, count in result['codes'].items()
+        if not 200 <= code < 300
+    )
+    statements = delta(after['statements'], before['statements'])
+    errors = delta(after['errors'], before['errors'])
+    deadlocks = errors.get('DeadlockDetected', 0)
+    return {
+        **result,
+        'codes': {str(code): count for code, count in result['codes'].items()},
+        'error_rate': round(failed / requests, 6),
+        'deadlocks': deadlocks,
+        'deadlock_rate': round(deadlocks / requests, 6),
+        'errors': errors,
+        'transactions':
+            delta(after['transactions'], before['transactions']),
+        'statements': statements,
+        'statements_per_request':
+            round(sum(statements.values()) / requests, 2),
+    }
+
+
+def compare(scenario: Dict, baseline: Optional[Dict]) -> Optional[Dict]:
+    if not baseline:
+        return None
+
+    def change(key):
+        if not baseline.get(key):
+            return None
+        return round((scenario[key] / baseline[key] - 1) * 100, 1)
+
+    return {
+        'rps_change_pct': change('rps'),
+        'p50_change_pct': change('p50_ms'),
+        'p99_change_pct': change('p99_ms'),
+    }
+
+
+def git_commit() -> Optional[str]:
+    result = subprocess.run(
+        ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+        check=False,
+    )
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--hot', type=int, default=10)
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument(
+        '--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS),
+    )
+    parser.add_argument(
+        '--env', action='append', default=[], metavar='NAME=VALUE',
+    )
+    parser.add_argument('--output', default='-')
+    parser.add_argument('--baseline', default=None)
+    args = parser.parse_args()
+
+    env = dict(item.split('=', 1) for item in args.env)
+    env['METRICS_ENABLED'] = 'true'
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as source:
+            baseline = json.load(source)['scenarios']
+
+    def customer():
+        return random.randint(1, args.customers)
+
+    def uniform_transfers(_):
+        sender_id, recipient_id = \
+            random.sample(range(1, args.customers + 1), 2)
+        return (
+            'POST',
+            f'/v1/customer/{sender_id}/transfer',
+            {'customer_id': recipient_id, 'amount': 1},
+        )
+
+    def hot_recipient(_):
+        return (
+            'POST',
+            f'/v1/customer/{random.randint(2, args.customers)}/transfer',
+            {'customer_id': 1, 'amount': 1},
+        )
+
+    def replenishment_storm(_):
+        return (
+            'POST',
+            f'/v1/customer/{random.randint(1, args.hot)}/replenishment',
+            {'amount': 1},
+        )
+
+    def read_heavy(_):
+        if random.random() < READ_HEAVY_WRITE_RATIO:
+            return (
+                'POST',
+                f'/v1/customer/{customer()}/replenishment',
+                {'amount': 1},
+            )
+        return 'GET', f'/v1/customer/{customer()}', None
+
+    requests = {
+        'uniform_transfers': uniform_transfers,
+        'hot_recipient': hot_recipient,
+        'replenishment_storm': replenishment_storm,
+        'read_heavy': read_heavy,
+    }
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'started_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'customers': args.customers,
+            'workers': args.workers,
+            'connections': args.connections,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'env': env,
+        },
+        'scenarios': {},
+    }
+    with prepared_app():
+        seed_customers(args.customers, amount=10 ** 9)
+        with gunicorn(
+                'src:create_app()', args.port, args.workers, env=env,
+        ):
+            for name in args.scenarios:
+                request = requests[name]
+                if args.warmup:
+                    http_load(
+                        args.port, request, args.connections, args.warmup,
+                    )
+                before = scrape(args.port)
+                result = http_load(
+                    args.port, request, args.connections, args.duration,
+                )
+                scenario = summarize(result, before, scrape(args.port))
+                scenario['baseline'] = compare(scenario, baseline.get(name))
+                report['scenarios'][name] = scenario
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as target:
+            target.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Transfer latency with request logging off, written by the request thread
+and queued for the batching writer.
+
+    python -m benchmarks.logging_sink --threads 16 --duration 20 \\
+        --log-file /tmp/billing-benchmark.log
+
+Every request logs one access line (LOG_REQUESTS), the console handler is
+off in all modes.
+"""
+import os
+import random
+
+from config import CONFIG
+
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+
+
+MODES = {
+    'off': {'LOG_FILE_HANDLER': False, 'LOG_ASYNC': False},
+    'sync': {'LOG_FILE_HANDLER': True, 'LOG_ASYNC': False},
+    'batched': {'LOG_FILE_HANDLER': True, 'LOG_ASYNC': True},
+}
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--log-file', default='/tmp/billing-benchmark.log')
+    args = parser.parse_args()
+
+    def request(client, _):
+        sender_id, recipient_id = \
+            random.sample(range(1, args.customers + 1), 2)
+        return client.post(
+            f'/v1/customer/{sender_id}/transfer',
+            json={'customer_id': recipient_id, 'amount': 1},
+        )
+
+    CONFIG.LOG_FILE = args.log_file
+    CONFIG.LOG_CONSOLE_HANDLER = False
+    CONFIG.LOG_REQUESTS = True
+    results = {}
+    for mode, config in MODES.items():
+        for name, value in config.items():
+            setattr(CONFIG, name, value)
+        if os.path.exists(args.log_file):
+            os.remove(args.log_file)
+        with prepared_app() as app:
+            seed_customers(args.customers, amount=10 ** 9)
+            results[mode] = run_load(
+                app, request, args.threads, args.duration, args.processes,
+            )
+        from src import log_sink  # pylint: disable=import-outside-toplevel
+        if log_sink:
+            log_sink.stop()
+            results[mode]['log_records_dropped'] = log_sink.dropped
+    for mode in ('sync', 'batched'):
+        results[mode]['p99_overhead_percent'] = round(
+            100 * (results[mode]['p99_ms'] / results['off']['p99_ms'] - 1),
+            2,
+        )
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
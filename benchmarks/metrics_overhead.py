@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Transfer throughput with and without request and statement metrics.
+
+    python -m benchmarks.metrics_overhead --threads 16 --duration 20
+
+Set PROMETHEUS_MULTIPROC_DIR to an empty directory to measure the
+multiprocess mode used under gunicorn.
+"""
+import random
+
+from config import CONFIG
+
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--customers', type=int, default=1000)
+    args = parser.parse_args()
+
+    def request(client, _):
+        sender_id, recipient_id = \
+            random.sample(range(1, args.customers + 1), 2)
+        return client.post(
+            f'/v1/customer/{sender_id}/transfer',
+            json={'customer_id': recipient_id, 'amount': 1},
+        )
+
+    results = {}
+    for enabled in (False, True):
+        CONFIG.METRICS_ENABLED = enabled
+        with prepared_app() as app:
+            seed_customers(args.customers, amount=10 ** 9)
+            results[f'metrics={enabled}'] = run_load(
+                app, request, args.threads, args.duration, args.processes,
+            )
+    plain, metered = results['metrics=False'], results['metrics=True']
+    results['overhead'] = {
+        'rps_percent':
+            round(100 * (1 - metered['rps'] / plain['rps']), 2),
+        'p50_percent':
+            round(100 * (metered['p50_ms'] / plain['p50_ms'] - 1), 2),
+    }
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
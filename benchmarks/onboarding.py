@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Bulk customer onboarding against looping ``POST /v1/customer``.
+
+    python -m benchmarks.onboarding --rows 200000 --threads 16
+
+The loop runs for ``--duration`` seconds, the bulk upload sends ``--rows``
+rows in one request for every format and chunk size. Both report created
+rows per second.
+"""
+import json
+import time
+
+from .common import argument_parser, prepared_app, report, run_load
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument(
+        '--chunk-sizes', type=int, nargs='+', default=[1000, 5000, 20000],
+    )
+    args = parser.parse_args()
+
+    def create(client, number):
+        return client.post('/v1/customer', json={'name': f'loop-{number}'})
+
+    bodies = {
+        'ndjson': ''.join(
+            json.dumps({'name': f'bulk-{n}'}) + '\n' for n in range(args.rows)
+        ).encode(),
+        'csv': ('name\n' + ''.join(
+            f'bulk-{n}\n' for n in range(args.rows)
+        )).encode(),
+    }
+
+    results = {}
+    with prepared_app() as app:
+        loop = run_load(
+            app, create, args.threads, args.duration, args.processes,
+        )
+        loop['rows_per_s'] = loop['rps']
+        results['loop'] = loop
+
+        for _format, body in bodies.items():
+            for chunk_size in args.chunk_sizes:
+                app.config['ONBOARDING_CHUNK_SIZE'] = chunk_size
+                with app.test_client() as client:
+                    started = time.perf_counter()
+                    response = client.post(
+                        '/v1/customers/bulk',
+                        query_string={'format': _format},
+                        data=body,
+                        buffered=False,
+                    )
+                    first = None
+                    created = 0
+                    for chunk in response.response:
+                        if first is None:
+                            first = time.perf_counter() - started
+                        created += chunk.count(b'"id"')
+                    elapsed = time.perf_counter() - started
+                    response.close()
+                results[f'bulk {_format} chunk={chunk_size}'] = {
+                    'rows': created,
+                    'rows_per_s': round(created / elapsed, 1),
+                    'first_mapping_ms': round((first or 0) * 1000, 2),
+                    'total_s': round(elapsed, 2),
+                }
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
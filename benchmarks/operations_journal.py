@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Transfers with inline operation inserts against the operations journal.
+
+    python -m benchmarks.operations_journal --customers 20 --threads 32
+
+Few customers keep the wallet locks contended. Lock hold time is measured
+for the ORM engine, from the wallets being locked till the commit. In the
+journal mode a materializer thread drains the journal during the load, the
+backlog left is drained afterwards.
+"""
+import random
+import threading
+import time
+from unittest import mock
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import CONFIG
+from src.api import views
+from src.api.journal import materialize_journal, run_materializer
+from src.api.models import OperationJournalModel
+
+from .common import (
+    argument_parser, percentile, prepared_app, report, run_load,
+    seed_customers,
+)
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--customers', type=int, default=20)
+    args = parser.parse_args()
+
+    def request(client, _):
+        sender_id, recipient_id = \
+            random.sample(range(1, args.customers + 1), 2)
+        return client.post(
+            f'/v1/customer/{sender_id}/transfer',
+            json={'customer_id': recipient_id, 'amount': 1},
+        )
+
+    locked = threading.local()
+    holds = []
+    lock_wallets = views.lock_wallets
+
+    def timed_lock_wallets(*lock_args, **lock_kwargs):
+        wallets = lock_wallets(*lock_args, **lock_kwargs)
+        locked.at = time.perf_counter()
+        return wallets
+
+    def released(_):
+        started = getattr(locked, 'at', None)
+        if started is not None:
+            holds.append(time.perf_counter() - started)
+            locked.at = None
+
+    event.listen(Session, 'after_commit', released)
+    event.listen(Session, 'after_rollback', released)
+    results = {}
+    for engine in ('orm', 'cte'):
+        for journal in (False, True):
+            CONFIG.TRANSFER_ENGINE = engine
+            CONFIG.OPERATIONS_JOURNAL = journal
+            holds.clear()
+            stop = threading.Event()
+            patched = mock.patch.object(
+                views, 'lock_wallets', timed_lock_wallets,
+            )
+            with prepared_app() as app, patched:
+                seed_customers(args.customers, amount=10 ** 9)
+
+                def materializer():
+                    with app.app_context():
+                        run_materializer(
+                            CONFIG.OPERATIONS_JOURNAL_BATCH_SIZE,
+                            CONFIG.OPERATIONS_JOURNAL_INTERVAL,
+                            stop,
+                        )
+
+                thread = threading.Thread(target=materializer)
+                if journal:
+                    thread.start()
+                name = f'{engine} journal={journal}'
+                results[name] = run_load(
+                    app, request, args.threads, args.duration, args.processes,
+                )
+                stop.set()
+                if journal:
+                    thread.join()
+                    results[name]['backlog'] = \
+                        OperationJournalModel.query.count()
+                    started = time.perf_counter()
+                    while materialize_journal(
+                            CONFIG.OPERATIONS_JOURNAL_BATCH_SIZE,
+                    ):
+                        pass
+                    results[name]['backlog_drain_s'] = \
+                        round(time.perf_counter() - started, 2)
+                if engine == 'orm':
+                    results[name]['lock_hold_p50_ms'] = \
+                        round(percentile(holds, 0.50) * 1000, 2)
+                    results[name]['lock_hold_p99_ms'] = \
+                        round(percentile(holds, 0.99) * 1000, 2)
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
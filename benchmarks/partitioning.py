@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Plain against monthly partitioned operations on a large history.
+
+    python -m benchmarks.partitioning --rows 50000000 --months 24
+"""
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from src.api.partitions import (
+    archive_partitions, create_partitions, month_start,
+)
+from src.extensions import db
+
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+
+
+PLAIN_REVISION = '8a41d3c6b2f0'
+SEED_CHUNK = 1_000_000
+
+
+def seed_operations(rows: int, customers: int, since: datetime):
+    # pylint: disable=no-member
+    # Operations are spread evenly from ``since`` till now over all wallets.
+    for offset in range(0, rows, SEED_CHUNK):
+        db.session.execute(
+            text(
+                'INSERT INTO operations (transaction, wallet_id, amount_was, '
+                'amount_become, operation_amount, processed_at) '
+                'SELECT md5(n::text)::uuid, 1 + n % :customers, 0, 1, 1, '
+                'CAST(:since AS timestamp) + (n * '
+                "(now() AT TIME ZONE 'utc' - CAST(:since AS timestamp)) "
+                '/ :rows) '
+                'FROM generate_series(:start, :stop) AS n'
+            ),
+            {
+                'customers': customers,
+                'since': since,
+                'rows': rows,
+                'start': offset,
+                'stop': min(rows, offset + SEED_CHUNK) - 1,
+            },
+        )
+        db.session.commit()
+    db.session.execute(text('ANALYZE operations'))
+    db.session.commit()
+
+
+def partition_history(months: int):
+    # pylint: disable=no-member
+    # The migration keeps everything before the next month in the legacy
+    # partition, an empty database is split into monthly ones instead.
+    db.session.execute(
+        text('ALTER TABLE operations DETACH PARTITION operations_legacy'),
+    )
+    db.session.execute(text('DROP TABLE operations_legacy'))
+    db.session.commit()
+    create_partitions(months + 3, now=month_start(datetime.utcnow(), -months))
+
+
+def retire(before: datetime, partitioned: bool) -> float:
+    # pylint: disable=no-member
+    started = time.perf_counter()
+    if partitioned:
+        with tempfile.TemporaryDirectory() as directory:
+            archive_partitions(before, directory)
+    else:
+        db.session.execute(
+            text('DELETE FROM operations WHERE processed_at < :before'),
+            {'before': before},
+        )
+        db.session.commit()
+    return round(time.perf_counter() - started, 2)
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--rows', type=int, default=50_000_000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--customers', type=int, default=100_000)
+    args = parser.parse_args()
+
+    def replenishment(client, number):
+        customer_id = 1 + number % args.customers
+        return client.post(
+            f'/v1/customer/{customer_id}/replenishment', json={'amount': 1},
+        )
+
+    def history(client, number):
+        customer_id = 1 + random.randrange(args.customers)
+        return client.get(
+            f'/v1/customer/{customer_id}/operations',
+            query_string={'limit': 50},
+        )
+
+    since = month_start(datetime.utcnow(), -args.months)
+    results = {}
+    for name, revision in (('plain', PLAIN_REVISION), ('partitioned', 'head')):
+        with prepared_app(revision) as app:
+            if revision == 'head':
+                partition_history(args.months)
+            seed_customers(args.customers)
+            started = time.perf_counter()
+            seed_operations(args.rows, args.customers, since)
+            results[name] = {
+                'seed_s': round(time.perf_counter() - started, 2),
+                'replenishment': run_load(
+                    app, replenishment, args.threads, args.duration,
+                    args.processes,
+                ),
+                'history': run_load(
+                    app, history, args.threads, args.duration,
+                    args.processes,
+                ),
+                'retire_oldest_year_s': retire(
+                    month_start(since, 12), revision == 'head',
+                ),
+            }
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Response encode time and size by JSON provider and compression policy.
+
+    python -m benchmarks.responses --iterations 20000
+
+Encodes a transfer result and a 50 operations history page the way views
+return them and runs Flask-Compress over the result. ``always`` compresses
+every JSON response, ``policy`` only those of COMPRESS_MIN_SIZE bytes and
+more. No database is needed.
+"""
+import argparse
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from src import create_app
+from src.extensions import compress
+from src.utils.json_provider import JSON_PROVIDERS
+
+from .common import report
+
+
+def transfer_response() -> dict:
+    return {
+        'transaction': uuid4(),
+        'sender': {
+            'customer_id': 1,
+            'amount_was': 1000,
+            'amount_become': 990,
+            'operation_amount': -10,
+        },
+        'recipient': {
+            'customer_id': 2,
+            'amount_was': 0,
+            'amount_become': 10,
+            'operation_amount': 10,
+        },
+    }
+
+
+def history_response(size: int = 50) -> dict:
+    return {
+        'operations': [
+            {
+                'id': 1000 + n,
+                'transaction': uuid4(),
+                'amount_was': 1000 - n,
+                'amount_become': 999 - n,
+                'operation_amount': -1,
+                'processed_at': datetime.utcnow().isoformat(),
+                'shard': 0,
+            }
+            for n in range(size)
+        ],
+        'next_cursor': 'WyIyMDIwLTA3LTAxVDAwOjAwOjAwIiwxMDAwXQ',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    app = create_app()
+    policies = {
+        'off': {'COMPRESS_MIMETYPES': []},
+        'always': {'COMPRESS_MIN_SIZE': 0},
+        'policy': {},
+    }
+    payloads = {
+        'transfer': transfer_response(),
+        'history': history_response(),
+    }
+    defaults = {
+        key: app.config[key]
+        for key in ('COMPRESS_MIMETYPES', 'COMPRESS_MIN_SIZE')
+    }
+
+    results = {}
+    for provider, provider_class in JSON_PROVIDERS.items():
+        app.json_provider = provider_class(app)
+        for policy, config in policies.items():
+            app.config.update(defaults, **config)
+            for name, payload in payloads.items():
+                with app.test_request_context(
+                        headers={'Accept-Encoding': 'gzip'},
+                ):
+                    started = time.perf_counter()
+                    for _ in range(args.iterations):
+                        response = compress.after_request(
+                            app.make_response(payload),
+                        )
+                    elapsed = time.perf_counter() - started
+                results[f'{name} {provider} {policy}'] = {
+                    'encode_us': round(elapsed / args.iterations * 1e6, 2),
+                    'bytes': response.content_length,
+                    'compressed':
+                        response.headers.get('Content-Encoding') == 'gzip',
+                }
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .common import percentile
+
+
+# (method, path, json body or None)
+HttpRequest = Tuple[str, str, Optional[dict]]
+
+
+@contextmanager
+def gunicorn(
+        application: str,
+        port: int,
+        workers: int,
+        worker_class: str = 'sync',
+        *options: str,
+        env: Optional[Dict[str, str]] = None,
+):
+    # Runs the application with the production config, only bind, workers
+    # and worker class are overridden, ``env`` is added to the environment.
+    process = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', '-c', 'python:gunicorn_conf',
+        '-b', f'127.0.0.1:{port}', '-w', str(workers), '-k', worker_class,
+        *options, application,
+    ], env={**os.environ, **(env or {})})
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(
+                    f'gunicorn exited with {process.returncode}',
+                )
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def _http_load(
+        port: int,
+        request: Callable[[int], HttpRequest],
+        connections: int,
+        duration: float,
+):
+    deadline = time.monotonic() + duration
+    latencies: List[float] = []
+    codes: Dict[int, int] = {}
+
+    async def connection(number: int):
+        reader = writer = None
+        step = 0
+        while time.monotonic() < deadline:
+            if writer is None:
+                reader, writer = \
+                    await asyncio.open_connection('127.0.0.1', port)
+            method, path, body = request(number * 1_000_000 + step)
+            payload = b'' if body is None else json.dumps(body).encode()
+            head = (
+                f'{method} {path} HTTP/1.1\r\n'
+                f'Host: 127.0.0.1:{port}\r\n'
+                'Content-Type: application/json\r\n'
+                f'Content-Length: {len(payload)}\r\n\r\n'
+            )
+            started = time.perf_counter()
+            writer.write(head.encode() + payload)
+            await writer.drain()
+            status_line = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length:
+                await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            code = int(status_line.split()[1])
+            codes[code] = codes.get(code, 0) + 1
+            # Sync gunicorn workers close the connection after every response.
+            if headers.get('connection', '').lower() == 'close':
+                writer.close()
+                writer = None
+            step += 1
+        if writer is not None:
+            writer.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*map(connection, range(connections)))
+    return latencies, codes, time.monotonic() - started
+
+
+def http_load(
+        port: int,
+        request: Callable[[int], HttpRequest],
+        connections: int,
+        duration: float,
+) -> Dict[str, float]:
+    # Every connection sends ``request(n)`` one after another until the
+    # deadline, the same report as ``run_load``.
+    latencies, codes, elapsed = asyncio.run(
+        _http_load(port, request, connections, duration),
+    )
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'p999_ms': round(percentile(latencies, 0.999) * 1000, 2),
+        'max_ms': round(max(latencies, default=0) * 1000, 2),
+        'codes': codes,
+    }
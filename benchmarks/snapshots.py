@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Balance and liabilities at a point in time with and without snapshots.
+
+    python -m benchmarks.snapshots --rows 10000000 --customers 100000 \\
+        --days 90
+
+History is seeded over ``--days`` days and snapshotted daily. Without
+snapshots the same queries sum the whole history before the point.
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from src.api.snapshots import liabilities_at, take_snapshot
+
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+from .partitioning import seed_operations
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+
+    since = datetime.utcnow() - timedelta(days=args.days)
+
+    def random_point():
+        return since + timedelta(seconds=random.uniform(
+            0, args.days * 86400,
+        ))
+
+    def balance(client, _):
+        customer_id = 1 + random.randrange(args.customers)
+        return client.get(
+            f'/v1/customer/{customer_id}/balance',
+            query_string={'at': random_point().isoformat()},
+        )
+
+    def liabilities(samples: int = 5) -> float:
+        started = time.perf_counter()
+        for _ in range(samples):
+            liabilities_at(random_point())
+        return round((time.perf_counter() - started) / samples * 1000, 2)
+
+    results = {}
+    with prepared_app() as app:
+        seed_customers(args.customers)
+        seed_operations(args.rows, args.customers, since)
+        results['history'] = {
+            'balance': run_load(
+                app, balance, args.threads, args.duration, args.processes,
+            ),
+            'liabilities_ms': liabilities(),
+        }
+
+        runs = []
+        for day in range(1, args.days + 1):
+            started = time.perf_counter()
+            take_snapshot(now=since + timedelta(days=day), lag=0)
+            runs.append(time.perf_counter() - started)
+        results['snapshots'] = {
+            'daily_run_ms': round(sum(runs) / len(runs) * 1000, 2),
+            'balance': run_load(
+                app, balance, args.threads, args.duration, args.processes,
+            ),
+            'liabilities_ms': liabilities(),
+        }
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
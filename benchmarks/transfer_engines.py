@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Transfers/sec of the ORM and the single statement (CTE) transfer engines.
+
+Every request moves money from one of ``--senders`` customers to the same
+hot recipient, so all transactions contend on one wallet row.
+
+    python -m benchmarks.transfer_engines --threads 16 --duration 10
+"""
+from .common import (
+    argument_parser, prepared_app, report, run_load, seed_customers,
+)
+
+
+HOT_RECIPIENT_ID = 1
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--senders', type=int, default=1000)
+    args = parser.parse_args()
+
+    def request(client, number):
+        sender_id = 2 + number % args.senders
+        return client.post(
+            f'/v1/customer/{sender_id}/transfer',
+            json={'customer_id': HOT_RECIPIENT_ID, 'amount': 1},
+        )
+
+    results = {}
+    for engine in ('orm', 'cte'):
+        with prepared_app(TRANSFER_ENGINE=engine) as app:
+            seed_customers(args.senders + 1, amount=10 ** 9)
+            results[engine] = run_load(
+                app, request, args.threads, args.duration, args.processes,
+            )
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
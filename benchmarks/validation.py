@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Request validation time of compiled schemas against pydantic models.
+
+    python -m benchmarks.validation --iterations 20000
+
+``pydantic`` is the model construction and ``.dict()`` every payload used
+to go through, ``compiled`` the fast path of ``validate``. ``decorator``
+runs the whole ``validate`` wrapper in a request context, the body is
+parsed once and cached by Flask. Batches are timed per payload. No
+database is needed.
+"""
+import argparse
+import time
+
+from flask import request
+
+from src import create_app
+from src.api.schemas import (
+    CustomerSchema, ReplenishmentSchema, TransferBatchSchema, TransferSchema,
+    compile_schema, validate,
+)
+
+from .common import report
+
+
+def batch(size: int) -> dict:
+    return {
+        'transfers': [
+            {'sender_id': n, 'customer_id': n + 1, 'amount': 1}
+            for n in range(size)
+        ],
+    }
+
+
+def timed(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return round((time.perf_counter() - started) / iterations * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    cases = {
+        'transfer': (TransferSchema, {'customer_id': 2, 'amount': 10}, 1),
+        'replenishment': (ReplenishmentSchema, {'amount': 100}, 1),
+        'customer': (CustomerSchema, {'name': 'Иванов'}, 1),
+        'transfer_batch_100': (TransferBatchSchema, batch(100), 100),
+        'transfer_batch_10000': (TransferBatchSchema, batch(10000), 10000),
+    }
+    app = create_app()
+
+    results = {}
+    for name, (schema, payload, size) in cases.items():
+        iterations = max(1, args.iterations // size)
+        fast_validate = compile_schema(schema)
+        view = validate(schema)(lambda: request.valid_json)
+        with app.test_request_context(json=payload):
+            request.get_json()
+            results[name] = {
+                'pydantic_us': timed(
+                    lambda: schema(**payload).dict(), iterations,
+                ),
+                'compiled_us':
+                    timed(lambda: fast_validate(payload), iterations),
+                'decorator_us': timed(view, iterations),
+            }
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
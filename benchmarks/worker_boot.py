@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Worker boot time and memory of gunicorn with and without preload.
+
+    python -m benchmarks.worker_boot --workers 8 --duration 5
+
+``lazy`` builds the app in every worker, ``preload`` once in the master
+(GUNICORN_PRELOAD=1). ``ready_s`` is the time from the start of gunicorn
+until all workers are ready, ``boot_ms`` the time from fork to ready of a
+worker. RSS counts pages shared with the master in full, PSS splits them
+between the processes sharing them, so the PSS sum is the real footprint.
+Memory is taken after boot and again after ``--duration`` seconds of
+customer reads.
+"""
+import os
+import random
+import tempfile
+import time
+from typing import Dict, Iterable, List
+
+from .common import argument_parser, prepared_app, report, seed_customers
+from .server import gunicorn, http_load
+
+
+def ready_workers(marks: str) -> List[int]:
+    return [int(name) for name in os.listdir(marks) if name.isdigit()]
+
+
+def memory(pid: int) -> Dict[str, int]:
+    # kB, as the kernel reports them.
+    usage = {}
+    with open(f'/proc/{pid}/smaps_rollup') as rollup:
+        for line in rollup:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                usage[key.lower()] = int(value.split()[0])
+    return usage
+
+
+def memory_summary(pids: Iterable[int]) -> Dict[str, float]:
+    usages = [memory(pid) for pid in pids]
+    return {
+        'worker_rss_mb': round(
+            sum(usage['rss'] for usage in usages) / len(usages) / 1024, 1,
+        ),
+        'worker_pss_mb': round(
+            sum(usage['pss'] for usage in usages) / len(usages) / 1024, 1,
+        ),
+        'workers_pss_total_mb':
+            round(sum(usage['pss'] for usage in usages) / 1024, 1),
+    }
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+
+    def read(_):
+        customer_id = random.randint(1, args.customers)
+        return 'GET', f'/v1/customer/{customer_id}', None
+
+    results = {}
+    with prepared_app():
+        seed_customers(args.customers, amount=100)
+        for mode in ('lazy', 'preload'):
+            with tempfile.TemporaryDirectory() as marks:
+                env = {
+                    'BOOT_MARKS_DIR': marks,
+                    'GUNICORN_PRELOAD': '1' if mode == 'preload' else '0',
+                }
+                started = time.perf_counter()
+                with gunicorn(
+                        'src:create_app()', args.port, args.workers, 'sync',
+                        '-c', 'python:benchmarks.boot_conf', env=env,
+                ) as process:
+                    while len(ready_workers(marks)) < args.workers:
+                        time.sleep(0.01)
+                    ready = time.perf_counter() - started
+                    pids = ready_workers(marks)
+                    boots = []
+                    for pid in pids:
+                        with open(os.path.join(marks, str(pid))) as mark:
+                            boots.append(float(mark.read()) * 1000)
+                    result = {
+                        'ready_s': round(ready, 2),
+                        'boot_ms_mean': round(sum(boots) / len(boots), 1),
+                        'boot_ms_max': round(max(boots), 1),
+                        'master_rss_mb':
+                            round(memory(process.pid)['rss'] / 1024, 1),
+                        'booted': memory_summary(pids),
+                    }
+                    load = http_load(
+                        args.port, read, args.connections, args.duration,
+                    )
+                    result['rps'] = load['rps']
+                    result['loaded'] = memory_summary(pids)
+            results[mode] = result
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from typing import List, Literal
+
 from pydantic import BaseSettings
 
 
@@ -6,16 +8,83 @@ class Config(BaseSettings):
     JSON_AS_ASCII: bool
     JSONIFY_PRETTYPRINT_REGULAR: bool
     JSON_SORT_KEYS: bool
+    # ``orjson`` needs the package from the ``json`` extra.
+    JSON_PROVIDER: Literal['flask', 'orjson'] = 'flask'
 
+    # gzip level of Flask-Compress. Responses of other types or shorter than
+    # COMPRESS_MIN_SIZE bytes, which fit a single packet anyway, are sent
+    # as is.
     ZLIB_COMP_LEVEL: int
+    COMPRESS_MIMETYPES: List[str] = ['application/json']
+    COMPRESS_MIN_SIZE: int = 1400
 
     SQLALCHEMY_DATABASE_URI: str
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
     SQLALCHEMY_ECHO: bool = False
 
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 5
+    DATABASE_POOL_TIMEOUT: float = 10.0
+    DATABASE_POOL_RECYCLE: int = 1800
+    DATABASE_POOL_PRE_PING: bool = True
+    # Transaction pooling behind pgbouncer: no prepared statements and no
+    # session state (LISTEN) on pooled connections.
+    DATABASE_PGBOUNCER: bool = False
+
+    ASYNC_POOL_MIN_SIZE: int = 2
+    ASYNC_POOL_MAX_SIZE: int = 10
+
+    TRANSFER_ENGINE: Literal['orm', 'cte'] = 'orm'
+    TRANSFER_BATCH_MAX_SIZE: int = 10000
+    OPERATIONS_PAGE_MAX_SIZE: int = 500
+    CUSTOMERS_LOOKUP_MAX_SIZE: int = 500
+    CUSTOMERS_SEARCH_PAGE_MAX_SIZE: int = 100
+    # Rows validated and inserted per transaction by bulk onboarding.
+    ONBOARDING_CHUNK_SIZE: int = 5000
+
+    # Operations are written to a journal with the balance update and moved
+    # into the operations table by ``flask operations materialize``.
+    OPERATIONS_JOURNAL: bool = False
+    OPERATIONS_JOURNAL_BATCH_SIZE: int = 1000
+    OPERATIONS_JOURNAL_INTERVAL: float = 0.2
+
+    # Replenishments of a worker's threads are committed together by one
+    # committer thread: everything that arrives within the window, up to the
+    # max size, goes into one transaction.
+    REPLENISHMENT_GROUP_COMMIT: bool = False
+    REPLENISHMENT_GROUP_WINDOW: float = 0.002
+    REPLENISHMENT_GROUP_MAX_SIZE: int = 500
+
+    IDEMPOTENCY_KEY_TTL: int = 86400
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+
+    BALANCE_CACHE_SIZE: int = 100000
+    BALANCE_CACHE_TTL: float = 5.0
+    BALANCE_CACHE_LISTEN: bool = True
+
+    # Seconds a wallet snapshot run stays behind now, longer than any
+    # transaction is expected to run.
+    SNAPSHOT_LAG: int = 300
+
+    # Operations newer than the lag are left for the next ledger check, it
+    # has to be at least twice as long as any transaction.
+    LEDGER_CHECK_LAG: int = 600
+    LEDGER_CHECK_BATCH_SIZE: int = 10000
+
+    METRICS_ENABLED: bool = True
+
     LOG_LEVEL: str
     LOG_CONSOLE_HANDLER: bool
     LOG_FILE_HANDLER: bool
+    LOG_FILE: str = '/var/log/billing.log'
+    # Records are queued by the request thread and written to LOG_FILE in
+    # batches by a background thread, records over LOG_QUEUE_SIZE are
+    # dropped and counted.
+    LOG_ASYNC: bool = False
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_BATCH_SIZE: int = 512
+    LOG_FLUSH_INTERVAL: float = 0.5
+    LOG_REQUESTS: bool = False
 
 
 CONFIG = Config()
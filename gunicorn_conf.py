@@ -1,7 +1,50 @@
 # -*- coding: utf-8 -*-
-# pylint: disable=invalid-name
+# pylint: disable=invalid-name,wrong-import-position
+import os
+import shutil
+
+# Workers write metrics here, /metrics of any worker aggregates all of them.
+# It has to be set before prometheus_client is imported: the value class is
+# picked once, on import, and the workers inherit it.
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', '/tmp/billing-metrics',
+)
+# A preloaded app opens its metric files in the master, before on_starting.
+os.makedirs(metrics_dir, exist_ok=True)
+
+from prometheus_client import multiprocess  # noqa: E402
+
 
 bind = ['0.0.0.0:5000']
 workers = 8
 
 loglevel = 'warning'
+
+# The app is built once in the master and forked into the workers, which
+# then only reopen what can't be shared, see pre_fork and post_fork.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '').lower() in ('1', 'true')
+
+
+def on_starting(server):
+    # pylint: disable=unused-argument
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def pre_fork(server, worker):
+    # pylint: disable=unused-argument,import-outside-toplevel
+    if server.cfg.preload_app:
+        from src import prepare_fork
+        prepare_fork(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    # pylint: disable=unused-argument,import-outside-toplevel
+    if server.cfg.preload_app:
+        from src import init_worker
+        init_worker(server.app.wsgi())
+
+
+def child_exit(server, worker):
+    # pylint: disable=unused-argument
+    multiprocess.mark_process_dead(worker.pid)
@@ -18,6 +18,10 @@ logger = logging.getLogger('alembic.env')
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from flask import current_app
+from flask_migrate import Migrate
+# Servers build the app without Flask-Migrate, see register_migrate.
+if 'migrate' not in current_app.extensions:
+    Migrate(current_app, current_app.extensions['sqlalchemy'].db)
 config.set_main_option('sqlalchemy.url',
                        current_app.config.get('SQLALCHEMY_DATABASE_URI'))
 target_metadata = current_app.extensions['migrate'].db.metadata
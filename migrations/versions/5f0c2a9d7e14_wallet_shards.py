@@ -0,0 +1,42 @@
+"""wallet shards
+
+Revision ID: 5f0c2a9d7e14
+Revises: 3b3712ba4361
+Create Date: 2026-10-18 11:02:41.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f0c2a9d7e14'
+down_revision = '3b3712ba4361'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'wallets',
+        sa.Column('shards', sa.Integer(), server_default='0', nullable=False),
+    )
+    op.create_table('wallet_shards',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('wallet_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['wallet_id'], ['wallets.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('wallet_id', 'shard')
+    )
+    op.add_column(
+        'operations',
+        sa.Column('shard', sa.Integer(), server_default='0', nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column('operations', 'shard')
+    op.drop_table('wallet_shards')
+    op.drop_column('wallets', 'shards')
@@ -0,0 +1,35 @@
+"""operations history index
+
+Revision ID: 8a41d3c6b2f0
+Revises: 5f0c2a9d7e14
+Create Date: 2026-10-18 14:27:05.611942
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8a41d3c6b2f0'
+down_revision = '5f0c2a9d7e14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_operations_wallet_id_processed_at_id',
+        'operations',
+        ['wallet_id', 'processed_at', 'id'],
+        unique=False,
+    )
+    # The composite index starts with wallet_id and replaces this one.
+    op.drop_index('ix_operations_wallet_id', table_name='operations')
+
+
+def downgrade():
+    op.create_index(
+        'ix_operations_wallet_id', 'operations', ['wallet_id'], unique=False,
+    )
+    op.drop_index(
+        'ix_operations_wallet_id_processed_at_id', table_name='operations',
+    )
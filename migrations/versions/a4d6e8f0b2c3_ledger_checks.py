@@ -0,0 +1,41 @@
+"""ledger checks
+
+Revision ID: a4d6e8f0b2c3
+Revises: f3a9c2d8e5b1
+Create Date: 2026-10-18 21:12:09.518223
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d6e8f0b2c3'
+down_revision = 'f3a9c2d8e5b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ledger_chains',
+    sa.Column('wallet_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('operation_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['wallet_id'], ['wallets.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('wallet_id', 'shard')
+    )
+    op.create_table('ledger_checks',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('checked_until', sa.Integer(), nullable=False),
+    sa.Column('operations', sa.Integer(), nullable=False),
+    sa.Column('problems', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ledger_checks')
+    op.drop_table('ledger_chains')
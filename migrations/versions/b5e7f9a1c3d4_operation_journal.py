@@ -0,0 +1,61 @@
+"""operation journal
+
+Revision ID: b5e7f9a1c3d4
+Revises: a4d6e8f0b2c3
+Create Date: 2026-10-18 22:31:47.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e7f9a1c3d4'
+down_revision = 'a4d6e8f0b2c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('operation_journal',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('operation_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('transactions', postgresql.ARRAY(postgresql.UUID()), nullable=False),
+    sa.Column('wallet_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('shards', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('amounts_was', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('amounts_become', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('operation_amounts', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('''
+        CREATE VIEW operations_merged AS
+        SELECT
+            id, transaction, wallet_id, amount_was, amount_become,
+            operation_amount, processed_at, shard
+        FROM operations
+        UNION ALL
+        SELECT
+            entry.id, entry.transaction, entry.wallet_id, entry.amount_was,
+            entry.amount_become, entry.operation_amount,
+            operation_journal.processed_at, entry.shard
+        FROM operation_journal, unnest(
+            operation_journal.operation_ids,
+            operation_journal.transactions,
+            operation_journal.wallet_ids,
+            operation_journal.shards,
+            operation_journal.amounts_was,
+            operation_journal.amounts_become,
+            operation_journal.operation_amounts
+        ) AS entry(
+            id, transaction, wallet_id, shard, amount_was, amount_become,
+            operation_amount
+        )
+    ''')
+
+
+def downgrade():
+    op.execute('DROP VIEW operations_merged')
+    op.drop_table('operation_journal')
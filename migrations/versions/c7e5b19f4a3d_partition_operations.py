@@ -0,0 +1,145 @@
+"""partition operations
+
+Revision ID: c7e5b19f4a3d
+Revises: 8a41d3c6b2f0
+Create Date: 2026-10-18 16:45:12.094336
+
+The existing table isn't rewritten: it's attached as the operations_legacy
+partition holding everything before the next month, monthly partitions
+follow it and operations_default catches anything outside of them.
+
+"""
+from datetime import datetime
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e5b19f4a3d'
+down_revision = '8a41d3c6b2f0'
+branch_labels = None
+depends_on = None
+
+
+MONTHS_AHEAD = 3
+
+
+def month_start(value: datetime, months: int = 0) -> datetime:
+    month = value.year * 12 + value.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def upgrade():
+    op.execute('ALTER TABLE operations RENAME TO operations_legacy')
+    op.execute(
+        'ALTER TABLE operations_legacy '
+        'DROP CONSTRAINT operations_pkey'
+    )
+    op.execute(
+        'ALTER INDEX ix_operations_wallet_id_processed_at_id '
+        'RENAME TO operations_legacy_wallet_id_processed_at_id_idx'
+    )
+    op.execute(
+        'ALTER TABLE operations_legacy '
+        'RENAME CONSTRAINT operations_wallet_id_fkey '
+        'TO operations_legacy_wallet_id_fkey'
+    )
+    op.execute(
+        "UPDATE operations_legacy SET processed_at = '1970-01-01' "
+        'WHERE processed_at IS NULL'
+    )
+    op.execute(
+        'ALTER TABLE operations_legacy '
+        'ALTER COLUMN processed_at SET NOT NULL'
+    )
+
+    op.execute('''
+        CREATE TABLE operations (
+            id integer NOT NULL DEFAULT nextval('operations_id_seq'),
+            transaction uuid NOT NULL,
+            wallet_id integer NOT NULL,
+            amount_was integer NOT NULL,
+            amount_become integer NOT NULL,
+            operation_amount integer NOT NULL,
+            processed_at timestamp without time zone NOT NULL
+                DEFAULT (now() AT TIME ZONE 'utc'),
+            shard integer NOT NULL DEFAULT 0,
+            CONSTRAINT operations_pkey PRIMARY KEY (id, processed_at),
+            CONSTRAINT operations_wallet_id_fkey FOREIGN KEY (wallet_id)
+                REFERENCES wallets (id) ON UPDATE CASCADE ON DELETE CASCADE
+        ) PARTITION BY RANGE (processed_at)
+    ''')
+    op.execute('ALTER SEQUENCE operations_id_seq OWNED BY operations.id')
+    op.execute(
+        'CREATE INDEX ix_operations_wallet_id_processed_at_id '
+        'ON operations (wallet_id, processed_at, id)'
+    )
+    op.execute(
+        'CREATE INDEX ix_operations_transaction ON operations (transaction)'
+    )
+
+    first_month = month_start(datetime.utcnow(), 1)
+    op.execute(
+        'ALTER TABLE operations ATTACH PARTITION operations_legacy '
+        f"FOR VALUES FROM (MINVALUE) TO ('{first_month.isoformat()}')"
+    )
+    for months in range(MONTHS_AHEAD):
+        start = month_start(first_month, months)
+        end = month_start(first_month, months + 1)
+        op.execute(
+            f'CREATE TABLE operations_{start:%Y_%m} '
+            'PARTITION OF operations '
+            f"FOR VALUES FROM ('{start.isoformat()}') "
+            f"TO ('{end.isoformat()}')"
+        )
+    op.execute(
+        'CREATE TABLE operations_default PARTITION OF operations DEFAULT'
+    )
+
+
+def downgrade():
+    op.execute('ALTER TABLE operations RENAME TO operations_partitioned')
+    op.execute(
+        'ALTER TABLE operations_partitioned '
+        'RENAME CONSTRAINT operations_pkey TO operations_partitioned_pkey'
+    )
+    op.execute(
+        'ALTER INDEX ix_operations_wallet_id_processed_at_id '
+        'RENAME TO operations_partitioned_wallet_id_processed_at_id_idx'
+    )
+    op.execute(
+        'ALTER INDEX ix_operations_transaction '
+        'RENAME TO operations_partitioned_transaction_idx'
+    )
+    op.execute('''
+        CREATE TABLE operations (
+            id integer NOT NULL DEFAULT nextval('operations_id_seq'),
+            transaction uuid NOT NULL,
+            wallet_id integer NOT NULL,
+            amount_was integer NOT NULL,
+            amount_become integer NOT NULL,
+            operation_amount integer NOT NULL,
+            processed_at timestamp without time zone,
+            shard integer NOT NULL DEFAULT 0
+        )
+    ''')
+    op.execute(
+        'INSERT INTO operations '
+        'SELECT id, transaction, wallet_id, amount_was, amount_become, '
+        'operation_amount, processed_at, shard FROM operations_partitioned'
+    )
+    op.execute('ALTER SEQUENCE operations_id_seq OWNED BY operations.id')
+    op.execute('DROP TABLE operations_partitioned')
+    op.execute(
+        'ALTER TABLE operations ADD CONSTRAINT operations_pkey '
+        'PRIMARY KEY (id)'
+    )
+    op.execute(
+        'ALTER TABLE operations ADD CONSTRAINT operations_wallet_id_fkey '
+        'FOREIGN KEY (wallet_id) REFERENCES wallets (id) '
+        'ON UPDATE CASCADE ON DELETE CASCADE'
+    )
+    op.execute(
+        'CREATE INDEX ix_operations_wallet_id_processed_at_id '
+        'ON operations (wallet_id, processed_at, id)'
+    )
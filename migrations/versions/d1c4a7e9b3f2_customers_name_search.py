@@ -0,0 +1,43 @@
+"""customers name search
+
+Revision ID: d1c4a7e9b3f2
+Revises: b5e7f9a1c3d4
+Create Date: 2026-10-18 23:52:14.208431
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1c4a7e9b3f2'
+down_revision = 'b5e7f9a1c3d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Lowercased names in byte order: a prefix is a range of this index and
+    # so is the (name, id) cursor of the next page. Deleted customers are
+    # never searched for and stay out of both indexes.
+    op.execute(
+        'CREATE INDEX ix_customers_name_prefix ON customers '
+        '((lower(name)) COLLATE "C", id) WHERE deleted = false'
+    )
+    # pg_trgm is a contrib extension that not every server has, fuzzy
+    # search falls back to a substring scan without it.
+    available = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    )).scalar()
+    if available:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            'CREATE INDEX ix_customers_name_trgm ON customers '
+            'USING gin (lower(name) gin_trgm_ops) WHERE deleted = false'
+        )
+
+
+def downgrade():
+    # The extension is left installed, other schemas may use it.
+    op.execute('DROP INDEX IF EXISTS ix_customers_name_trgm')
+    op.drop_index('ix_customers_name_prefix', table_name='customers')
@@ -0,0 +1,44 @@
+"""wallet snapshots
+
+Revision ID: f3a9c2d8e5b1
+Revises: e2b8f4c61a07
+Create Date: 2026-10-18 20:05:41.337104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c2d8e5b1'
+down_revision = 'e2b8f4c61a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('snapshot_runs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.Column('total', sa.BigInteger(), nullable=False),
+    sa.Column('wallets', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('taken_at')
+    )
+    op.create_table('wallet_snapshots',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('wallet_id', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.Column('amount', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['wallet_id'], ['wallets.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('wallet_id', 'taken_at')
+    )
+    op.create_index('ix_operations_processed_at', 'operations', ['processed_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_operations_processed_at', table_name='operations')
+    op.drop_table('wallet_snapshots')
+    op.drop_table('snapshot_runs')
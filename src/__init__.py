@@ -1,27 +1,37 @@
 # -*- coding: utf-8 -*-
+import gc
 import sys
+import time
+from typing import Any, Optional
 from uuid import uuid4
 
+import click
 import status
-from flask import Flask, request
-from flask_compress import Compress
+from flask import Flask, has_request_context, request
 from loguru import logger
 from pydantic import ValidationError
 
 from config import CONFIG
 
-from .api import blueprints
-from .exceptions import RecipientNotExistError, SenderNotEnoughMoneyError
-from .extensions import db, migrate
+from .api import blueprints, commands
+from .exceptions import (
+    IdempotencyKeyError, RecipientNotExistError, SenderNotEnoughMoneyError,
+)
+from .extensions import compress, db, engine_options
+from .metrics import LOG_RECORDS_DROPPED, count_error, init_metrics
+from .utils.json_provider import JSON_PROVIDERS, JSONProviderFlask
+from .utils.log_sink import BatchingSink
+
+
+log_sink: Optional[BatchingSink] = None
 
 
 def init_logger():
+    global log_sink  # pylint: disable=global-statement
 
     def patcher(record):
-        try:
-            record['extra'].update(request_id=request.id)
-        except Exception:  # pylint: disable=broad-except
-            ...
+        if has_request_context():
+            record['extra'].update(request_id=getattr(request, 'id', None))
 
     console = {
         'sink': sys.stderr,
@@ -34,13 +44,32 @@ def init_logger():
         'level': CONFIG.LOG_LEVEL,
     }
     _file = {
-        'sink': '/var/log/billing.log',
+        'sink': CONFIG.LOG_FILE,
         'backtrace': True,
         'serialize': True,
         'diagnose': True,
         'retention': '5 days',
         'level': CONFIG.LOG_LEVEL,
     }
+    if log_sink:
+        log_sink.stop()
+        log_sink = None
+    if CONFIG.LOG_ASYNC and CONFIG.LOG_FILE_HANDLER:
+        log_sink = BatchingSink(
+            CONFIG.LOG_FILE,
+            maxsize=CONFIG.LOG_QUEUE_SIZE,
+            batch_size=CONFIG.LOG_BATCH_SIZE,
+            flush_interval=CONFIG.LOG_FLUSH_INTERVAL,
+            on_drop=LOG_RECORDS_DROPPED.inc,
+        )
+        # Exceptions are formatted by the thread that logs them, so the
+        # expensive variable dumps and extended backtraces are off here.
+        _file = {
+            'sink': log_sink,
+            'backtrace': False,
+            'diagnose': False,
+            'level': CONFIG.LOG_LEVEL,
+        }
     log_config = {
         'handlers': (
             [_file][:CONFIG.LOG_FILE_HANDLER] +
@@ -55,23 +84,62 @@ def create_app() -> Flask:
     init_logger()
     logger.info('Service running.')
 
-    app = Flask(__name__.split('.')[0])
+    app = JSONProviderFlask(__name__.split('.')[0])
     app.config.from_object(CONFIG)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(CONFIG)
+    app.json_provider = JSON_PROVIDERS[CONFIG.JSON_PROVIDER](app)
 
-    Compress(app)
+    app.config['COMPRESS_LEVEL'] = CONFIG.ZLIB_COMP_LEVEL
+    compress.init_app(app)
 
     db.init_app(app)
-    migrate.init_app(app, db)
+    register_migrate(app)
+    if CONFIG.METRICS_ENABLED:
+        init_metrics(app)
 
     register_request_id(app)
+    if CONFIG.LOG_REQUESTS:
+        register_access_log(app)
     register_common_exceptions(app)
 
     for blueprint in blueprints:
         app.register_blueprint(blueprint)
 
+    for command in commands:
+        app.cli.add_command(command)
+
     return app
 
 
+def register_migrate(app: Flask):
+    # pylint: disable=import-outside-toplevel
+    # Alembic is only needed by ``flask db``, servers don't import it.
+    if click.get_current_context(silent=True) is None:
+        return
+    from flask_migrate import Migrate
+    Migrate(app, db)
+
+
+def prepare_fork(app: Any):
+    # Called in the master of a preloading server before every fork. Pooled
+    # connections must not be inherited: a psycopg2 connection closed by one
+    # process is closed for all of them. Objects built so far are moved out
+    # of the collector's reach, so its passes don't touch, and copy, the
+    # pages the workers share. The ASGI app has no connections until its
+    # startup, which runs in the workers.
+    if isinstance(app, Flask):
+        db.get_engine(app).dispose()
+    gc.freeze()
+
+
+def init_worker(app: Any):
+    # Called in every worker forked from a preloaded app: the log file
+    # handler and the pool with its locks are opened anew by the worker.
+    init_logger()
+    if isinstance(app, Flask):
+        db.get_engine(app).dispose()
+
+
 def register_request_id(app: Flask):
     def set_request_id():
         _id = request.headers.get('x-request-id')
@@ -80,7 +148,26 @@ def register_request_id(app: Flask):
     app.before_request(set_request_id)
 
 
+def register_access_log(app: Flask):
+    def start_timer():
+        request.started_at = time.perf_counter()
+
+    def log_request(response):
+        logger.info(
+            '{} {} {} {:.2f}ms',
+            request.method,
+            request.path,
+            response.status_code,
+            (time.perf_counter() - request.started_at) * 1000,
+        )
+        return response
+
+    app.before_request(start_timer)
+    app.after_request(log_request)
+
+
 def error400(exc):
+    count_error(exc)
     return (
         {'status': 'error', 'message': exc.errors()},
         status.HTTP_400_BAD_REQUEST,
@@ -123,6 +210,7 @@ def register_common_exceptions(app: Flask):
     app.register_error_handler(ValidationError, error400)
     app.register_error_handler(SenderNotEnoughMoneyError, error400)
     app.register_error_handler(RecipientNotExistError, error400)
+    app.register_error_handler(IdempotencyKeyError, error400)
     app.register_error_handler(status.HTTP_404_NOT_FOUND, error404)
     app.register_error_handler(status.HTTP_405_METHOD_NOT_ALLOWED, error405)
     app.register_error_handler(Exception, error500)
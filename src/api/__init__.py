@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
+from .commands import commands
+from .monitoring import blueprint_monitoring
 from .views import blueprint_v1
 
 
-blueprints = [blueprint_v1]
+blueprints = [blueprint_v1, blueprint_monitoring]
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import os
+import select
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from flask import current_app
+from loguru import logger
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import event, false, text
+from sqlalchemy import select as sql_select
+
+from config import CONFIG
+from src.extensions import db
+from src.utils.cache import TTLCache
+
+from .models import CustomerModel, WalletModel, WalletShardModel
+
+
+NOTIFY_CHANNEL = 'customers_changed'
+# pg_notify payloads are limited to 8000 bytes.
+NOTIFY_CHUNK = 500
+LISTEN_TIMEOUT = 5.0
+LISTEN_RETRY_DELAY = 1.0
+
+
+class CachedCustomer(NamedTuple):
+    name: str
+    amount: int
+
+
+# Name and balance of not deleted customers. An entry lives at most
+# BALANCE_CACHE_TTL seconds, which bounds staleness when a notification
+# is lost, and is dropped as soon as any worker commits a change.
+customers = TTLCache(CONFIG.BALANCE_CACHE_SIZE, CONFIG.BALANCE_CACHE_TTL)
+
+
+def cached_customer(customer_id: int) -> Optional[CachedCustomer]:
+    # pylint: disable=no-member
+    # LISTEN is session state, pgbouncer in transaction mode can't keep it.
+    if current_app.config['BALANCE_CACHE_LISTEN'] \
+            and not current_app.config['DATABASE_PGBOUNCER']:
+        start_listener()
+    customer = customers.get(customer_id)
+    if customer:
+        return customer
+
+    # A change of the customer committed while the row is being read bumps
+    # its version, the read value is not cached then.
+    version = customers.version(customer_id)
+    shards = sql_select([
+        db.func.coalesce(db.func.sum(WalletShardModel.amount), 0),
+    ])\
+        .where(WalletShardModel.wallet_id == WalletModel.id)\
+        .as_scalar()
+    query = sql_select([CustomerModel.name, WalletModel.amount + shards])\
+        .where(CustomerModel.id == WalletModel.customer_id)\
+        .where(CustomerModel.deleted == false())\
+        .where(CustomerModel.id == customer_id)
+    row = db.session.execute(query).fetchone()
+    if row is None:
+        return None
+    customer = CachedCustomer(*row)
+    customers.set(customer_id, customer, version=version)
+    return customer
+
+
+class CustomerBalance(NamedTuple):
+    id: int
+    name: str
+    deleted: bool
+    amount: int
+
+
+def lookup_customers(customer_ids: List[int]) -> Dict[int, CustomerBalance]:
+    # pylint: disable=no-member
+    # One query for the whole list, deleted customers included. Balances
+    # are read from the database, the cache only holds live customers.
+    shards = sql_select([
+        db.func.coalesce(db.func.sum(WalletShardModel.amount), 0),
+    ])\
+        .where(WalletShardModel.wallet_id == WalletModel.id)\
+        .as_scalar()
+    query = sql_select([
+        CustomerModel.id,
+        CustomerModel.name,
+        CustomerModel.deleted,
+        WalletModel.amount + shards,
+    ])\
+        .where(CustomerModel.id == WalletModel.customer_id)\
+        .where(CustomerModel.id.in_(set(customer_ids)))
+    return {
+        row[0]: CustomerBalance(*row)
+        for row in db.session.execute(query)
+    }
+
+
+def notify_customers(customer_ids: Iterable[int]):
+    # pylint: disable=no-member
+    # Has to be called inside the changing transaction: notifications are
+    # delivered to the other workers on commit, the local cache is cleaned
+    # right after it.
+    if customers.maxsize <= 0:
+        return
+    customer_ids = sorted(set(customer_ids))
+    db.session.info.setdefault('changed_customers', set())\
+        .update(customer_ids)
+    for start in range(0, len(customer_ids), NOTIFY_CHUNK):
+        chunk = customer_ids[start:start + NOTIFY_CHUNK]
+        db.session.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            {'channel': NOTIFY_CHANNEL, 'payload': ','.join(map(str, chunk))},
+        )
+
+
+@event.listens_for(db.session, 'after_commit')
+def forget_customers(session):
+    for customer_id in session.info.pop('changed_customers', ()):
+        customers.pop(customer_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def keep_customers(session):
+    session.info.pop('changed_customers', None)
+
+
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def start_listener():
+    # pylint: disable=global-statement,no-member
+    # One listening thread per worker process, started on first use so it
+    # is never inherited through a fork.
+    global _listener_pid
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+    threading.Thread(
+        target=listen,
+        args=(db.engine,),
+        name='customers-listener',
+        daemon=True,
+    ).start()
+
+
+def listen(engine):
+    while True:
+        connection = None
+        try:
+            connection = engine.raw_connection()
+            connection.detach()
+            connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            connection.cursor().execute(f'LISTEN {NOTIFY_CHANNEL}')
+            # Whatever changed before LISTEN could have been missed.
+            customers.clear()
+            while True:
+                readable, _, _ = \
+                    select.select([connection], [], [], LISTEN_TIMEOUT)
+                if not readable:
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    payload = connection.notifies.pop(0).payload
+                    for customer_id in payload.split(','):
+                        customers.pop(int(customer_id))
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Customers listener failed, reconnecting')
+            customers.clear()
+            if connection is not None:
+                connection.close()
+            time.sleep(LISTEN_RETRY_DELAY)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from src.extensions import db
+
+from .export import export_operations
+from .idempotency import purge_idempotency_keys
+from .journal import materialize_journal, run_materializer
+from .onboarding import onboard_customers
+from .partitions import archive_partitions, create_partitions
+from .reconciliation import check_ledger
+from .snapshots import liabilities_at, take_snapshot
+from .wallets import lock_wallets, rebalance_wallet
+
+
+wallets_cli = AppGroup('wallets', help='Hot wallet sharding.')
+
+
+@wallets_cli.command('shard')
+@click.argument('customer_id', type=int)
+@click.argument('shards', type=click.IntRange(0, 1024))
+def shard(customer_id: int, shards: int):
+    """Split the customer wallet into SHARDS rows, 0 turns sharding off."""
+    # pylint: disable=no-member
+    try:
+        wallet = lock_wallets((customer_id,)).get(customer_id)
+        if not wallet:
+            raise click.ClickException(f"Customer {customer_id} doesn't exist")
+        rebalance_wallet(wallet, shards)
+    except Exception:
+        db.session.rollback()
+        raise
+    else:
+        db.session.commit()
+
+
+@wallets_cli.command('rebalance')
+@click.option('--customer-id', type=int, default=None)
+def rebalance(customer_id: int):
+    """Move shard balances back into their wallets."""
+    # pylint: disable=no-member
+    customer_ids = [customer_id] if customer_id else [
+        row.customer_id
+        for row in db.session.execute(text(
+            'SELECT DISTINCT wallets.customer_id FROM wallets '
+            'JOIN wallet_shards ON wallet_shards.wallet_id = wallets.id '
+            'WHERE wallet_shards.amount <> 0 ORDER BY wallets.customer_id'
+        ))
+    ]
+    for _id in customer_ids:
+        try:
+            wallet = lock_wallets((_id,)).get(_id)
+            if wallet:
+                rebalance_wallet(wallet)
+        except Exception:
+            db.session.rollback()
+            raise
+        else:
+            db.session.commit()
+
+
+customers_cli = AppGroup('customers', help='Customers.')
+
+
+@customers_cli.command('import')
+@click.option(
+    '--format', '_format', type=click.Choice(['ndjson', 'csv']),
+    default='ndjson',
+)
+@click.option('--chunk-size', type=click.IntRange(1), default=None)
+@click.option('--input', '_input', type=click.File('r'), default='-')
+@click.option('--output', type=click.File('w'), default='-')
+def import_customers(_format, chunk_size: int, _input, output):
+    """Create customers with wallets, prints the row to id mapping."""
+    chunk_size = chunk_size or current_app.config['ONBOARDING_CHUNK_SIZE']
+    for chunk in onboard_customers(_format, _input, chunk_size):
+        output.write(chunk)
+
+
+operations_cli = AppGroup('operations', help='Operations ledger.')
+
+
+@operations_cli.command('export')
+@click.option(
+    '--format', '_format', type=click.Choice(['ndjson', 'csv']),
+    default='ndjson',
+)
+@click.option('--since', type=click.DateTime(), default=None)
+@click.option('--until', type=click.DateTime(), default=None)
+@click.option('--wallet-id', type=int, default=None)
+@click.option('--output', type=click.File('w'), default='-')
+def export(_format, since, until, wallet_id, output):
+    """Stream operations as NDJSON or CSV, times are UTC."""
+    for chunk in export_operations(_format, since, until, wallet_id):
+        output.write(chunk)
+
+
+@operations_cli.command('partitions')
+@click.option('--months-ahead', type=click.IntRange(0, 120), default=3)
+def partitions(months_ahead: int):
+    """Create monthly partitions up to MONTHS_AHEAD, run it from cron."""
+    for name in create_partitions(months_ahead):
+        click.echo(f'Created {name}')
+
+
+@operations_cli.command('archive')
+@click.option('--before', type=click.DateTime(), required=True)
+@click.option(
+    '--directory',
+    type=click.Path(exists=True, file_okay=False, writable=True),
+    required=True,
+)
+def archive(before, directory: str):
+    """Move partitions ending before BEFORE into gzipped CSV files."""
+    for path in archive_partitions(before, directory):
+        click.echo(f'Archived {path}')
+
+
+@operations_cli.command('materialize')
+@click.option('--batch-size', type=click.IntRange(1), default=None)
+@click.option('--once', is_flag=True, help='Exit once the journal is empty.')
+def materialize(batch_size: int, once: bool):
+    """Move journaled operations into the operations table."""
+    batch_size = \
+        batch_size or current_app.config['OPERATIONS_JOURNAL_BATCH_SIZE']
+    if not once:
+        run_materializer(
+            batch_size, current_app.config['OPERATIONS_JOURNAL_INTERVAL'],
+        )
+        return
+    total = 0
+    while True:
+        count = materialize_journal(batch_size)
+        if not count:
+            break
+        total += count
+    click.echo(f'Materialized {total} operations')
+
+
+idempotency_cli = AppGroup('idempotency', help='Idempotency keys.')
+
+
+@idempotency_cli.command('purge')
+@click.option('--ttl', type=click.IntRange(0), default=None)
+def purge(ttl: int):
+    """Delete keys older than TTL seconds, IDEMPOTENCY_KEY_TTL by default."""
+    ttl = current_app.config['IDEMPOTENCY_KEY_TTL'] if ttl is None else ttl
+    click.echo(f'Deleted {purge_idempotency_keys(ttl)} keys')
+
+
+snapshots_cli = AppGroup('snapshots', help='Wallet balance snapshots.')
+
+
+@snapshots_cli.command('take')
+@click.option('--lag', type=click.IntRange(0), default=None)
+def take(lag: int):
+    """Snapshot wallets changed since the last run, run it from cron."""
+    run = take_snapshot(lag=lag)
+    if run is None:
+        click.echo('The last snapshot is up to date')
+    else:
+        click.echo(
+            f'Snapshot at {run.taken_at.isoformat()}: {run.wallets} wallets, '
+            f'total {run.total}'
+        )
+
+
+@snapshots_cli.command('liabilities')
+@click.option('--at', type=click.DateTime(), default=None)
+def liabilities(at):
+    """Print the total of all balances at AT (UTC), now by default."""
+    report = liabilities_at(at or datetime.utcnow())
+    click.echo(report.amount)
+
+
+ledger_cli = AppGroup('ledger', help='Ledger consistency.')
+
+
+@ledger_cli.command('check')
+@click.option('--workers', type=click.IntRange(1, 64), default=1)
+@click.option('--lag', type=click.IntRange(0), default=None)
+@click.option('--batch-size', type=click.IntRange(1), default=None)
+def check(workers: int, lag: int, batch_size: int):
+    """Check operations since the last run, exits with 1 on problems."""
+    result = check_ledger(workers, lag, batch_size)
+    for problem in result.problems:
+        click.echo(str(problem))
+    click.echo(
+        f'Checked operations {result.watermark + 1}..{result.horizon}: '
+        f'{result.operations} operations, {result.chains} chains, '
+        f'{len(result.problems)} problems',
+        err=True,
+    )
+    if result.problems:
+        raise SystemExit(1)
+
+
+commands = [
+    customers_cli, wallets_cli, operations_cli, idempotency_cli,
+    snapshots_cli, ledger_cli,
+]
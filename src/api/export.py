@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from src.extensions import db
+
+from .models import OperationModel
+
+
+EXPORT_CHUNK = 5000
+EXPORT_COLUMNS = (
+    'id',
+    'transaction',
+    'wallet_id',
+    'shard',
+    'amount_was',
+    'amount_become',
+    'operation_amount',
+    'processed_at',
+)
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def export_operations(
+        _format: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        wallet_id: Optional[int] = None,
+) -> Iterator[str]:
+    # pylint: disable=no-member
+    # Rows are read through a server side cursor and rendered chunk by
+    # chunk, so memory doesn't depend on the size of the export.
+    query = select([
+        getattr(OperationModel, column) for column in EXPORT_COLUMNS
+    ])\
+        .order_by(OperationModel.id)\
+        .execution_options(stream_results=True)
+    if since:
+        query = query.where(OperationModel.processed_at >= since)
+    if until:
+        query = query.where(OperationModel.processed_at < until)
+    if wallet_id:
+        query = query.where(OperationModel.wallet_id == wallet_id)
+
+    result = db.session.execute(query)
+    try:
+        if _format == 'csv':
+            yield ','.join(EXPORT_COLUMNS) + '\r\n'
+        while True:
+            rows = result.fetchmany(EXPORT_CHUNK)
+            if not rows:
+                break
+            yield render(_format, rows)
+    finally:
+        result.close()
+        db.session.rollback()
+
+
+def render(_format: str, rows) -> str:
+    if _format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                row.id,
+                row.transaction,
+                row.wallet_id,
+                row.shard,
+                row.amount_was,
+                row.amount_become,
+                row.operation_amount,
+                row.processed_at.isoformat() if row.processed_at else '',
+            ])
+        return buffer.getvalue()
+    return ''.join(
+        json.dumps({
+            'id': row.id,
+            'transaction': str(row.transaction),
+            'wallet_id': row.wallet_id,
+            'shard': row.shard,
+            'amount_was': row.amount_was,
+            'amount_become': row.amount_become,
+            'operation_amount': row.operation_amount,
+            'processed_at':
+                row.processed_at.isoformat() if row.processed_at else None,
+        }) + '\n'
+        for row in rows
+    )
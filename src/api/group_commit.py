@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple, Union
+from uuid import UUID, uuid4
+
+from flask import Flask, current_app
+from loguru import logger
+
+from src import ledger
+from src.exceptions import BillingError
+from src.extensions import db
+
+from .balances import notify_customers
+from .wallets import PostgresLedger
+
+
+class GroupCommitError(Exception):
+    pass
+
+
+class Replenishment:
+    # One waiting request: the committer fills in the balance before it or
+    # the error and sets ``done``.
+    __slots__ = ('customer_id', 'amount', 'transaction', 'result', 'done')
+
+    def __init__(self, customer_id: int, amount: int):
+        self.customer_id = customer_id
+        self.amount = amount
+        self.transaction = uuid4()
+        self.result: Optional[Union[int, Exception]] = None
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    # Replenishments of a worker's request threads are queued for a single
+    # committer thread, which applies whatever arrived within ``window``
+    # seconds of the first one, up to ``max_size``, in one transaction: one
+    # UPDATE per wallet and one bulk insert of operations for all of them,
+    # so one commit is paid for the whole group.
+    def __init__(self, app: Flask, window: float, max_size: int):
+        self.app = app
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self.committed = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+
+    def _start(self):
+        # One committer per worker process, started on first use so it is
+        # never inherited through a fork.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            threading.Thread(
+                target=self._run, name='replenishment-committer', daemon=True,
+            ).start()
+
+    def submit(self, customer_id: int, amount: int) -> Tuple[UUID, int]:
+        # Blocks until the group is committed, returns the transaction and
+        # the balance before the replenishment.
+        self._start()
+        item = Replenishment(customer_id, amount)
+        self._queue.put(item)
+        item.done.wait()
+        if isinstance(item.result, BillingError):
+            raise item.result
+        if isinstance(item.result, Exception):
+            raise GroupCommitError('Group commit failed') from item.result
+        return item.transaction, item.result
+
+    def _gather(self) -> List[Replenishment]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._gather()
+            try:
+                self._commit(batch)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.exception('Replenishments group commit failed')
+                for item in batch:
+                    item.result = error
+            for item in batch:
+                item.done.set()
+
+    def _commit(self, batch: List[Replenishment]):
+        # pylint: disable=no-member
+        with self.app.app_context():
+            try:
+                results = ledger.replenish_batch(
+                    PostgresLedger(),
+                    [
+                        (item.customer_id, item.amount, item.transaction)
+                        for item in batch
+                    ],
+                    datetime.utcnow(),
+                )
+                notify_customers(
+                    item.customer_id
+                    for item, result in zip(batch, results)
+                    if not isinstance(result, BillingError)
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        self.batches += 1
+        self.committed += len(batch)
+        for item, result in zip(batch, results):
+            item.result = result
+
+
+def group_committer() -> GroupCommitter:
+    # pylint: disable=protected-access
+    app = current_app._get_current_object()
+    committer = app.extensions.get('group_committer')
+    if committer is None:
+        committer = app.extensions.setdefault(
+            'group_committer',
+            GroupCommitter(
+                app,
+                app.config['REPLENISHMENT_GROUP_WINDOW'],
+                app.config['REPLENISHMENT_GROUP_MAX_SIZE'],
+            ),
+        )
+    return committer
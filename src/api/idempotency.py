@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, NamedTuple
+
+from flask import current_app, request
+from sqlalchemy import delete, text, update
+
+from config import CONFIG
+from src.exceptions import IdempotencyKeyError
+from src.extensions import db
+from src.utils.cache import TTLCache
+
+from .models import IdempotencyKeyModel
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    body: str
+
+
+# Replays are served from here without a round trip to Postgres.
+replays = TTLCache(CONFIG.IDEMPOTENCY_CACHE_SIZE, CONFIG.IDEMPOTENCY_KEY_TTL)
+
+
+# A duplicate of an in-flight request waits on the unique index until the
+# first transaction commits (and then gets its stored response) or rolls
+# back (and then executes itself). Expired keys are taken over.
+CLAIM_STATEMENT = text('''
+INSERT INTO idempotency_keys (key, endpoint, fingerprint, created_at)
+VALUES (:key, :endpoint, :fingerprint, :now)
+ON CONFLICT (key, endpoint) DO UPDATE SET
+    fingerprint = CASE WHEN idempotency_keys.created_at < :expired
+        THEN EXCLUDED.fingerprint ELSE idempotency_keys.fingerprint END,
+    status_code = CASE WHEN idempotency_keys.created_at < :expired
+        THEN NULL ELSE idempotency_keys.status_code END,
+    response = CASE WHEN idempotency_keys.created_at < :expired
+        THEN NULL ELSE idempotency_keys.response END,
+    created_at = CASE WHEN idempotency_keys.created_at < :expired
+        THEN EXCLUDED.created_at ELSE idempotency_keys.created_at END
+RETURNING id, fingerprint, status_code, response, created_at
+''')
+
+
+def fingerprint(data: Any) -> str:
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def check_key(key: str):
+    if not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise IdempotencyKeyError(
+            f'{IDEMPOTENCY_HEADER} must be 1 to '
+            f'{IDEMPOTENCY_KEY_MAX_LENGTH} characters long',
+        )
+
+
+def check_fingerprint(stored: StoredResponse, value: str):
+    if stored.fingerprint != value:
+        raise IdempotencyKeyError(
+            f'{IDEMPOTENCY_HEADER} was already used with another request',
+        )
+
+
+def replay(stored: StoredResponse, value: str):
+    check_fingerprint(stored, value)
+    response = current_app.response_class(
+        stored.body,
+        status=stored.status_code,
+        mimetype=current_app.config['JSONIFY_MIMETYPE'],
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(func):
+    # Goes under ``validate``: the fingerprint is taken from the validated
+    # body. The view has to call ``remember_response`` before its commit.
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        # pylint: disable=no-member
+        request.idempotency_key_id = None
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return func(*args, **kwargs)
+        check_key(key)
+
+        value = fingerprint(request.valid_json)
+        cache_key = (request.path, key)
+        stored = replays.get(cache_key)
+        if stored:
+            return replay(stored, value)
+
+        now = datetime.utcnow()
+        ttl = current_app.config['IDEMPOTENCY_KEY_TTL']
+        try:
+            claimed = db.session.execute(
+                CLAIM_STATEMENT,
+                {
+                    'key': key,
+                    'endpoint': request.path,
+                    'fingerprint': value,
+                    'now': now,
+                    'expired': now - timedelta(seconds=ttl),
+                },
+            ).fetchone()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        expires_in = ttl - (now - claimed.created_at).total_seconds()
+        if claimed.status_code is not None:
+            db.session.rollback()
+            stored = StoredResponse(
+                claimed.fingerprint, claimed.status_code, claimed.response,
+            )
+            replays.set(cache_key, stored, expires_in)
+            return replay(stored, value)
+
+        request.idempotency_key_id = claimed.id
+        request.idempotency_fingerprint = value
+        request.idempotent_response = None
+        response = func(*args, **kwargs)
+        if request.idempotent_response:
+            replays.set(cache_key, request.idempotent_response, expires_in)
+        return response
+    return wrapper
+
+
+def remember_response(body: Any, status_code: int = 200):
+    # pylint: disable=no-member
+    key_id = getattr(request, 'idempotency_key_id', None)
+    if key_id is None:
+        return
+    stored = StoredResponse(
+        request.idempotency_fingerprint,
+        status_code,
+        current_app.json_provider.dumps(body),
+    )
+    db.session.execute(
+        update(IdempotencyKeyModel)
+        .where(IdempotencyKeyModel.id == key_id)
+        .values(status_code=stored.status_code, response=stored.body),
+    )
+    request.idempotent_response = stored
+
+
+def purge_idempotency_keys(ttl: int) -> int:
+    # pylint: disable=no-member
+    expired = datetime.utcnow() - timedelta(seconds=ttl)
+    result = db.session.execute(
+        delete(IdempotencyKeyModel)
+        .where(IdempotencyKeyModel.created_at < expired),
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import threading
+from datetime import datetime
+from typing import Iterable, Optional
+from uuid import UUID
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+
+from src.extensions import db
+
+
+JOURNAL_COLUMNS = (
+    'transaction',
+    'wallet_id',
+    'shard',
+    'amount_was',
+    'amount_become',
+    'operation_amount',
+)
+
+# All operations of a database transaction go into one journal row. Their
+# ids are taken from the operations sequence right away, while the wallets
+# are still locked, so ids keep the order of every wallet chain.
+JOURNAL_STATEMENT = text('''
+INSERT INTO operation_journal (
+    operation_ids, transactions, wallet_ids, shards, amounts_was,
+    amounts_become, operation_amounts, processed_at
+)
+VALUES (
+    ARRAY(
+        SELECT CAST(nextval('operations_id_seq') AS integer)
+        FROM generate_series(1, :count)
+    ),
+    CAST(:transactions AS uuid[]),
+    CAST(:wallet_ids AS integer[]),
+    CAST(:shards AS integer[]),
+    CAST(:amounts_was AS integer[]),
+    CAST(:amounts_become AS integer[]),
+    CAST(:operation_amounts AS integer[]),
+    :processed_at
+)
+''')
+
+# Journal rows are deleted and their operations inserted by one statement,
+# so every entry is materialized exactly once. Concurrent workers skip the
+# rows locked by each other.
+MATERIALIZE_STATEMENT = text('''
+WITH moved AS (
+    DELETE FROM operation_journal
+    WHERE id = ANY(CAST(:ids AS bigint[]))
+    RETURNING *
+)
+INSERT INTO operations (
+    id, transaction, wallet_id, shard, amount_was, amount_become,
+    operation_amount, processed_at
+)
+SELECT
+    entry.id, entry.transaction, entry.wallet_id, entry.shard,
+    entry.amount_was, entry.amount_become, entry.operation_amount,
+    moved.processed_at
+FROM moved, unnest(
+    moved.operation_ids, moved.transactions, moved.wallet_ids, moved.shards,
+    moved.amounts_was, moved.amounts_become, moved.operation_amounts
+) AS entry(
+    id, transaction, wallet_id, shard, amount_was, amount_become,
+    operation_amount
+)
+''')
+
+
+def journal_enabled() -> bool:
+    return has_app_context() and current_app.config['OPERATIONS_JOURNAL']
+
+
+def journal_operation(
+        transaction: UUID,
+        wallet_id: int,
+        amount_was: int,
+        amount_become: int,
+        operation_amount: int,
+        shard: int = 0,
+        **_,
+):
+    # pylint: disable=no-member
+    db.session.info.setdefault('journal', []).append((
+        transaction, wallet_id, shard, amount_was, amount_become,
+        operation_amount,
+    ))
+
+
+def journal_operations(operations: Iterable[dict]):
+    for operation in operations:
+        journal_operation(**operation)
+
+
+@event.listens_for(db.session, 'before_commit')
+def write_journal(session):
+    entries = session.info.pop('journal', None)
+    if not entries:
+        return
+    columns = dict(zip(JOURNAL_COLUMNS, zip(*entries)))
+    session.execute(
+        JOURNAL_STATEMENT,
+        {
+            'count': len(entries),
+            'transactions': [str(value) for value in columns['transaction']],
+            'wallet_ids': list(columns['wallet_id']),
+            'shards': list(columns['shard']),
+            'amounts_was': list(columns['amount_was']),
+            'amounts_become': list(columns['amount_become']),
+            'operation_amounts': list(columns['operation_amount']),
+            'processed_at': datetime.utcnow(),
+        },
+    )
+
+
+@event.listens_for(db.session, 'after_rollback')
+def drop_journal(session):
+    session.info.pop('journal', None)
+
+
+def materialize_journal(limit: int) -> int:
+    # pylint: disable=no-member
+    # Moves up to ``limit`` journal rows into operations, returns the number
+    # of operations inserted. Wallets of the entries are locked the way
+    # transfers lock them, but busy ones are skipped and their entries left
+    # for the next pass: waiting on them while holding foreign key locks on
+    # other wallets deadlocks with transfers.
+    try:
+        rows = db.session.execute(
+            text(
+                'SELECT id, wallet_ids FROM operation_journal '
+                'ORDER BY id LIMIT :limit FOR UPDATE SKIP LOCKED'
+            ),
+            {'limit': limit},
+        ).fetchall()
+        wallet_ids = {
+            wallet_id for row in rows for wallet_id in row.wallet_ids
+        }
+        locked = {
+            wallet.id
+            for wallet in db.session.execute(
+                text(
+                    'SELECT id FROM wallets WHERE id = ANY(:wallet_ids) '
+                    'ORDER BY id FOR NO KEY UPDATE SKIP LOCKED'
+                ),
+                {'wallet_ids': list(wallet_ids)},
+            )
+        }
+        ready = [
+            row.id for row in rows if locked.issuperset(row.wallet_ids)
+        ]
+        count = db.session.execute(
+            MATERIALIZE_STATEMENT, {'ids': ready},
+        ).rowcount if ready else 0
+    except Exception:
+        db.session.rollback()
+        raise
+    else:
+        db.session.commit()
+        return count
+
+
+def run_materializer(
+        limit: int,
+        interval: float,
+        stop: Optional[threading.Event] = None,
+):
+    # Drains the journal, then polls it every ``interval`` seconds.
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        if not materialize_journal(limit):
+            stop.wait(interval)
@@ -4,16 +4,26 @@ from typing import Optional
 from uuid import UUID as _UUID
 from uuid import uuid4
 
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import column, table
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.orm import relationship
-from sqlalchemy.schema import ForeignKey
+from sqlalchemy.schema import ForeignKey, UniqueConstraint
 
 from src.extensions import db
 
+from .journal import journal_enabled, journal_operation
+
 
 class OperationModel(db.Model):
     # pylint: disable=no-member
     __tablename__ = 'operations'
+    __table_args__ = (
+        db.Index(
+            'ix_operations_wallet_id_processed_at_id',
+            'wallet_id', 'processed_at', 'id',
+        ),
+        db.Index('ix_operations_processed_at', 'processed_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     transaction = db.Column(
@@ -26,12 +36,45 @@ class OperationModel(db.Model):
         db.Integer,
         ForeignKey('wallets.id', ondelete='CASCADE', onupdate='CASCADE'),
         nullable=False,
-        index=True,
     )
     amount_was = db.Column(db.Integer, nullable=False)
     amount_become = db.Column(db.Integer, nullable=False)
     operation_amount = db.Column(db.Integer, nullable=False)
-    processed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Part of the key: operations are partitioned by it.
+    processed_at = db.Column(
+        db.DateTime, primary_key=True, default=datetime.utcnow, nullable=False,
+    )
+    shard = \
+        db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+
+class OperationJournalModel(db.Model):
+    # pylint: disable=no-member
+    __tablename__ = 'operation_journal'
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    operation_ids = db.Column(ARRAY(db.Integer), nullable=False)
+    transactions = db.Column(ARRAY(UUID(as_uuid=True)), nullable=False)
+    wallet_ids = db.Column(ARRAY(db.Integer), nullable=False)
+    shards = db.Column(ARRAY(db.Integer), nullable=False)
+    amounts_was = db.Column(ARRAY(db.Integer), nullable=False)
+    amounts_become = db.Column(ARRAY(db.Integer), nullable=False)
+    operation_amounts = db.Column(ARRAY(db.Integer), nullable=False)
+    processed_at = db.Column(db.DateTime, nullable=False)
+
+
+# The operations_merged view adds journal entries that aren't materialized
+# yet to operations.
+operations_merged = table(
+    'operations_merged',
+    *(
+        column(name, OperationModel.__table__.c[name].type)
+        for name in (
+            'id', 'transaction', 'wallet_id', 'amount_was', 'amount_become',
+            'operation_amount', 'processed_at', 'shard',
+        )
+    ),
+)
 
 
 class WalletModel(db.Model):
@@ -46,6 +89,8 @@ class WalletModel(db.Model):
         nullable=False,
         index=True,
     )
+    shards = \
+        db.Column(db.Integer, default=0, server_default='0', nullable=False)
     operations = relationship(
         'OperationModel',
         cascade='all, delete-orphan',
@@ -53,6 +98,87 @@ class WalletModel(db.Model):
     )
 
 
+class WalletShardModel(db.Model):
+    # pylint: disable=no-member
+    __tablename__ = 'wallet_shards'
+    __table_args__ = (UniqueConstraint('wallet_id', 'shard'),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    wallet_id = db.Column(
+        db.Integer,
+        ForeignKey('wallets.id', ondelete='CASCADE', onupdate='CASCADE'),
+        nullable=False,
+    )
+    shard = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Integer, default=0, nullable=False)
+
+
+class SnapshotRunModel(db.Model):
+    # pylint: disable=no-member
+    __tablename__ = 'snapshot_runs'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    taken_at = db.Column(db.DateTime, nullable=False, unique=True)
+    total = db.Column(db.BigInteger, nullable=False)
+    wallets = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class WalletSnapshotModel(db.Model):
+    # pylint: disable=no-member
+    __tablename__ = 'wallet_snapshots'
+    __table_args__ = (UniqueConstraint('wallet_id', 'taken_at'),)
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    wallet_id = db.Column(
+        db.Integer,
+        ForeignKey('wallets.id', ondelete='CASCADE', onupdate='CASCADE'),
+        nullable=False,
+    )
+    taken_at = db.Column(db.DateTime, nullable=False)
+    amount = db.Column(db.BigInteger, nullable=False)
+
+
+class LedgerChainModel(db.Model):
+    # pylint: disable=no-member
+    __tablename__ = 'ledger_chains'
+
+    wallet_id = db.Column(
+        db.Integer,
+        ForeignKey('wallets.id', ondelete='CASCADE', onupdate='CASCADE'),
+        primary_key=True,
+    )
+    shard = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+
+
+class LedgerCheckModel(db.Model):
+    # pylint: disable=no-member
+    __tablename__ = 'ledger_checks'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    checked_until = db.Column(db.Integer, nullable=False)
+    operations = db.Column(db.Integer, nullable=False)
+    problems = db.Column(db.Integer, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=False)
+
+
+class IdempotencyKeyModel(db.Model):
+    # pylint: disable=no-member
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (UniqueConstraint('key', 'endpoint'),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    key = db.Column(db.String(255), nullable=False)
+    endpoint = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    response = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
 class CustomerModel(db.Model):  # type: ignore
     # pylint: disable=no-member
     __tablename__ = 'customers'
@@ -82,15 +208,22 @@ def register_operation(
         amount_become: int,
         amount: int,
         transaction: Optional[_UUID] = None,
+        shard: int = 0,
 ) -> _UUID:
     # pylint: disable=no-member
     transaction = transaction if transaction else uuid4()
+    if journal_enabled():
+        journal_operation(
+            transaction, wallet_id, amount_was, amount_become, amount, shard,
+        )
+        return transaction
     operation = OperationModel(
         transaction=transaction,
         wallet_id=wallet_id,
         amount_was=amount_was,
         amount_become=amount_become,
         operation_amount=amount,
+        shard=shard,
     )
     db.session.add(operation)
     return transaction
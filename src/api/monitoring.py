@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import os
+
+from flask import Blueprint
+
+from src.extensions import db
+
+from .balances import customers
+from .idempotency import replays
+
+
+blueprint_monitoring = Blueprint(
+    'monitoring', __name__, url_prefix='/monitoring',
+)
+
+
+@blueprint_monitoring.route('/cache', methods=['GET'])
+def cache():
+    # Counters of this worker process only.
+    return {
+        'customers': customers.stats(),
+        'idempotency': replays.stats(),
+    }
+
+
+@blueprint_monitoring.route('/pool', methods=['GET'])
+def pool():
+    # pylint: disable=no-member
+    return {'pid': os.getpid(), **db.engine.pool.stats()}
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from pydantic import ValidationError
+from sqlalchemy import text
+
+from src.extensions import db
+
+from .schemas import CustomerSchema
+
+
+# Customer ids are taken from the sequence before the insert, so every input
+# row keeps its id no matter in which order the rows are inserted. Wallets
+# are created by the same statement.
+CREATE_CUSTOMERS_STATEMENT = text('''
+WITH batch AS (
+    SELECT nextval('customers_id_seq') AS id, batch.row, batch.name
+    FROM unnest(
+        CAST(:rows AS integer[]), CAST(:names AS varchar[])
+    ) AS batch(row, name)
+),
+created AS (
+    INSERT INTO customers (id, name, created_at, deleted)
+    SELECT id, name, CAST(:created_at AS timestamp), false FROM batch
+    RETURNING id
+),
+wallets_created AS (
+    INSERT INTO wallets (customer_id, amount, shards)
+    SELECT id, 0, 0 FROM created
+)
+SELECT row, id FROM batch ORDER BY row
+''')
+
+
+def read_records(
+        _format: str,
+        lines: Iterable[str],
+) -> Iterator[Union[dict, str]]:
+    # Yields one dict per input row, or the reason it can't be parsed.
+    if _format == 'csv':
+        for record in csv.DictReader(lines):
+            yield 'too many fields' if None in record else record
+        return
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield 'invalid JSON'
+            continue
+        yield record if isinstance(record, dict) \
+            else 'a JSON object is expected'
+
+
+def validate_records(
+        records: List[Tuple[int, Union[dict, str]]],
+) -> Tuple[List[Tuple[int, str]], List[dict]]:
+    # Rejected rows get the error shape of the 400 responses.
+    valid = []
+    rejected = []
+    for row, record in records:
+        if isinstance(record, str):
+            rejected.append({
+                'row': row,
+                'errors': [
+                    {'loc': [], 'msg': record, 'type': 'value_error.format'},
+                ],
+            })
+            continue
+        try:
+            valid.append((row, CustomerSchema(**record).name))
+        except ValidationError as exc:
+            rejected.append({'row': row, 'errors': exc.errors()})
+    return valid, rejected
+
+
+def create_customers(valid: List[Tuple[int, str]]) -> List[dict]:
+    # pylint: disable=no-member
+    if not valid:
+        return []
+    rows, names = zip(*valid)
+    try:
+        created = db.session.execute(
+            CREATE_CUSTOMERS_STATEMENT,
+            {
+                'rows': list(rows),
+                'names': list(names),
+                'created_at': datetime.utcnow(),
+            },
+        ).fetchall()
+    except Exception:
+        db.session.rollback()
+        raise
+    else:
+        db.session.commit()
+        return [{'row': item.row, 'id': item.id} for item in created]
+
+
+def onboard_customers(
+        _format: str,
+        lines: Iterable[str],
+        chunk_size: int,
+) -> Iterator[str]:
+    # Input is read, validated and inserted chunk by chunk, every chunk in
+    # its own transaction. Rows are numbered from 1 in the input order, the
+    # mapping of a chunk is yielded only after its commit, so a client can
+    # resume an interrupted upload after the last mapped row.
+    records = enumerate(read_records(_format, lines), 1)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        valid, rejected = validate_records(chunk)
+        mapping = create_customers(valid) + rejected
+        mapping.sort(key=lambda item: item['row'])
+        yield ''.join(json.dumps(item) + '\n' for item in mapping)
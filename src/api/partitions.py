@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import re
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import text
+
+from src.extensions import db
+
+
+PARTITIONS_STATEMENT = text('''
+SELECT
+    child.relname AS name,
+    pg_get_expr(child.relpartbound, child.oid) AS bound
+FROM pg_inherits
+JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+WHERE parent.relname = 'operations'
+''')
+BOUND_PATTERN = re.compile(r"FROM \((.+)\) TO \((.+)\)")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class Partition(NamedTuple):
+    name: str
+    start: Optional[datetime]
+    end: Optional[datetime]
+
+    @property
+    def default(self) -> bool:
+        return self.start is None and self.end is None
+
+    def covers(self, value: datetime) -> bool:
+        if self.default:
+            return False
+        return (self.start is None or self.start <= value) and \
+            (self.end is None or value < self.end)
+
+
+def parse_bound(bound: str) -> Optional[datetime]:
+    if bound in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return datetime.fromisoformat(bound.strip("'"))
+
+
+def month_start(value: datetime, months: int = 0) -> datetime:
+    month = value.year * 12 + value.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def operations_partitions() -> List[Partition]:
+    # pylint: disable=no-member
+    partitions = []
+    for row in db.session.execute(PARTITIONS_STATEMENT):
+        match = BOUND_PATTERN.search(row.bound)
+        if match:
+            start, end = map(parse_bound, match.groups())
+            partitions.append(Partition(row.name, start, end))
+        else:
+            partitions.append(Partition(row.name, None, None))
+    return sorted(partitions, key=lambda p: (p.start or datetime.min))
+
+
+def create_partitions(
+        months_ahead: int,
+        now: Optional[datetime] = None,
+) -> List[str]:
+    # pylint: disable=no-member
+    # Rows that already landed in the default partition for a new month are
+    # moved into it before it's attached.
+    partitions = operations_partitions()
+    current = month_start(now or datetime.utcnow())
+    created = []
+    for months in range(months_ahead + 1):
+        start = month_start(current, months)
+        if any(partition.covers(start) for partition in partitions):
+            continue
+        end = month_start(start, 1)
+        name = f'operations_{start:%Y_%m}'
+        db.session.execute(
+            text(
+                f'CREATE TABLE "{name}" '
+                '(LIKE operations INCLUDING DEFAULTS)'
+            ),
+        )
+        if any(partition.default for partition in partitions):
+            db.session.execute(
+                text(
+                    'WITH moved AS ('
+                    'DELETE FROM operations_default '
+                    'WHERE processed_at >= :start AND processed_at < :end '
+                    'RETURNING *'
+                    f') INSERT INTO "{name}" SELECT * FROM moved'
+                ),
+                {'start': start, 'end': end},
+            )
+        db.session.execute(
+            text(
+                f'ALTER TABLE operations ATTACH PARTITION "{name}" '
+                f"FOR VALUES FROM ('{start.isoformat()}') "
+                f"TO ('{end.isoformat()}')"
+            ),
+        )
+        db.session.commit()
+        partitions.append(Partition(name, start, end))
+        created.append(name)
+    return created
+
+
+def sync_directory(directory: str):
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def archive_partitions(before: datetime, directory: str) -> List[str]:
+    # pylint: disable=no-member
+    # Every partition ending not later than ``before`` is copied into a
+    # gzipped CSV file, then detached and dropped. Old partitions don't
+    # change, so the copy is taken without locking ``operations``; DETACH
+    # locks it exclusively only for the short transaction that checks
+    # nothing was added since, puts the file in place and drops the
+    # partition. DETACH CONCURRENTLY can't be used next to a default
+    # partition.
+    archived = []
+    for partition in operations_partitions():
+        if partition.default or partition.end is None \
+                or partition.end > before:
+            continue
+        path = os.path.join(directory, f'{partition.name}.csv.gz')
+        temporary = f'{path}.tmp'
+        try:
+            cursor = db.session.connection().connection.cursor()
+            with open(temporary, 'wb') as stream:
+                with gzip.GzipFile(
+                        os.path.basename(path), 'wb', fileobj=stream,
+                ) as archive:
+                    cursor.copy_expert(
+                        f'COPY "{partition.name}" TO STDOUT '
+                        'WITH (FORMAT csv, HEADER)',
+                        archive,
+                    )
+                stream.flush()
+                os.fsync(stream.fileno())
+            copied = cursor.rowcount
+            db.session.commit()
+
+            db.session.execute(
+                text(
+                    'ALTER TABLE operations '
+                    f'DETACH PARTITION "{partition.name}"'
+                ),
+            )
+            count = db.session.execute(
+                text(f'SELECT count(*) FROM "{partition.name}"'),
+            ).scalar()
+            if count != copied:
+                raise ArchiveError(
+                    f'{partition.name} changed while archived: '
+                    f'{copied} rows copied, {count} found',
+                )
+            # The drop is only committed once the file is durably in place.
+            os.rename(temporary, path)
+            sync_directory(directory)
+            db.session.execute(text(f'DROP TABLE "{partition.name}"'))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # A renamed archive is kept: a failed commit may still have
+            # dropped the partition.
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        archived.append(path)
+    return archived
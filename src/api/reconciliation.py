@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+
+from config import CONFIG
+from src.extensions import db
+
+
+# (wallet_id, shard) of an operations chain.
+Chain = Tuple[int, int]
+
+
+class Problem(NamedTuple):
+    kind: str
+    wallet_id: Optional[int]
+    shard: Optional[int]
+    operation_id: Optional[int]
+    transaction: Optional[str]
+    expected: Optional[int]
+    actual: Optional[int]
+
+    def __str__(self) -> str:
+        where = ' '.join(
+            f'{name}={getattr(self, name)}'
+            for name in ('wallet_id', 'shard', 'operation_id', 'transaction')
+            if getattr(self, name) is not None
+        )
+        return (
+            f'{self.kind}: {where} expected={self.expected} '
+            f'actual={self.actual}'
+        )
+
+
+class Task(NamedTuple):
+    # Chains of wallets in [wallet_from, wallet_to] and transactions of
+    # operations in (operation_from, operation_to], all limited to
+    # operations in (watermark, horizon].
+    watermark: int
+    horizon: int
+    wallet_from: int
+    wallet_to: int
+    operation_from: int
+    operation_to: int
+    batch_size: int
+
+
+class TaskResult(NamedTuple):
+    operations: int
+    chains: int
+    problems: List[Problem]
+
+
+class LedgerCheck(NamedTuple):
+    watermark: int
+    horizon: int
+    operations: int
+    chains: int
+    problems: List[Problem]
+
+
+# Operations of a wallet chain are ordered by id: ids are taken under the
+# wallet (or shard) row lock, unlike processed_at of the CTE transfer.
+CHAIN_OPERATIONS_STATEMENT = text('''
+SELECT id, wallet_id, shard, amount_was, amount_become, operation_amount
+FROM operations
+WHERE id > :watermark AND id <= :horizon
+    AND wallet_id BETWEEN :wallet_from AND :wallet_to
+ORDER BY wallet_id, shard, id
+''')
+
+LOAD_CHAINS_STATEMENT = text('''
+SELECT ledger_chains.wallet_id, ledger_chains.shard,
+    ledger_chains.operation_id, ledger_chains.amount
+FROM ledger_chains
+JOIN unnest(CAST(:wallet_ids AS integer[]), CAST(:shards AS integer[]))
+    AS chain(wallet_id, shard)
+    ON chain.wallet_id = ledger_chains.wallet_id
+    AND chain.shard = ledger_chains.shard
+''')
+
+SAVE_CHAINS_STATEMENT = text('''
+INSERT INTO ledger_chains (wallet_id, shard, operation_id, amount)
+SELECT * FROM unnest(
+    CAST(:wallet_ids AS integer[]),
+    CAST(:shards AS integer[]),
+    CAST(:operation_ids AS integer[]),
+    CAST(:amounts AS integer[])
+)
+ON CONFLICT (wallet_id, shard) DO UPDATE SET
+    operation_id = EXCLUDED.operation_id,
+    amount = EXCLUDED.amount
+''')
+
+# The end of a chain must be the amount of its wallet (shard 0) or shard
+# row, unless the wallet already has operations past the horizon or entries
+# not yet materialized from the journal: the amount includes both. It's one
+# statement, so wallets, operations and the journal are read from the same
+# snapshot.
+CHECK_BALANCES_STATEMENT = text('''
+WITH chain AS (
+    SELECT * FROM unnest(
+        CAST(:wallet_ids AS integer[]),
+        CAST(:shards AS integer[]),
+        CAST(:amounts AS integer[])
+    ) AS chain(wallet_id, shard, amount)
+)
+SELECT
+    chain.wallet_id,
+    chain.shard,
+    chain.amount AS expected,
+    COALESCE(wallets.amount, wallet_shards.amount) AS actual
+FROM chain
+LEFT JOIN wallets
+    ON chain.shard = 0 AND wallets.id = chain.wallet_id
+LEFT JOIN wallet_shards
+    ON chain.shard > 0
+    AND wallet_shards.wallet_id = chain.wallet_id
+    AND wallet_shards.shard = chain.shard
+WHERE COALESCE(wallets.amount, wallet_shards.amount)
+        IS DISTINCT FROM chain.amount
+    AND NOT EXISTS (
+        SELECT 1 FROM operations
+        WHERE operations.wallet_id = chain.wallet_id
+            AND operations.id > :horizon
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM operation_journal
+        WHERE chain.wallet_id = ANY(operation_journal.wallet_ids)
+    )
+''')
+
+# A transfer or a shard sweep nets to zero, a replenishment is a single
+# credit. All rows of a transaction are checked, not only the new ones.
+CHECK_TRANSACTIONS_STATEMENT = text('''
+WITH touched AS (
+    SELECT DISTINCT transaction
+    FROM operations
+    WHERE id > :operation_from AND id <= :operation_to
+)
+SELECT operations.transaction, count(*) AS rows,
+    sum(operations.operation_amount) AS amount
+FROM operations
+JOIN touched ON touched.transaction = operations.transaction
+GROUP BY operations.transaction
+HAVING (count(*) > 1 AND sum(operations.operation_amount) <> 0)
+    OR (count(*) = 1 AND sum(operations.operation_amount) <= 0)
+''')
+
+
+def check_horizon(watermark: int, lag: int) -> int:
+    # pylint: disable=no-member
+    # Operations are checked in id order up to the first one stamped within
+    # the lag: an id below it may still belong to an open transaction as
+    # long as transactions are shorter than half of the lag. Journal entries
+    # have their ids already and the materializer may put off busy wallets
+    # for any time, so the check also stops before the first one pending.
+    cutoff = datetime.utcnow() - timedelta(seconds=lag)
+    row = db.session.execute(
+        text(
+            'SELECT '
+            '(SELECT min(id) FROM operations '
+            'WHERE id > :watermark AND processed_at > :cutoff) AS late, '
+            '(SELECT min(pending.id) FROM operation_journal, '
+            'unnest(operation_ids) AS pending(id)) AS pending, '
+            '(SELECT max(id) FROM operations) AS last'
+        ),
+        {'watermark': watermark, 'cutoff': cutoff},
+    ).fetchone()
+    horizon = max(watermark, row.last or 0)
+    for first in (row.late, row.pending):
+        if first is not None:
+            horizon = min(horizon, first - 1)
+    return horizon
+
+
+def load_chains(chains: List[Chain]) -> Dict[Chain, Tuple[int, int]]:
+    # pylint: disable=no-member
+    rows = db.session.execute(
+        LOAD_CHAINS_STATEMENT,
+        {
+            'wallet_ids': [wallet_id for wallet_id, _ in chains],
+            'shards': [shard for _, shard in chains],
+        },
+    )
+    return {
+        (row.wallet_id, row.shard): (row.operation_id, row.amount)
+        for row in rows
+    }
+
+
+def save_chains(states: Dict[Chain, Tuple[int, int]]):
+    # pylint: disable=no-member
+    if not states:
+        return
+    db.session.execute(
+        SAVE_CHAINS_STATEMENT,
+        {
+            'wallet_ids': [wallet_id for wallet_id, _ in states],
+            'shards': [shard for _, shard in states],
+            'operation_ids': [state[0] for state in states.values()],
+            'amounts': [state[1] for state in states.values()],
+        },
+    )
+
+
+def check_balances(
+        states: Dict[Chain, Tuple[int, int]],
+        horizon: int,
+) -> List[Problem]:
+    # pylint: disable=no-member
+    if not states:
+        return []
+    rows = db.session.execute(
+        CHECK_BALANCES_STATEMENT,
+        {
+            'wallet_ids': [wallet_id for wallet_id, _ in states],
+            'shards': [shard for _, shard in states],
+            'amounts': [state[1] for state in states.values()],
+            'horizon': horizon,
+        },
+    )
+    return [
+        Problem(
+            'balance', row.wallet_id, row.shard, None, None,
+            row.expected, row.actual,
+        )
+        for row in rows
+    ]
+
+
+def check_chains(task: Task) -> Iterator[Tuple[int, int, List[Problem]]]:
+    # pylint: disable=no-member
+    # Operations are streamed from their own connection, chain states are
+    # saved and balances compared once per batch. Only the chain at the end
+    # of a batch is carried over, so memory doesn't depend on the range.
+    connection = db.engine.connect()
+    result = connection\
+        .execution_options(stream_results=True)\
+        .execute(CHAIN_OPERATIONS_STATEMENT, task._asdict())
+    current: Optional[Chain] = None
+    state: Tuple[int, int] = (0, 0)
+    try:
+        while True:
+            rows = result.fetchmany(task.batch_size)
+            known = load_chains([
+                chain
+                for chain in dict.fromkeys(
+                    (row.wallet_id, row.shard) for row in rows
+                )
+                if chain != current
+            ]) if rows else {}
+            finished: Dict[Chain, Tuple[int, int]] = {}
+            problems = []
+            for row in rows:
+                chain = (row.wallet_id, row.shard)
+                if chain != current:
+                    if current is not None:
+                        finished[current] = state
+                    current, state = chain, known.get(chain, (0, 0))
+                if row.id <= state[0]:
+                    # Already checked by an interrupted run.
+                    continue
+                if row.amount_was != state[1]:
+                    problems.append(Problem(
+                        'chain', row.wallet_id, row.shard, row.id, None,
+                        state[1], row.amount_was,
+                    ))
+                if row.amount_become != row.amount_was + row.operation_amount:
+                    problems.append(Problem(
+                        'amount', row.wallet_id, row.shard, row.id, None,
+                        row.amount_was + row.operation_amount,
+                        row.amount_become,
+                    ))
+                state = (row.id, row.amount_become)
+            if not rows and current is not None:
+                finished[current] = state
+            problems.extend(check_balances(finished, task.horizon))
+            save_chains(
+                {**finished, current: state} if current and rows else finished
+            )
+            db.session.commit()
+            yield len(rows), len(finished), problems
+            if not rows:
+                break
+    finally:
+        result.close()
+        connection.close()
+
+
+def check_transactions(task: Task) -> List[Problem]:
+    # pylint: disable=no-member
+    rows = db.session.execute(
+        CHECK_TRANSACTIONS_STATEMENT,
+        {
+            'operation_from': task.operation_from,
+            'operation_to': task.operation_to,
+        },
+    )
+    problems = [
+        Problem(
+            'transaction', None, None, None, str(row.transaction),
+            0 if row.rows > 1 else None, row.amount,
+        )
+        for row in rows
+    ]
+    db.session.rollback()
+    return problems
+
+
+def run_task(task: Task) -> TaskResult:
+    operations, chains, problems = 0, 0, []
+    for batch_operations, batch_chains, batch_problems in check_chains(task):
+        operations += batch_operations
+        chains += batch_chains
+        problems.extend(batch_problems)
+    problems.extend(check_transactions(task))
+    return TaskResult(operations, chains, problems)
+
+
+def split(start: int, stop: int, parts: int) -> List[Tuple[int, int]]:
+    # [start, stop] in up to ``parts`` contiguous ranges.
+    step = max(1, -(-(stop - start + 1) // parts))
+    return [
+        (low, min(stop, low + step - 1))
+        for low in range(start, stop + 1, step)
+    ]
+
+
+def check_ledger(
+        workers: int = 1,
+        lag: Optional[int] = None,
+        batch_size: Optional[int] = None,
+) -> LedgerCheck:
+    # pylint: disable=no-member
+    # Checks operations after the watermark of the last finished run, in
+    # ``workers`` processes over wallet id ranges, and moves the watermark.
+    lag = CONFIG.LEDGER_CHECK_LAG if lag is None else lag
+    batch_size = batch_size or CONFIG.LEDGER_CHECK_BATCH_SIZE
+    started_at = datetime.utcnow()
+    watermark = db.session.execute(
+        text('SELECT COALESCE(max(checked_until), 0) FROM ledger_checks'),
+    ).scalar()
+    horizon = check_horizon(watermark, lag)
+    bounds = db.session.execute(
+        text('SELECT min(id) AS first, max(id) AS last FROM wallets'),
+    ).fetchone()
+    db.session.commit()
+    if horizon <= watermark or bounds.first is None:
+        return LedgerCheck(watermark, horizon, 0, 0, [])
+
+    wallet_ranges = split(bounds.first, bounds.last, workers)
+    operation_ranges = [
+        (low - 1, high)
+        for low, high in split(watermark + 1, horizon, len(wallet_ranges))
+    ]
+    tasks = [
+        Task(watermark, horizon, *wallets, *operations, batch_size)
+        for wallets, operations in zip(wallet_ranges, operation_ranges)
+    ]
+    if len(tasks) == 1:
+        results = [run_task(tasks[0])]
+    else:
+        # Children open their own connections.
+        db.session.remove()
+        db.engine.dispose()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(len(tasks)) as pool:
+            results = pool.map(run_task, tasks)
+
+    # A transaction spanning two operation ranges is reported by both.
+    problems = list(dict.fromkeys(
+        problem for result in results for problem in result.problems
+    ))
+    operations = sum(result.operations for result in results)
+    chains = sum(result.chains for result in results)
+    try:
+        db.session.execute(
+            text(
+                'INSERT INTO ledger_checks (checked_until, operations, '
+                'problems, started_at, finished_at) '
+                'VALUES (:horizon, :operations, :problems, :started_at, '
+                ':finished_at)'
+            ),
+            {
+                'horizon': horizon,
+                'operations': operations,
+                'problems': len(problems),
+                'started_at': started_at,
+                'finished_at': datetime.utcnow(),
+            },
+        )
+    except Exception:
+        db.session.rollback()
+        raise
+    else:
+        db.session.commit()
+    return LedgerCheck(watermark, horizon, operations, chains, problems)
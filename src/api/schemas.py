@@ -1,23 +1,202 @@
 # -*- coding: utf-8 -*-
+from datetime import datetime, timezone
 from functools import wraps
+from typing import (
+    Any, Callable, Literal, NamedTuple, Optional, Tuple, Type,
+)
 
 from flask import request
-from pydantic import BaseModel, Field, conint, constr, root_validator
+from pydantic import (
+    BaseConfig, BaseModel, Extra, Field, conlist, constr, root_validator,
+    validator,
+)
+from pydantic.fields import SHAPE_SINGLETON, ModelField
+from pydantic.types import ConstrainedInt, ConstrainedList, ConstrainedStr
 
+from config import CONFIG
+from src.utils import decode_cursor
+
+
+MISSING = object()
+
+
+class FastField(NamedTuple):
+    field: ModelField
+    type_: type
+    minimum: Optional[int]
+    maximum: Optional[int]
+    items: Optional[Callable[[Any], Optional[dict]]] = None
+
+
+def compile_field(
+        field: ModelField,
+        config: BaseConfig,
+) -> Optional[FastField]:
+    # Plain and constrained int and str fields and constrained lists of
+    # schemas are supported. Bounds are kept as the smallest and largest
+    # value for int and length for str and list.
+    type_ = field.outer_type_
+    if isinstance(type_, type) and issubclass(type_, ConstrainedList) \
+            and issubclass(type_.item_type, BaseModel) \
+            and field.alias == field.name and not field.post_validators:
+        items = compile_schema(type_.item_type)
+        if items is None:
+            return None
+        return FastField(
+            field, list, type_.min_items, type_.max_items, items,
+        )
+    if not isinstance(type_, type) or field.shape != SHAPE_SINGLETON \
+            or field.sub_fields or field.class_validators \
+            or field.pre_validators or field.post_validators \
+            or field.alias != field.name or field.validate_always \
+            or getattr(type_, 'strict', False):
+        return None
+    if type_ is int or issubclass(type_, ConstrainedInt) \
+            and not type_.multiple_of:
+        bounds = getattr(type_, 'ge', None), getattr(type_, 'le', None)
+        if getattr(type_, 'gt', None) is not None:
+            bounds = type_.gt + 1, bounds[1]
+        if getattr(type_, 'lt', None) is not None:
+            bounds = bounds[0], type_.lt - 1
+        base = int
+    elif type_ is str or issubclass(type_, ConstrainedStr) \
+            and not type_.strip_whitespace and not type_.curtail_length \
+            and not type_.regex:
+        if config.anystr_strip_whitespace:
+            return None
+        bounds = (
+            getattr(type_, 'min_length', None) or config.min_anystr_length,
+            getattr(type_, 'max_length', None) or config.max_anystr_length,
+        )
+        base = str
+    else:
+        return None
+    return FastField(field, base, *bounds)
+
+
+def compile_schema(
+        schema: Type[BaseModel],
+) -> Optional[Callable[[Any], Optional[dict]]]:
+    # Builds a validator that returns the ``.dict()`` of the schema for
+    # payloads whose values already have the exact field types and pass the
+    # field constraints, and None for anything else: coercion and error
+    # reporting are left to pydantic. None is returned for schemas with
+    # validators or fields it can't check.
+    config = schema.__config__
+    if schema.__validators__ or schema.__pre_root_validators__ \
+            or schema.__post_root_validators__ or config.validate_all \
+            or config.extra == Extra.allow:
+        return None
+    fields = tuple(
+        compile_field(field, config) for field in schema.__fields__.values()
+    )
+    if None in fields:
+        return None
+    names = frozenset(schema.__fields__)
+    forbid = config.extra == Extra.forbid
+
+    def fast_validate(data: Any) -> Optional[dict]:
+        # pylint: disable=unidiomatic-typecheck
+        if type(data) is not dict or forbid and not names.issuperset(data):
+            return None
+        values = {}
+        for field, type_, minimum, maximum, items in fields:
+            value = data.get(field.name, MISSING)
+            if value is MISSING:
+                if field.required:
+                    return None
+                values[field.name] = field.get_default()
+                continue
+            # Exact types only, pydantic converts bools and other subclasses.
+            if type(value) is not type_:
+                return None
+            size = value if type_ is int else len(value)
+            if minimum is not None and size < minimum \
+                    or maximum is not None and size > maximum:
+                return None
+            if items is not None:
+                checked = []
+                for item in value:
+                    item = items(item)
+                    if item is None:
+                        return None
+                    checked.append(item)
+                value = checked
+            values[field.name] = value
+        return values
+
+    return fast_validate
+
+
+def validate(schema: BaseModel, location: str = 'json'):
+    # JSON bodies go through the compiled validator first, pydantic only
+    # sees the payloads it rejects, so errors keep the shape of error400.
+    fast_validate = compile_schema(schema) if location == 'json' else None
 
-def validate(schema: BaseModel):
     def closure(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            data = schema(**(request.get_json(silent=True) or dict())).dict()
-            request.valid_json = data
+            if location == 'args':
+                request.valid_args = schema(**request.args.to_dict()).dict()
+            else:
+                payload = request.get_json(silent=True) or dict()
+                data = fast_validate(payload) if fast_validate else None
+                if data is None:
+                    data = schema(**payload).dict()
+                request.valid_json = data
             return func(*args, **kwargs)
         return wrapper
     return closure
 
 
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # processed_at is stored as naive UTC.
+    if value and value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
 class CustomerSchema(BaseModel):
-    name: str
+    name: constr(max_length=256)
+
+    class Config:
+        extra = 'forbid'
+
+
+class CustomersLookupSchema(BaseModel):
+    ids: conlist(
+        int,
+        min_items=1,
+        max_items=CONFIG.CUSTOMERS_LOOKUP_MAX_SIZE,
+    )
+
+    class Config:
+        extra = 'forbid'
+
+
+class CustomersSearchQuerySchema(BaseModel):
+    q: constr(strip_whitespace=True, min_length=1, max_length=256)
+    mode: Literal['prefix', 'fuzzy'] = 'prefix'
+    limit: int = Field(50, ge=1, le=CONFIG.CUSTOMERS_SEARCH_PAGE_MAX_SIZE)
+    # (name, id) of the last prefix match or (similarity, id) of the last
+    # fuzzy one.
+    cursor: Optional[Tuple[Any, int]]
+
+    @validator('cursor', pre=True)
+    def decode(cls, value):
+        # pylint: disable=no-self-argument,no-self-use
+        return decode_cursor(value) if isinstance(value, str) else value
+
+    @root_validator(skip_on_failure=True)
+    def check_cursor(cls, values):
+        # pylint: disable=no-self-argument,no-self-use
+        cursor = values.get('cursor')
+        if cursor is None:
+            return values
+        key_type = str if values['mode'] == 'prefix' else float
+        if not isinstance(cursor[0], key_type):
+            raise ValueError('invalid cursor')
+        return values
 
     class Config:
         extra = 'forbid'
@@ -36,3 +215,71 @@ class TransferSchema(BaseModel):
 
     class Config:
         extra = 'forbid'
+
+
+class TransferItemSchema(BaseModel):
+    sender_id: int
+    customer_id: int
+    amount: int = Field(..., ge=1)
+
+    class Config:
+        extra = 'forbid'
+
+
+class TransferBatchSchema(BaseModel):
+    transfers: conlist(
+        TransferItemSchema,
+        min_items=1,
+        max_items=CONFIG.TRANSFER_BATCH_MAX_SIZE,
+    )
+
+    class Config:
+        extra = 'forbid'
+
+
+class OperationsQuerySchema(BaseModel):
+    limit: int = Field(50, ge=1, le=CONFIG.OPERATIONS_PAGE_MAX_SIZE)
+    cursor: Optional[Tuple[datetime, int]]
+    since: Optional[datetime]
+    until: Optional[datetime]
+    sign: Optional[Literal['credit', 'debit']]
+
+    @validator('cursor', pre=True)
+    def decode(cls, value):
+        # pylint: disable=no-self-argument,no-self-use
+        return decode_cursor(value) if isinstance(value, str) else value
+
+    _since_until = \
+        validator('since', 'until', allow_reuse=True)(to_naive_utc)
+
+    class Config:
+        extra = 'forbid'
+
+
+class BalanceQuerySchema(BaseModel):
+    at: Optional[datetime]
+
+    _at = validator('at', allow_reuse=True)(to_naive_utc)
+
+    class Config:
+        extra = 'forbid'
+
+
+class ExportQuerySchema(BaseModel):
+    format: Literal['ndjson', 'csv'] = 'ndjson'
+    since: Optional[datetime]
+    until: Optional[datetime]
+    wallet_id: Optional[int]
+
+    _since_until = \
+        validator('since', 'until', allow_reuse=True)(to_naive_utc)
+
+    class Config:
+        extra = 'forbid'
+
+
+class OnboardingQuerySchema(BaseModel):
+    format: Literal['ndjson', 'csv'] = 'ndjson'
+
+    class Config:
+        extra = 'forbid'
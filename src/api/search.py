@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import (
+    Float, and_, cast, false, func, or_, select, text, tuple_,
+)
+from sqlalchemy.engine import RowProxy
+from sqlalchemy.sql import Select
+
+from src.extensions import db
+
+from .models import CustomerModel
+
+
+# Per process: whether the database has pg_trgm, see the name search
+# migration.
+_trigram: Optional[bool] = None
+
+
+def trigram_enabled() -> bool:
+    # pylint: disable=no-member
+    global _trigram  # pylint: disable=global-statement
+    if _trigram is None:
+        _trigram = bool(db.session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"),
+        ).scalar())
+    return _trigram
+
+
+def escape_like(value: str) -> str:
+    return value\
+        .replace('\\', '\\\\')\
+        .replace('%', '\\%')\
+        .replace('_', '\\_')
+
+
+def search_query(
+        q: str,
+        mode: str,
+        limit: int,
+        cursor: Optional[Tuple[Any, int]] = None,
+) -> Select:
+    # (id, name, cursor key) rows, one more than ``limit``. Prefix matches
+    # go in name order over ix_customers_name_prefix, fuzzy ones from the
+    # most similar over ix_customers_name_trgm. Both only look at customers
+    # that aren't deleted, as the indexes do.
+    name = func.lower(CustomerModel.name)
+    if mode == 'prefix':
+        key = name.collate('C')
+        query = select([CustomerModel.id, CustomerModel.name, key])\
+            .where(key.like(func.lower(escape_like(q) + '%'), escape='\\'))\
+            .order_by(key, CustomerModel.id)
+        if cursor:
+            query = query.where(
+                tuple_(key, CustomerModel.id) > tuple_(*cursor),
+            )
+    else:
+        if trigram_enabled():
+            key = func.word_similarity(func.lower(q), name)
+            match = func.lower(q).op('<%')(name)
+        else:
+            key = cast(1, Float(precision=24))
+            match = func.strpos(name, func.lower(q)) > 0
+        query = select([CustomerModel.id, CustomerModel.name, key])\
+            .where(match)\
+            .order_by(key.desc(), CustomerModel.id)
+        if cursor:
+            similarity = cast(cursor[0], Float(precision=24))
+            query = query.where(or_(
+                key < similarity,
+                and_(key == similarity, CustomerModel.id > cursor[1]),
+            ))
+    return query\
+        .where(CustomerModel.deleted == false())\
+        .limit(limit + 1)
+
+
+def search_customers(
+        q: str,
+        mode: str,
+        limit: int,
+        cursor: Optional[Tuple[Any, int]] = None,
+) -> Tuple[List[RowProxy], Optional[Tuple[Any, int]]]:
+    # pylint: disable=no-member
+    # A page of customers and the cursor of the next one.
+    rows = db.session.execute(search_query(q, mode, limit, cursor)).fetchall()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = (page[-1][2], page[-1].id)
+    return page, next_cursor
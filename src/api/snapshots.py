@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import RowProxy
+
+from config import CONFIG
+from src.extensions import db
+
+
+# A run snapshots only the wallets with operations since the previous run:
+# their new amount is the previous snapshot plus those operations. The run
+# total is kept the same way, so neither needs a scan of the whole history.
+# Journal entries count as well: the materializer skips busy wallets, so an
+# entry may still be in the journal long after the run covers it.
+TAKE_SNAPSHOT_STATEMENT = text('''
+WITH changed AS (
+    SELECT wallet_id, sum(operation_amount) AS amount
+    FROM operations_merged
+    WHERE processed_at > COALESCE(CAST(:since AS timestamp), '-infinity')
+        AND processed_at <= :taken_at
+    GROUP BY wallet_id
+),
+inserted AS (
+    INSERT INTO wallet_snapshots (wallet_id, taken_at, amount)
+    SELECT
+        changed.wallet_id,
+        :taken_at,
+        COALESCE(previous.amount, 0) + changed.amount
+    FROM changed
+    LEFT JOIN LATERAL (
+        SELECT amount FROM wallet_snapshots
+        WHERE wallet_snapshots.wallet_id = changed.wallet_id
+        ORDER BY taken_at DESC
+        LIMIT 1
+    ) AS previous ON true
+    RETURNING wallet_id
+)
+INSERT INTO snapshot_runs (taken_at, total, wallets, created_at)
+SELECT
+    :taken_at,
+    :total + COALESCE((SELECT sum(amount) FROM changed), 0),
+    (SELECT count(*) FROM inserted),
+    now() AT TIME ZONE 'utc'
+RETURNING taken_at, total, wallets
+''')
+
+# Operations after the snapshot are read with the journal entries not yet
+# materialized.
+BALANCE_AT_STATEMENT = text('''
+WITH wallet AS (
+    SELECT wallets.id
+    FROM wallets
+    JOIN customers ON customers.id = wallets.customer_id
+    WHERE customers.deleted = false AND customers.id = :customer_id
+),
+snapshot AS (
+    SELECT taken_at, amount
+    FROM wallet_snapshots
+    WHERE wallet_id = (SELECT id FROM wallet) AND taken_at <= :at
+    ORDER BY taken_at DESC
+    LIMIT 1
+)
+SELECT
+    COALESCE((SELECT amount FROM snapshot), 0) + COALESCE((
+        SELECT sum(operation_amount)
+        FROM operations_merged
+        WHERE wallet_id = wallet.id
+            AND processed_at > COALESCE(
+                (SELECT taken_at FROM snapshot), '-infinity'
+            )
+            AND processed_at <= :at
+    ), 0) AS amount
+FROM wallet
+''')
+
+LIABILITIES_AT_STATEMENT = text('''
+WITH run AS (
+    SELECT taken_at, total
+    FROM snapshot_runs
+    WHERE taken_at <= :at
+    ORDER BY taken_at DESC
+    LIMIT 1
+)
+SELECT
+    (SELECT taken_at FROM run) AS snapshot_at,
+    COALESCE((SELECT total FROM run), 0) + COALESCE((
+        SELECT sum(operation_amount)
+        FROM operations_merged
+        WHERE processed_at > COALESCE(
+                (SELECT taken_at FROM run), '-infinity'
+            )
+            AND processed_at <= :at
+    ), 0) AS amount
+''')
+
+
+def take_snapshot(
+        now: Optional[datetime] = None,
+        lag: Optional[int] = None,
+) -> Optional[RowProxy]:
+    # pylint: disable=no-member
+    # processed_at is stamped before the commit, so a run only covers
+    # operations older than the lag: transactions still open by then would
+    # be missed by it. Returns None when the previous run is newer.
+    lag = CONFIG.SNAPSHOT_LAG if lag is None else lag
+    taken_at = (now or datetime.utcnow()) - timedelta(seconds=lag)
+    try:
+        db.session.execute(
+            text('LOCK TABLE snapshot_runs IN SHARE ROW EXCLUSIVE MODE'),
+        )
+        previous = db.session.execute(
+            text(
+                'SELECT taken_at, total FROM snapshot_runs '
+                'ORDER BY taken_at DESC LIMIT 1'
+            ),
+        ).fetchone()
+        if previous and previous.taken_at >= taken_at:
+            run = None
+        else:
+            run = db.session.execute(
+                TAKE_SNAPSHOT_STATEMENT,
+                {
+                    'since': previous.taken_at if previous else None,
+                    'total': previous.total if previous else 0,
+                    'taken_at': taken_at,
+                },
+            ).fetchone()
+    except Exception:
+        db.session.rollback()
+        raise
+    else:
+        db.session.commit()
+        return run
+
+
+def balance_at(customer_id: int, at: datetime) -> Optional[int]:
+    # pylint: disable=no-member
+    # None when the customer doesn't exist.
+    row = db.session.execute(
+        BALANCE_AT_STATEMENT, {'customer_id': customer_id, 'at': at},
+    ).fetchone()
+    return row.amount if row else None
+
+
+def liabilities_at(at: datetime) -> RowProxy:
+    # pylint: disable=no-member
+    return db.session.execute(LIABILITIES_AT_STATEMENT, {'at': at}).fetchone()
@@ -1,21 +1,45 @@
 # -*- coding: utf-8 -*-
+import codecs
+from datetime import datetime
+from typing import Tuple
 from uuid import uuid4
 
 import status
-from flask import Blueprint, abort, request
+from flask import (
+    Blueprint, Response, abort, current_app, request, stream_with_context,
+)
 from flask.views import MethodView
-from sqlalchemy import false, update
-from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy import false, select, tuple_
 
+from src import ledger
 from src.exceptions import (
-    RecipientNotExistError, SenderNotEnoughMoneyError, SenderNotExistError,
+    BillingError, RecipientNotExistError, SenderNotEnoughMoneyError,
+    SenderNotExistError,
 )
 from src.extensions import db
+from src.metrics import count_error
+from src.utils import encode_cursor
 
-from .models import CustomerModel, WalletModel, register_operation
+from .balances import (
+    cached_customer, lookup_customers, notify_customers,
+)
+from .export import EXPORT_MIMETYPES, export_operations
+from .group_commit import group_committer
+from .idempotency import idempotent, remember_response
+from .journal import journal_enabled
+from .models import (
+    CustomerModel, OperationModel, WalletModel, operations_merged,
+)
+from .onboarding import onboard_customers
 from .schemas import (
-    CustomerSchema, ReplenishmentSchema, TransferSchema, validate,
+    BalanceQuerySchema, CustomerSchema, CustomersLookupSchema,
+    CustomersSearchQuerySchema, ExportQuerySchema, OnboardingQuerySchema,
+    OperationsQuerySchema, ReplenishmentSchema, TransferBatchSchema,
+    TransferSchema, validate,
 )
+from .search import search_customers
+from .snapshots import balance_at, liabilities_at
+from .wallets import PostgresLedger, transfer_statement
 
 
 blueprint_v1 = Blueprint('v1', __name__, url_prefix='/v1')
@@ -24,14 +48,10 @@ blueprint_v1 = Blueprint('v1', __name__, url_prefix='/v1')
 class CustomerIndex(MethodView):
     def get(self, customer_id: int):
         # pylint: disable=no-self-use,no-member
-        try:
-            customer = CustomerModel\
-                .query\
-                .filter_by(id=customer_id, deleted=False)\
-                .one()
-        except NoResultFound:
+        customer = cached_customer(customer_id)
+        if customer is None:
             abort(status.HTTP_404_NOT_FOUND)
-        return {'id': customer.id, 'name': customer.name}
+        return {'id': customer_id, 'name': customer.name}
 
     @validate(CustomerSchema)
     def put(self, customer_id: int):
@@ -41,6 +61,7 @@ class CustomerIndex(MethodView):
                 .query\
                 .filter_by(id=customer_id, deleted=False)\
                 .update({'name': request.valid_json['name']})
+            notify_customers((customer_id,))
         except Exception:
             db.session.rollback()
             raise
@@ -57,6 +78,7 @@ class CustomerIndex(MethodView):
                 .query\
                 .filter_by(id=customer_id, deleted=False)\
                 .update({'deleted': True})
+            notify_customers((customer_id,))
         except Exception:
             db.session.rollback()
             raise
@@ -93,115 +115,322 @@ blueprint_v1.add_url_rule(
 )
 
 
+@blueprint_v1.route('/customers', methods=['GET'])
+@validate(CustomersSearchQuerySchema, location='args')
+def customers_search():
+    params = request.valid_args
+    page, next_cursor = search_customers(
+        params['q'], params['mode'], params['limit'], params['cursor'],
+    )
+    return {
+        'customers': [{'id': row.id, 'name': row.name} for row in page],
+        'next_cursor': encode_cursor(*next_cursor) if next_cursor else None,
+    }
+
+
+@blueprint_v1.route('/customers/bulk', methods=['POST'])
+@validate(OnboardingQuerySchema, location='args')
+def customers_bulk():
+    # The body is read while the response is written: the id mapping of a
+    # chunk goes out as soon as the chunk is committed.
+    mapping = onboard_customers(
+        request.valid_args['format'],
+        codecs.iterdecode(request.stream, 'utf-8'),
+        current_app.config['ONBOARDING_CHUNK_SIZE'],
+    )
+    return Response(
+        stream_with_context(mapping),
+        mimetype='application/x-ndjson',
+    )
+
+
+@blueprint_v1.route('/customers/lookup', methods=['POST'])
+@validate(CustomersLookupSchema)
+def customers_lookup():
+    # Customers come in the order of the requested ids, duplicates once.
+    ids = list(dict.fromkeys(request.valid_json['ids']))
+    found = lookup_customers(ids)
+    return {
+        'customers': [found[_id]._asdict() for _id in ids if _id in found],
+        'missing': [_id for _id in ids if _id not in found],
+    }
+
+
+@blueprint_v1.route('/customer/<int:customer_id>/balance', methods=['GET'])
+@validate(BalanceQuerySchema, location='args')
+def balance(customer_id: int):
+    at = request.valid_args['at']
+    if at is not None:
+        amount = balance_at(customer_id, at)
+        if amount is None:
+            abort(status.HTTP_404_NOT_FOUND)
+        return {'id': customer_id, 'amount': amount, 'at': at.isoformat()}
+
+    customer = cached_customer(customer_id)
+    if customer is None:
+        abort(status.HTTP_404_NOT_FOUND)
+    return {'id': customer_id, 'amount': customer.amount}
+
+
+@blueprint_v1.route('/reports/liabilities', methods=['GET'])
+@validate(BalanceQuerySchema, location='args')
+def liabilities():
+    at = request.valid_args['at'] or datetime.utcnow()
+    report = liabilities_at(at)
+    return {
+        'at': at.isoformat(),
+        'amount': report.amount,
+        'snapshot_at': (
+            report.snapshot_at.isoformat() if report.snapshot_at else None
+        ),
+    }
+
+
+@blueprint_v1.route('/customer/<int:customer_id>/operations', methods=['GET'])
+@validate(OperationsQuerySchema, location='args')
+def operations(customer_id: int):
+    # pylint: disable=no-member
+    params = request.valid_args
+    wallet_id = db.session.execute(
+        select([WalletModel.id])
+        .where(CustomerModel.id == WalletModel.customer_id)
+        .where(CustomerModel.deleted == false())
+        .where(CustomerModel.id == customer_id),
+    ).scalar()
+    if wallet_id is None:
+        abort(status.HTTP_404_NOT_FOUND)
+
+    # Newest first, the (wallet_id, processed_at, id) index is scanned
+    # backwards starting right after the cursor.
+    operations_ = \
+        operations_merged if journal_enabled() else OperationModel.__table__
+    query = select([
+        operations_.c.id,
+        operations_.c.transaction,
+        operations_.c.amount_was,
+        operations_.c.amount_become,
+        operations_.c.operation_amount,
+        operations_.c.processed_at,
+        operations_.c.shard,
+    ])\
+        .where(operations_.c.wallet_id == wallet_id)\
+        .order_by(
+            operations_.c.processed_at.desc(), operations_.c.id.desc(),
+        )\
+        .limit(params['limit'] + 1)
+    if params['cursor']:
+        query = query.where(
+            tuple_(operations_.c.processed_at, operations_.c.id)
+            < tuple_(*params['cursor']),
+        )
+    if params['since']:
+        query = query.where(operations_.c.processed_at >= params['since'])
+    if params['until']:
+        query = query.where(operations_.c.processed_at < params['until'])
+    if params['sign'] == 'credit':
+        query = query.where(operations_.c.operation_amount > 0)
+    elif params['sign'] == 'debit':
+        query = query.where(operations_.c.operation_amount < 0)
+
+    rows = db.session.execute(query).fetchall()
+    page = rows[:params['limit']]
+    next_cursor = None
+    if len(rows) > params['limit']:
+        next_cursor = encode_cursor(page[-1].processed_at, page[-1].id)
+    return {
+        'operations': [
+            {
+                'id': row.id,
+                'transaction': row.transaction,
+                'amount_was': row.amount_was,
+                'amount_become': row.amount_become,
+                'operation_amount': row.operation_amount,
+                'processed_at': row.processed_at.isoformat(),
+                'shard': row.shard,
+            }
+            for row in page
+        ],
+        'next_cursor': next_cursor,
+    }
+
+
+@blueprint_v1.route('/operations/export', methods=['GET'])
+@validate(ExportQuerySchema, location='args')
+def operations_export():
+    params = request.valid_args
+    chunks = export_operations(
+        params['format'],
+        params['since'],
+        params['until'],
+        params['wallet_id'],
+    )
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_MIMETYPES[params['format']],
+    )
+
+
 @blueprint_v1.route(
     '/customer/<int:customer_id>/replenishment', methods=['POST'],
 )
 @validate(ReplenishmentSchema)
+@idempotent
 def replenishment(customer_id: int):
     # pylint: disable=no-member
     amount = request.valid_json['amount']
+    # An idempotency key is claimed in the request's own transaction, so
+    # such replenishments can't join a group.
+    if current_app.config['REPLENISHMENT_GROUP_COMMIT'] and \
+            request.idempotency_key_id is None:
+        try:
+            transaction, amount_was = \
+                group_committer().submit(customer_id, amount)
+        except SenderNotExistError as error:
+            count_error(error)
+            abort(status.HTTP_404_NOT_FOUND)
+        return {
+            'transaction': transaction,
+            'customer_id': customer_id,
+            'amount_was': amount_was,
+            'amount_become': amount_was + amount,
+            'operation_amount': amount,
+        }
     try:
-        query = update(WalletModel)\
-            .values(amount=WalletModel.amount + amount)\
-            .where(CustomerModel.id == WalletModel.customer_id)\
-            .where(CustomerModel.deleted == false())\
-            .where(CustomerModel.id == customer_id)\
-            .returning(WalletModel.id, WalletModel.amount)
-        wallet = db.session.execute(query).fetchone()
-        if not wallet:
-            raise SenderNotExistError('Sender not exist')
-        amount_was = wallet.amount - amount
-        transaction = \
-            register_operation(wallet.id, amount_was, wallet.amount, amount)
-    except SenderNotExistError:
+        transaction = uuid4()
+        amount_was = ledger.replenish(
+            PostgresLedger(), customer_id, amount, transaction,
+        )
+        response = {
+            'transaction': transaction,
+            'customer_id': customer_id,
+            'amount_was': amount_was,
+            'amount_become': amount_was + amount,
+            'operation_amount': amount,
+        }
+        notify_customers((customer_id,))
+        remember_response(response)
+    except SenderNotExistError as error:
         db.session.rollback()
+        count_error(error)
         abort(status.HTTP_404_NOT_FOUND)
     except Exception:
         db.session.rollback()
         raise
     else:
         db.session.commit()
-        return {
-            'transaction': transaction,
-            'customer_id': customer_id,
-            'amount_was': amount_was,
-            'amount_become': wallet.amount,
+        return response
+
+
+def transfer_orm(sender_id: int, recipient_id: int, amount: int):
+    return ledger.transfer(
+        PostgresLedger(), sender_id, recipient_id, amount, uuid4(),
+    )
+
+
+def transfer_cte(sender_id: int, recipient_id: int, amount: int):
+    transaction = uuid4()
+    result = transfer_statement(sender_id, recipient_id, amount, transaction)
+
+    if not result.sender_wallet_id:
+        raise SenderNotExistError('Sender not exist')
+    if not result.recipient_wallet_id:
+        raise RecipientNotExistError(
+            f"Customer {recipient_id} doesn't exist",
+        )
+    if result.sender_shards or result.recipient_shards:
+        return transfer_orm(sender_id, recipient_id, amount)
+    if result.sender_amount_was is None:
+        raise SenderNotEnoughMoneyError(
+            f"Customer {sender_id} doesn't have enough money",
+        )
+    return ledger.Transfer(
+        transaction, result.sender_amount_was, result.recipient_amount_was,
+    )
+
+
+def transfer_response(
+        item: Tuple[int, int, int],
+        result: ledger.Transfer,
+) -> dict:
+    sender_id, recipient_id, amount = item
+    return {
+        'transaction': result.transaction,
+        'sender': {
+            'customer_id': sender_id,
+            'amount_was': result.sender_amount_was,
+            'amount_become': result.sender_amount_was - amount,
+            'operation_amount': - amount,
+        },
+        'recipient': {
+            'customer_id': recipient_id,
+            'amount_was': result.recipient_amount_was,
+            'amount_become': result.recipient_amount_was + amount,
             'operation_amount': amount,
-        }
+        },
+    }
+
+
+TRANSFER_ENGINES = {
+    'orm': transfer_orm,
+    'cte': transfer_cte,
+}
 
 
 @blueprint_v1.route(
     '/customer/<int:sender_id>/transfer', methods=['POST'],
 )
 @validate(TransferSchema)
+@idempotent
 def transfer(sender_id: int):
     # pylint: disable=no-member
     recipient_id = request.valid_json['customer_id']
     amount = request.valid_json['amount']
+    engine = TRANSFER_ENGINES[current_app.config['TRANSFER_ENGINE']]
     try:
-        wallets = WalletModel\
-            .query\
-            .filter(CustomerModel.deleted == false())\
-            .filter(CustomerModel.id.in_((sender_id, recipient_id)))\
-            .with_for_update()\
-
-        sender_wallet = recipient_wallet = None
-        for wallet in wallets:
-            if wallet.id == sender_id:
-                sender_wallet = wallet
-            elif wallet.id == recipient_id:
-                recipient_wallet = wallet
-
-        if not sender_wallet:
-            raise SenderNotExistError('Sender not exist')
-        if not recipient_wallet:
-            raise RecipientNotExistError(
-                f"Customer {recipient_id} doesn't exist",
-            )
-
-        sender_amount_was = sender_wallet.amount
-        recipient_amount_was = recipient_wallet.amount
-        sender_wallet.amount -= amount
-        recipient_wallet.amount += amount
-
-        if sender_wallet.amount < 0:
-            raise SenderNotEnoughMoneyError(
-                f"Customer {sender_id} doesn't have enough money",
-            )
-        transaction = uuid4()
-        register_operation(
-            sender_wallet.id,
-            sender_wallet.amount + amount,
-            sender_wallet.amount,
-            -amount,
-            transaction,
-        )
-        register_operation(
-            recipient_wallet.id,
-            recipient_wallet.amount - amount,
-            recipient_wallet.amount,
-            amount,
-            transaction,
+        response = transfer_response(
+            (sender_id, recipient_id, amount),
+            engine(sender_id, recipient_id, amount),
         )
-    except SenderNotExistError:
+        notify_customers((sender_id, recipient_id))
+        remember_response(response)
+    except SenderNotExistError as error:
+        db.session.rollback()
+        count_error(error)
         abort(status.HTTP_404_NOT_FOUND)
     except Exception:
         db.session.rollback()
         raise
     else:
         db.session.commit()
+        return response
+
+
+@blueprint_v1.route('/transfers/batch', methods=['POST'])
+@validate(TransferBatchSchema)
+def transfer_batch():
+    # pylint: disable=no-member
+    transfers = [
+        (item['sender_id'], item['customer_id'], item['amount'])
+        for item in request.valid_json['transfers']
+    ]
+    try:
+        results, changed = ledger.transfer_batch(
+            PostgresLedger(), transfers, datetime.utcnow(),
+        )
+        notify_customers(changed)
+    except Exception:
+        db.session.rollback()
+        raise
+    else:
+        db.session.commit()
+        for result in results:
+            if isinstance(result, BillingError):
+                count_error(result)
         return {
-            'transaction': transaction,
-            'sender': {
-                'customer_id': sender_id,
-                'amount_was': sender_amount_was,
-                'amount_become': sender_wallet.amount,
-                'operation_amount': - amount,
-            },
-            'recipient': {
-                'customer_id': recipient_id,
-                'amount_was': recipient_amount_was,
-                'amount_become': recipient_wallet.amount,
-                'operation_amount': amount,
-            }
+            'transfers': [
+                {'status': 'error', 'message': result.msg}
+                if isinstance(result, BillingError) else
+                {'status': 'ok', **transfer_response(item, result)}
+                for item, result in zip(transfers, results)
+            ],
         }
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID, uuid4
+
+from sqlalchemy import false, insert, select, text, update
+from sqlalchemy.engine import RowProxy
+
+from src import ledger
+from src.extensions import db
+from src.ledger import Credit, Ledger, Operation
+
+from .journal import journal_enabled, journal_operations
+from .models import (
+    CustomerModel, OperationModel, WalletModel, register_operation,
+)
+
+
+# Wallet rows are locked in ascending id order, so two transactions locking
+# an overlapping set of wallets can't wait on each other. Sharded wallets
+# of customers that are only credited are left unlocked: credits go to one
+# of their shard rows instead. NO KEY UPDATE doesn't block the key share
+# locks taken by foreign keys of operations inserted for these wallets.
+LOCK_WALLETS_STATEMENT = text('''
+WITH target AS (
+    SELECT wallets.id, wallets.customer_id, wallets.shards
+    FROM wallets
+    JOIN customers ON customers.id = wallets.customer_id
+    WHERE customers.deleted = false
+        AND customers.id = ANY(CAST(:customer_ids AS integer[]))
+),
+locked AS (
+    SELECT wallets.id, wallets.amount
+    FROM wallets
+    WHERE wallets.id IN (
+        SELECT id FROM target
+        WHERE shards = 0
+            OR NOT customer_id = ANY(CAST(:credit_only AS integer[]))
+    )
+    ORDER BY wallets.id
+    FOR NO KEY UPDATE
+)
+SELECT
+    target.id,
+    target.customer_id,
+    target.shards,
+    locked.amount,
+    locked.id IS NOT NULL AS locked
+FROM target
+LEFT JOIN locked ON locked.id = target.id
+''')
+
+
+def lock_wallets(
+        customer_ids: Iterable[int],
+        credit_only: Iterable[int] = (),
+) -> Dict[int, RowProxy]:
+    # pylint: disable=no-member
+    result = db.session.execute(
+        LOCK_WALLETS_STATEMENT,
+        {
+            'customer_ids': list(set(customer_ids)),
+            'credit_only': list(set(credit_only)),
+        },
+    )
+    return {wallet.customer_id: wallet for wallet in result.fetchall()}
+
+
+def update_wallets(amounts: Dict[int, int]):
+    # pylint: disable=no-member
+    if not amounts:
+        return
+    db.session.execute(
+        text(
+            'UPDATE wallets SET amount = batch.amount '
+            'FROM unnest(CAST(:ids AS integer[]), '
+            'CAST(:amounts AS integer[])) AS batch(id, amount) '
+            'WHERE wallets.id = batch.id'
+        ),
+        {'ids': list(amounts), 'amounts': list(amounts.values())},
+    )
+
+
+def shard_for(transaction: UUID, shards: int) -> int:
+    return 1 + transaction.int % shards
+
+
+CREDIT_SHARD_STATEMENT = text('''
+WITH credited AS (
+    UPDATE wallet_shards
+    SET amount = amount + :amount
+    WHERE wallet_id = :wallet_id AND shard = :shard
+    RETURNING amount
+)
+SELECT
+    credited.amount,
+    credited.amount
+        + (SELECT amount FROM wallets WHERE id = :wallet_id)
+        + (
+            SELECT COALESCE(sum(amount), 0) FROM wallet_shards
+            WHERE wallet_id = :wallet_id AND shard <> :shard
+        ) AS total
+FROM credited
+''')
+
+
+def credit_shard(
+        wallet_id: int,
+        shards: int,
+        amount: int,
+        transaction: UUID,
+) -> Credit:
+    # pylint: disable=no-member
+    shard = shard_for(transaction, shards)
+    credited = db.session.execute(
+        CREDIT_SHARD_STATEMENT,
+        {'wallet_id': wallet_id, 'shard': shard, 'amount': amount},
+    ).fetchone()
+    return Credit(wallet_id, shard, credited.amount, credited.total)
+
+
+def credit_wallet(
+        customer_id: int,
+        amount: int,
+        transaction: UUID,
+) -> Optional[Credit]:
+    # pylint: disable=no-member
+    query = update(WalletModel)\
+        .values(amount=WalletModel.amount + amount)\
+        .where(CustomerModel.id == WalletModel.customer_id)\
+        .where(CustomerModel.deleted == false())\
+        .where(CustomerModel.id == customer_id)\
+        .where(WalletModel.shards == 0)\
+        .returning(WalletModel.id, WalletModel.amount)
+    wallet = db.session.execute(query).fetchone()
+    if wallet:
+        return Credit(wallet.id, 0, wallet.amount, wallet.amount)
+
+    query = select([WalletModel.id, WalletModel.shards])\
+        .where(CustomerModel.id == WalletModel.customer_id)\
+        .where(CustomerModel.deleted == false())\
+        .where(CustomerModel.id == customer_id)
+    wallet = db.session.execute(query).fetchone()
+    if not wallet:
+        return None
+    return credit_shard(wallet.id, wallet.shards, amount, transaction)
+
+
+SWEEP_SHARDS_STATEMENT = text('''
+WITH swept AS (
+    SELECT id, shard, amount
+    FROM wallet_shards
+    WHERE wallet_id = :wallet_id AND amount <> 0
+    ORDER BY shard
+    FOR UPDATE
+)
+UPDATE wallet_shards
+SET amount = 0
+FROM swept
+WHERE wallet_shards.id = swept.id
+RETURNING swept.shard, swept.amount
+''')
+
+
+def sweep_shards(wallet_id: int, amount: int) -> int:
+    # pylint: disable=no-member
+    # Moves shard balances into the locked wallet row and returns its new
+    # amount, which is left for the caller to write.
+    shards = db.session.execute(
+        SWEEP_SHARDS_STATEMENT, {'wallet_id': wallet_id},
+    ).fetchall()
+    if not shards:
+        return amount
+
+    operations = ledger.swept(wallet_id, amount, shards, uuid4())
+    PostgresLedger().record(operations)
+    return operations[-1].amount_become
+
+
+def rebalance_wallet(wallet: RowProxy, shards: Optional[int] = None):
+    # pylint: disable=no-member
+    update_wallets({wallet.id: sweep_shards(wallet.id, wallet.amount)})
+    if shards is None:
+        return
+    db.session.execute(
+        update(WalletModel)
+        .where(WalletModel.id == wallet.id)
+        .values(shards=shards),
+    )
+    # Shard rows are never deleted: a credit that picked its shard before
+    # the resharding still finds the row and gets swept by a rebalance.
+    db.session.execute(
+        text(
+            'INSERT INTO wallet_shards (wallet_id, shard, amount) '
+            'SELECT :wallet_id, n, 0 FROM generate_series(1, :shards) AS n '
+            'ON CONFLICT (wallet_id, shard) DO NOTHING'
+        ),
+        {'wallet_id': wallet.id, 'shards': shards},
+    )
+
+
+# ``{register}`` writes both operations, into the operations table or into
+# the journal.
+TRANSFER_SQL = '''
+WITH target AS (
+    SELECT wallets.id, wallets.customer_id, wallets.shards
+    FROM wallets
+    JOIN customers ON customers.id = wallets.customer_id
+    WHERE customers.deleted = false
+        AND customers.id IN (:sender_id, :recipient_id)
+),
+locked AS (
+    SELECT wallets.id, wallets.amount
+    FROM wallets
+    WHERE wallets.id IN (SELECT id FROM target)
+        AND NOT EXISTS (SELECT 1 FROM target WHERE shards > 0)
+    ORDER BY wallets.id
+    FOR NO KEY UPDATE
+),
+sender AS (
+    SELECT target.id, target.shards, locked.amount
+    FROM target
+    LEFT JOIN locked ON locked.id = target.id
+    WHERE target.customer_id = :sender_id
+),
+recipient AS (
+    SELECT target.id, target.shards, locked.amount
+    FROM target
+    LEFT JOIN locked ON locked.id = target.id
+    WHERE target.customer_id = :recipient_id
+),
+allowed AS (
+    SELECT
+        sender.id AS sender_wallet_id,
+        sender.amount AS sender_amount_was,
+        recipient.id AS recipient_wallet_id,
+        CASE
+            WHEN sender.id = recipient.id THEN sender.amount - :amount
+            ELSE recipient.amount
+        END AS recipient_amount_was
+    FROM sender, recipient
+    WHERE sender.amount >= :amount
+),
+moved AS (
+    UPDATE wallets
+    SET amount = wallets.amount
+        - CASE WHEN wallets.id = allowed.sender_wallet_id
+            THEN :amount ELSE 0 END
+        + CASE WHEN wallets.id = allowed.recipient_wallet_id
+            THEN :amount ELSE 0 END
+    FROM allowed
+    WHERE wallets.id IN (
+        allowed.sender_wallet_id, allowed.recipient_wallet_id
+    )
+    RETURNING wallets.id
+),
+registered AS ({register})
+SELECT
+    sender.id AS sender_wallet_id,
+    sender.shards AS sender_shards,
+    recipient.id AS recipient_wallet_id,
+    recipient.shards AS recipient_shards,
+    allowed.sender_amount_was,
+    allowed.recipient_amount_was
+FROM (SELECT 1) AS one
+LEFT JOIN sender ON true
+LEFT JOIN recipient ON true
+LEFT JOIN allowed ON true
+'''
+REGISTER_OPERATIONS = '''
+    INSERT INTO operations (
+        transaction, wallet_id, amount_was, amount_become,
+        operation_amount, processed_at
+    )
+    SELECT
+        CAST(:transaction AS uuid), sender_wallet_id, sender_amount_was,
+        sender_amount_was - :amount, - CAST(:amount AS integer),
+        CAST(:processed_at AS timestamp)
+    FROM allowed
+    UNION ALL
+    SELECT
+        CAST(:transaction AS uuid), recipient_wallet_id, recipient_amount_was,
+        recipient_amount_was + :amount, CAST(:amount AS integer),
+        CAST(:processed_at AS timestamp)
+    FROM allowed
+    RETURNING id
+'''
+# Both operations as one journal row, see journal.py.
+REGISTER_JOURNAL = '''
+    INSERT INTO operation_journal (
+        operation_ids, transactions, wallet_ids, shards, amounts_was,
+        amounts_become, operation_amounts, processed_at
+    )
+    SELECT
+        ARRAY[
+            CAST(nextval('operations_id_seq') AS integer),
+            CAST(nextval('operations_id_seq') AS integer)
+        ],
+        ARRAY[CAST(:transaction AS uuid), CAST(:transaction AS uuid)],
+        ARRAY[sender_wallet_id, recipient_wallet_id],
+        ARRAY[0, 0],
+        ARRAY[sender_amount_was, recipient_amount_was],
+        ARRAY[sender_amount_was - :amount, recipient_amount_was + :amount],
+        ARRAY[- CAST(:amount AS integer), CAST(:amount AS integer)],
+        CAST(:processed_at AS timestamp)
+    FROM allowed
+    RETURNING id
+'''
+TRANSFER_STATEMENT = text(TRANSFER_SQL.format(register=REGISTER_OPERATIONS))
+JOURNAL_TRANSFER_STATEMENT = \
+    text(TRANSFER_SQL.format(register=REGISTER_JOURNAL))
+
+
+def transfer_statement(
+        sender_id: int,
+        recipient_id: int,
+        amount: int,
+        transaction: UUID,
+) -> RowProxy:
+    # pylint: disable=no-member
+    # Balance check, both wallet updates and both operation inserts are done
+    # by the single statement, so wallet rows are locked for one round trip.
+    # Nothing is locked or changed when one of the wallets is sharded, the
+    # caller is expected to fall back to the ORM engine then.
+    return db.session.execute(
+        JOURNAL_TRANSFER_STATEMENT if journal_enabled()
+        else TRANSFER_STATEMENT,
+        {
+            'sender_id': sender_id,
+            'recipient_id': recipient_id,
+            'amount': amount,
+            'transaction': str(transaction),
+            'processed_at': datetime.utcnow(),
+        },
+    ).fetchone()
+
+
+OPERATIONS_INSERT_CHUNK = 1000
+
+
+class PostgresLedger(Ledger):
+    # Ledger rules over the session of the current request.
+
+    def lock(
+            self,
+            customer_ids: Iterable[int],
+            credit_only: Iterable[int] = (),
+    ) -> Dict[int, RowProxy]:
+        return lock_wallets(customer_ids, credit_only)
+
+    def sweep(self, wallet_id: int, amount: int) -> int:
+        return sweep_shards(wallet_id, amount)
+
+    def credit(
+            self,
+            customer_id: int,
+            amount: int,
+            transaction: UUID,
+    ) -> Optional[Credit]:
+        return credit_wallet(customer_id, amount, transaction)
+
+    def credit_shard(
+            self,
+            wallet_id: int,
+            shards: int,
+            amount: int,
+            transaction: UUID,
+    ) -> Credit:
+        return credit_shard(wallet_id, shards, amount, transaction)
+
+    def write(self, amounts: Dict[int, int]):
+        update_wallets(amounts)
+
+    def record(self, operations: List[Operation]):
+        for operation in operations:
+            register_operation(
+                operation.wallet_id,
+                operation.amount_was,
+                operation.amount_become,
+                operation.operation_amount,
+                operation.transaction,
+                shard=operation.shard,
+            )
+
+    def record_many(self, operations: List[Operation], processed_at: datetime):
+        # pylint: disable=no-member
+        rows = [
+            {**operation._asdict(), 'processed_at': processed_at}
+            for operation in operations
+        ]
+        if journal_enabled():
+            journal_operations(rows)
+            return
+        # Swept operations have to get their ids before these ones.
+        db.session.flush()
+        for start in range(0, len(rows), OPERATIONS_INSERT_CHUNK):
+            chunk = rows[start:start + OPERATIONS_INSERT_CHUNK]
+            db.session.execute(insert(OperationModel).values(chunk))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from contextlib import asynccontextmanager
+
+import asyncpg
+import status
+from loguru import logger
+from pydantic import ValidationError
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+from config import CONFIG
+from src import init_logger
+from src.exceptions import BillingError, SenderNotExistError
+
+from .views import routes
+
+
+def error400(_, exc):
+    return JSONResponse(
+        {'status': 'error', 'message': exc.errors()},
+        status_code=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+def error404(*_):
+    return JSONResponse(
+        {'status': 'error', 'message': 'Resource not found.'},
+        status_code=status.HTTP_404_NOT_FOUND,
+    )
+
+
+def error_http(request, exc):
+    if exc.status_code == status.HTTP_404_NOT_FOUND:
+        return error404(request, exc)
+    if exc.status_code == status.HTTP_405_METHOD_NOT_ALLOWED:
+        return JSONResponse(
+            {'status': 'error', 'message': 'Method not allowed.'},
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+        )
+    return JSONResponse(
+        {'status': 'error', 'message': exc.detail},
+        status_code=exc.status_code,
+    )
+
+
+def error500(request, exc):
+    logger.opt(exception=exc).error('Some unexpected error occured')
+    _id = request.headers.get('x-request-id')
+    _id = f' Error id: outer-{_id}' if _id else ''
+    return JSONResponse(
+        {'status': 'error', 'message': f'Something went wrong.{_id}'},
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    # One pool per worker process, created after the fork.
+    # asyncpg prepares every statement, pgbouncer in transaction mode may
+    # run the next one on another server connection.
+    app.state.pool = await asyncpg.create_pool(
+        CONFIG.SQLALCHEMY_DATABASE_URI,
+        min_size=CONFIG.ASYNC_POOL_MIN_SIZE,
+        max_size=CONFIG.ASYNC_POOL_MAX_SIZE,
+        statement_cache_size=0 if CONFIG.DATABASE_PGBOUNCER else 100,
+    )
+    try:
+        yield
+    finally:
+        await app.state.pool.close()
+
+
+def create_asgi_app() -> Starlette:
+    init_logger()
+    logger.info('Async service running.')
+
+    app = Starlette(
+        routes=routes,
+        lifespan=lifespan,
+        exception_handlers={
+            ValidationError: error400,
+            SenderNotExistError: error404,
+            BillingError: error400,
+            HTTPException: error_http,
+            Exception: error500,
+        },
+    )
+    app.state.config = CONFIG
+    return app
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from asyncpg import Connection, Record
+from sqlalchemy.sql.elements import TextClause
+
+
+PARAMETER = re.compile(r'(?<![:\w]):(\w+)')
+
+
+class Statement(NamedTuple):
+    sql: str
+    names: Tuple[str, ...]
+
+    def arguments(self, params: Dict[str, Any]) -> List[Any]:
+        return [params[name] for name in self.names]
+
+
+def statement(clause: TextClause) -> Statement:
+    # The sync app's ``text()`` statements are reused as they are, named
+    # parameters become positional asyncpg ones.
+    names: List[str] = []
+
+    def positional(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f'${names.index(name) + 1}'
+
+    return Statement(PARAMETER.sub(positional, str(clause)), tuple(names))
+
+
+def sql(source: str) -> Statement:
+    return statement(TextClause(source))
+
+
+async def fetchrow(
+        connection: Connection,
+        query: Statement,
+        **params: Any,
+) -> Optional[Record]:
+    return await connection.fetchrow(query.sql, *query.arguments(params))
+
+
+async def fetch(
+        connection: Connection,
+        query: Statement,
+        **params: Any,
+) -> List[Record]:
+    return await connection.fetch(query.sql, *query.arguments(params))
+
+
+async def execute(connection: Connection, query: Statement, **params: Any):
+    return await connection.execute(query.sql, *query.arguments(params))
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict
+from uuid import uuid4
+
+import status
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from src.api.idempotency import (
+    CLAIM_STATEMENT, IDEMPOTENCY_HEADER, StoredResponse, check_fingerprint,
+    check_key, fingerprint, replays,
+)
+from src.api.schemas import (
+    CustomerSchema, OperationsQuerySchema, ReplenishmentSchema,
+    TransferSchema,
+)
+from src.utils import encode_cursor
+
+from .database import execute, fetchrow, sql, statement
+from .wallets import notify_customers, replenish, transfer
+
+
+CLAIM = statement(CLAIM_STATEMENT)
+REMEMBER = sql(
+    'UPDATE idempotency_keys SET status_code = :status_code, '
+    'response = :response WHERE id = :id'
+)
+CUSTOMER = sql(
+    'SELECT name FROM customers WHERE id = :customer_id AND deleted = false'
+)
+CREATE_CUSTOMER = sql('''
+WITH customer AS (
+    INSERT INTO customers (name, created_at, deleted)
+    VALUES (:name, :now, false)
+    RETURNING id
+)
+INSERT INTO wallets (customer_id, amount)
+SELECT id, 0 FROM customer
+RETURNING customer_id
+''')
+UPDATE_CUSTOMER = sql(
+    'UPDATE customers SET name = :name, updated_at = :now '
+    'WHERE id = :customer_id AND deleted = false'
+)
+DELETE_CUSTOMER = sql(
+    'UPDATE customers SET deleted = true, updated_at = :now '
+    'WHERE id = :customer_id AND deleted = false'
+)
+BALANCE = sql('''
+SELECT wallets.id, wallets.amount + (
+    SELECT COALESCE(sum(amount), 0) FROM wallet_shards
+    WHERE wallet_shards.wallet_id = wallets.id
+) AS amount
+FROM wallets
+JOIN customers ON customers.id = wallets.customer_id
+WHERE customers.deleted = false AND customers.id = :customer_id
+''')
+
+
+async def request_json(request: Request) -> Dict[str, Any]:
+    # Same as ``request.get_json(silent=True) or dict()``.
+    try:
+        data = await request.json()
+    except ValueError:
+        return dict()
+    return data if isinstance(data, dict) else dict()
+
+
+def not_found():
+    raise HTTPException(status.HTTP_404_NOT_FOUND)
+
+
+async def customer_get(request: Request):
+    customer_id = request.path_params['customer_id']
+    async with request.app.state.pool.acquire() as connection:
+        name = await connection.fetchval(
+            CUSTOMER.sql, *CUSTOMER.arguments({'customer_id': customer_id}),
+        )
+    if name is None:
+        not_found()
+    return JSONResponse({'id': customer_id, 'name': name})
+
+
+async def customer_put(request: Request):
+    customer_id = request.path_params['customer_id']
+    data = CustomerSchema(**(await request_json(request))).dict()
+    async with request.app.state.pool.acquire() as connection:
+        async with connection.transaction():
+            result = await execute(
+                connection, UPDATE_CUSTOMER,
+                name=data['name'],
+                now=datetime.utcnow(),
+                customer_id=customer_id,
+            )
+            if result == 'UPDATE 0':
+                not_found()
+            await notify_customers(connection, (customer_id,))
+    return JSONResponse({'id': customer_id, 'name': data['name']})
+
+
+async def customer_delete(request: Request):
+    customer_id = request.path_params['customer_id']
+    async with request.app.state.pool.acquire() as connection:
+        async with connection.transaction():
+            result = await execute(
+                connection, DELETE_CUSTOMER,
+                now=datetime.utcnow(), customer_id=customer_id,
+            )
+            if result == 'UPDATE 0':
+                not_found()
+            await notify_customers(connection, (customer_id,))
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+async def customer_post(request: Request):
+    data = CustomerSchema(**(await request_json(request))).dict()
+    async with request.app.state.pool.acquire() as connection:
+        customer = await fetchrow(
+            connection, CREATE_CUSTOMER,
+            name=data['name'], now=datetime.utcnow(),
+        )
+    return JSONResponse(
+        {'id': customer['customer_id']}, status_code=status.HTTP_201_CREATED,
+    )
+
+
+async def balance(request: Request):
+    customer_id = request.path_params['customer_id']
+    async with request.app.state.pool.acquire() as connection:
+        wallet = await fetchrow(connection, BALANCE, customer_id=customer_id)
+    if wallet is None:
+        not_found()
+    return JSONResponse({'id': customer_id, 'amount': wallet['amount']})
+
+
+async def operations(request: Request):
+    customer_id = request.path_params['customer_id']
+    params = OperationsQuerySchema(**dict(request.query_params)).dict()
+
+    conditions = ['wallet_id = $1']
+    arguments: list = []
+
+    def argument(value):
+        arguments.append(value)
+        return f'${len(arguments) + 1}'
+
+    if params['cursor']:
+        processed_at, operation_id = params['cursor']
+        conditions.append(
+            f'(processed_at, id) < ({argument(processed_at)}, '
+            f'{argument(operation_id)})'
+        )
+    if params['since']:
+        conditions.append(f"processed_at >= {argument(params['since'])}")
+    if params['until']:
+        conditions.append(f"processed_at < {argument(params['until'])}")
+    if params['sign'] == 'credit':
+        conditions.append('operation_amount > 0')
+    elif params['sign'] == 'debit':
+        conditions.append('operation_amount < 0')
+    query = (
+        'SELECT id, transaction, amount_was, amount_become, '
+        'operation_amount, processed_at, shard FROM operations '
+        f"WHERE {' AND '.join(conditions)} "
+        'ORDER BY processed_at DESC, id DESC '
+        f"LIMIT {argument(params['limit'] + 1)}"
+    )
+
+    async with request.app.state.pool.acquire() as connection:
+        wallet = await fetchrow(connection, BALANCE, customer_id=customer_id)
+        if wallet is None:
+            not_found()
+        rows = await connection.fetch(query, wallet['id'], *arguments)
+
+    page = rows[:params['limit']]
+    next_cursor = None
+    if len(rows) > params['limit']:
+        next_cursor = \
+            encode_cursor(page[-1]['processed_at'], page[-1]['id'])
+    return JSONResponse({
+        'operations': [
+            {
+                'id': row['id'],
+                'transaction': str(row['transaction']),
+                'amount_was': row['amount_was'],
+                'amount_become': row['amount_become'],
+                'operation_amount': row['operation_amount'],
+                'processed_at': row['processed_at'].isoformat(),
+                'shard': row['shard'],
+            }
+            for row in page
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
+def replay(stored: StoredResponse, value: str) -> Response:
+    check_fingerprint(stored, value)
+    return Response(
+        stored.body,
+        status_code=stored.status_code,
+        media_type='application/json',
+        headers={'Idempotent-Replayed': 'true'},
+    )
+
+
+async def idempotent(
+        request: Request,
+        data: Dict[str, Any],
+        handler: Callable[[Any], Awaitable[Dict[str, Any]]],
+) -> Response:
+    # Same protocol as the sync ``idempotent`` decorator, the handler runs
+    # in the transaction that claimed the key.
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    value = cache_key = None
+    if key is not None:
+        check_key(key)
+        value = fingerprint(data)
+        cache_key = (request.url.path, key)
+        stored = replays.get(cache_key)
+        if stored:
+            return replay(stored, value)
+
+    now = datetime.utcnow()
+    ttl = request.app.state.config.IDEMPOTENCY_KEY_TTL
+    stored = claimed = None
+    async with request.app.state.pool.acquire() as connection:
+        async with connection.transaction():
+            if key is not None:
+                claimed = await fetchrow(
+                    connection, CLAIM,
+                    key=key,
+                    endpoint=request.url.path,
+                    fingerprint=value,
+                    now=now,
+                    expired=now - timedelta(seconds=ttl),
+                )
+            if claimed is not None and claimed['status_code'] is not None:
+                stored = StoredResponse(
+                    claimed['fingerprint'],
+                    claimed['status_code'],
+                    claimed['response'],
+                )
+            else:
+                body = await handler(connection)
+                if claimed is not None:
+                    stored = StoredResponse(
+                        value, status.HTTP_200_OK,
+                        json.dumps(body, ensure_ascii=False),
+                    )
+                    await execute(
+                        connection, REMEMBER,
+                        status_code=stored.status_code,
+                        response=stored.body,
+                        id=claimed['id'],
+                    )
+
+    if claimed is None:
+        return JSONResponse(body)
+    expires_in = ttl - (now - claimed['created_at']).total_seconds()
+    replays.set(cache_key, stored, expires_in)
+    if claimed['status_code'] is not None:
+        return replay(stored, value)
+    return JSONResponse(body)
+
+
+async def replenishment(request: Request):
+    customer_id = request.path_params['customer_id']
+    data = ReplenishmentSchema(**(await request_json(request))).dict()
+    amount = data['amount']
+
+    async def handler(connection):
+        transaction = uuid4()
+        amount_was = \
+            await replenish(connection, customer_id, amount, transaction)
+        await notify_customers(connection, (customer_id,))
+        return {
+            'transaction': str(transaction),
+            'customer_id': customer_id,
+            'amount_was': amount_was,
+            'amount_become': amount_was + amount,
+            'operation_amount': amount,
+        }
+
+    return await idempotent(request, data, handler)
+
+
+async def transfer_view(request: Request):
+    sender_id = request.path_params['sender_id']
+    data = TransferSchema(**(await request_json(request))).dict()
+    recipient_id = data['customer_id']
+    amount = data['amount']
+
+    async def handler(connection):
+        transaction, sender_amount_was, recipient_amount_was = \
+            await transfer(connection, sender_id, recipient_id, amount)
+        await notify_customers(connection, (sender_id, recipient_id))
+        return {
+            'transaction': str(transaction),
+            'sender': {
+                'customer_id': sender_id,
+                'amount_was': sender_amount_was,
+                'amount_become': sender_amount_was - amount,
+                'operation_amount': - amount,
+            },
+            'recipient': {
+                'customer_id': recipient_id,
+                'amount_was': recipient_amount_was,
+                'amount_become': recipient_amount_was + amount,
+                'operation_amount': amount,
+            }
+        }
+
+    return await idempotent(request, data, handler)
+
+
+async def pool(request: Request):
+    _pool = request.app.state.pool
+    return JSONResponse({
+        'pid': os.getpid(),
+        'size': _pool.get_size(),
+        'idle': _pool.get_idle_size(),
+        'min_size': _pool.get_min_size(),
+        'max_size': _pool.get_max_size(),
+    })
+
+
+routes = [
+    Route('/v1/customer', customer_post, methods=['POST']),
+    Route(
+        '/v1/customer/{customer_id:int}', customer_get, methods=['GET'],
+    ),
+    Route(
+        '/v1/customer/{customer_id:int}', customer_put, methods=['PUT'],
+    ),
+    Route(
+        '/v1/customer/{customer_id:int}', customer_delete,
+        methods=['DELETE'],
+    ),
+    Route(
+        '/v1/customer/{customer_id:int}/balance', balance, methods=['GET'],
+    ),
+    Route(
+        '/v1/customer/{customer_id:int}/operations', operations,
+        methods=['GET'],
+    ),
+    Route(
+        '/v1/customer/{customer_id:int}/replenishment', replenishment,
+        methods=['POST'],
+    ),
+    Route(
+        '/v1/customer/{sender_id:int}/transfer', transfer_view,
+        methods=['POST'],
+    ),
+    Route('/monitoring/pool', pool, methods=['GET']),
+]
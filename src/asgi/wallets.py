@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from asyncpg import Connection
+
+from src.api.balances import NOTIFY_CHANNEL, NOTIFY_CHUNK
+from src import ledger
+from src.api.wallets import (
+    CREDIT_SHARD_STATEMENT, LOCK_WALLETS_STATEMENT, SWEEP_SHARDS_STATEMENT,
+    TRANSFER_STATEMENT, shard_for,
+)
+from src.exceptions import (
+    RecipientNotExistError, SenderNotEnoughMoneyError, SenderNotExistError,
+)
+from src.ledger import Credit, Operation, Wallet
+
+from .database import execute, fetch, fetchrow, sql, statement
+
+
+LOCK_WALLETS = statement(LOCK_WALLETS_STATEMENT)
+CREDIT_SHARD = statement(CREDIT_SHARD_STATEMENT)
+SWEEP_SHARDS = statement(SWEEP_SHARDS_STATEMENT)
+TRANSFER = statement(TRANSFER_STATEMENT)
+
+CREDIT_WALLET = sql('''
+UPDATE wallets SET amount = wallets.amount + :amount
+FROM customers
+WHERE customers.id = wallets.customer_id
+    AND customers.deleted = false
+    AND customers.id = :customer_id
+    AND wallets.shards = 0
+RETURNING wallets.id, wallets.amount
+''')
+CUSTOMER_WALLET = sql('''
+SELECT wallets.id, wallets.shards
+FROM wallets
+JOIN customers ON customers.id = wallets.customer_id
+WHERE customers.deleted = false AND customers.id = :customer_id
+''')
+UPDATE_WALLETS = sql('''
+UPDATE wallets SET amount = batch.amount
+FROM unnest(CAST(:ids AS integer[]), CAST(:amounts AS integer[]))
+    AS batch(id, amount)
+WHERE wallets.id = batch.id
+''')
+REGISTER_OPERATION = sql('''
+INSERT INTO operations (
+    transaction, wallet_id, amount_was, amount_become, operation_amount,
+    shard, processed_at
+)
+VALUES (
+    :transaction, :wallet_id, :amount_was, :amount_become, :amount,
+    :shard, :processed_at
+)
+''')
+NOTIFY = sql('SELECT pg_notify(:channel, :payload)')
+
+
+async def notify_customers(
+        connection: Connection,
+        customer_ids: Iterable[int],
+):
+    # Keeps the sync workers' customer caches coherent.
+    customer_ids = sorted(set(customer_ids))
+    for start in range(0, len(customer_ids), NOTIFY_CHUNK):
+        chunk = customer_ids[start:start + NOTIFY_CHUNK]
+        await execute(
+            connection, NOTIFY,
+            channel=NOTIFY_CHANNEL, payload=','.join(map(str, chunk)),
+        )
+
+
+async def register_operation(
+        connection: Connection,
+        wallet_id: int,
+        amount_was: int,
+        amount_become: int,
+        amount: int,
+        transaction: Optional[UUID] = None,
+        shard: int = 0,
+) -> UUID:
+    transaction = transaction if transaction else uuid4()
+    await execute(
+        connection, REGISTER_OPERATION,
+        transaction=transaction,
+        wallet_id=wallet_id,
+        amount_was=amount_was,
+        amount_become=amount_become,
+        amount=amount,
+        shard=shard,
+        processed_at=datetime.utcnow(),
+    )
+    return transaction
+
+
+async def record(connection: Connection, operations: List[Operation]):
+    for operation in operations:
+        await register_operation(
+            connection,
+            operation.wallet_id,
+            operation.amount_was,
+            operation.amount_become,
+            operation.operation_amount,
+            operation.transaction,
+            shard=operation.shard,
+        )
+
+
+async def update_wallets(connection: Connection, amounts: Dict[int, int]):
+    if amounts:
+        await execute(
+            connection, UPDATE_WALLETS,
+            ids=list(amounts), amounts=list(amounts.values()),
+        )
+
+
+async def credit_shard(
+        connection: Connection,
+        wallet_id: int,
+        shards: int,
+        amount: int,
+        transaction: UUID,
+) -> Credit:
+    shard = shard_for(transaction, shards)
+    credited = await fetchrow(
+        connection, CREDIT_SHARD,
+        wallet_id=wallet_id, shard=shard, amount=amount,
+    )
+    return Credit(wallet_id, shard, credited['amount'], credited['total'])
+
+
+async def credit_wallet(
+        connection: Connection,
+        customer_id: int,
+        amount: int,
+        transaction: UUID,
+) -> Optional[Credit]:
+    wallet = await fetchrow(
+        connection, CREDIT_WALLET, customer_id=customer_id, amount=amount,
+    )
+    if wallet:
+        return Credit(wallet['id'], 0, wallet['amount'], wallet['amount'])
+    wallet = await fetchrow(
+        connection, CUSTOMER_WALLET, customer_id=customer_id,
+    )
+    if not wallet:
+        return None
+    return await credit_shard(
+        connection, wallet['id'], wallet['shards'], amount, transaction,
+    )
+
+
+async def replenish(
+        connection: Connection,
+        customer_id: int,
+        amount: int,
+        transaction: UUID,
+) -> int:
+    # ledger.replenish over the connection.
+    credit = await credit_wallet(connection, customer_id, amount, transaction)
+    if not credit:
+        raise SenderNotExistError('Sender not exist')
+    await record(connection, [ledger.credited(credit, amount, transaction)])
+    return credit.total - amount
+
+
+async def sweep_shards(
+        connection: Connection,
+        wallet_id: int,
+        amount: int,
+) -> int:
+    shards = await fetch(connection, SWEEP_SHARDS, wallet_id=wallet_id)
+    if not shards:
+        return amount
+
+    operations = ledger.swept(
+        wallet_id,
+        amount,
+        [(shard['shard'], shard['amount']) for shard in shards],
+        uuid4(),
+    )
+    await record(connection, operations)
+    return operations[-1].amount_become
+
+
+async def lock_wallets(
+        connection: Connection,
+        customer_ids: Iterable[int],
+        credit_only: Iterable[int] = (),
+) -> Dict[int, Wallet]:
+    wallets = await fetch(
+        connection, LOCK_WALLETS,
+        customer_ids=list(set(customer_ids)),
+        credit_only=list(set(credit_only)),
+    )
+    return {
+        wallet['customer_id']: Wallet(
+            wallet['id'],
+            wallet['customer_id'],
+            wallet['shards'],
+            wallet['amount'],
+            wallet['locked'],
+        )
+        for wallet in wallets
+    }
+
+
+async def transfer_locked(
+        connection: Connection,
+        sender_id: int,
+        recipient_id: int,
+        amount: int,
+) -> Tuple[UUID, int, int]:
+    # ledger.transfer over the connection, only used for sharded wallets.
+    transaction = uuid4()
+    wallets = await lock_wallets(
+        connection,
+        (sender_id, recipient_id),
+        credit_only={recipient_id} - {sender_id},
+    )
+    sender_wallet, recipient_wallet = \
+        ledger.transfer_wallets(wallets, sender_id, recipient_id)
+
+    amounts = {
+        wallet.id: wallet.amount
+        for wallet in wallets.values()
+        if wallet.locked
+    }
+    if sender_wallet.shards:
+        amounts[sender_wallet.id] = await sweep_shards(
+            connection, sender_wallet.id, amounts[sender_wallet.id],
+        )
+    operations = [ledger.debit(amounts, sender_wallet, amount, transaction)]
+    sender_amount_was = operations[0].amount_was
+    if recipient_wallet.locked:
+        operations.append(ledger.credit_locked(
+            amounts, recipient_wallet, amount, transaction,
+        ))
+        recipient_amount_was = operations[1].amount_was
+    else:
+        credit = await credit_shard(
+            connection, recipient_wallet.id, recipient_wallet.shards,
+            amount, transaction,
+        )
+        operations.append(ledger.credited(credit, amount, transaction))
+        recipient_amount_was = credit.total - amount
+    await record(connection, operations)
+    await update_wallets(connection, amounts)
+    return transaction, sender_amount_was, recipient_amount_was
+
+
+async def transfer(
+        connection: Connection,
+        sender_id: int,
+        recipient_id: int,
+        amount: int,
+) -> Tuple[UUID, int, int]:
+    # The single statement engine: one round trip unless a wallet is
+    # sharded.
+    transaction = uuid4()
+    result = await fetchrow(
+        connection, TRANSFER,
+        sender_id=sender_id,
+        recipient_id=recipient_id,
+        amount=amount,
+        transaction=str(transaction),
+        processed_at=datetime.utcnow(),
+    )
+    if not result['sender_wallet_id']:
+        raise SenderNotExistError('Sender not exist')
+    if not result['recipient_wallet_id']:
+        raise RecipientNotExistError(
+            f"Customer {recipient_id} doesn't exist",
+        )
+    if result['sender_shards'] or result['recipient_shards']:
+        return await transfer_locked(
+            connection, sender_id, recipient_id, amount,
+        )
+    if result['sender_amount_was'] is None:
+        raise SenderNotEnoughMoneyError(
+            f"Customer {sender_id} doesn't have enough money",
+        )
+    return (
+        transaction,
+        result['sender_amount_was'],
+        result['recipient_amount_was'],
+    )
@@ -21,3 +21,7 @@ class SenderNotExistError(BillingError):
 
 class RecipientNotExistError(BillingError):
     pass
+
+
+class IdempotencyKeyError(BillingError):
+    pass
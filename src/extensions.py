@@ -1,7 +1,95 @@
 # -*- coding: utf-8 -*-
-from flask_migrate import Migrate
+import threading
+import time
+from typing import Any, Dict
+
+from flask_compress import Compress
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class StreamingAwareCompress(Compress):
+    def after_request(self, response):
+        # Compressing a streamed response would buffer the whole body.
+        if response.is_streamed:
+            return response
+        return super().after_request(response)
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.acquire_seconds_total = 0.0
+        self.acquire_seconds_max = 0.0
+        self.checked_out_max = 0
+        self._lock = threading.Lock()
+
+    def acquired(self, seconds: float, checked_out: int):
+        with self._lock:
+            self.checkouts += 1
+            self.acquire_seconds_total += seconds
+            self.acquire_seconds_max = max(self.acquire_seconds_max, seconds)
+            self.checked_out_max = max(self.checked_out_max, checked_out)
+
+    def timed_out(self, seconds: float):
+        with self._lock:
+            self.timeouts += 1
+            self.acquire_seconds_max = max(self.acquire_seconds_max, seconds)
+
+
+class MeteredQueuePool(QueuePool):
+    # Times every checkout, including the wait for a free connection and
+    # connecting a new one.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.timed_out(time.perf_counter() - started)
+            raise
+        self.metrics.acquired(
+            time.perf_counter() - started, self.checkedout(),
+        )
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': self.overflow(),
+            'checked_out_max': self.metrics.checked_out_max,
+            'checkouts': self.metrics.checkouts,
+            'timeouts': self.metrics.timeouts,
+            'acquire_seconds_total':
+                round(self.metrics.acquire_seconds_total, 6),
+            'acquire_seconds_max': round(self.metrics.acquire_seconds_max, 6),
+        }
+
+
+def engine_options(config) -> Dict[str, Any]:
+    # Connections per worker are bounded by DATABASE_POOL_SIZE plus
+    # DATABASE_MAX_OVERFLOW, a checkout waits at most DATABASE_POOL_TIMEOUT.
+    return {
+        'poolclass': MeteredQueuePool,
+        'pool_size': config.DATABASE_POOL_SIZE,
+        'max_overflow': config.DATABASE_MAX_OVERFLOW,
+        'pool_timeout': config.DATABASE_POOL_TIMEOUT,
+        'pool_recycle': config.DATABASE_POOL_RECYCLE,
+        'pool_pre_ping': config.DATABASE_POOL_PRE_PING,
+    }
 
 
 db = SQLAlchemy()
-migrate = Migrate()
+compress = StreamingAwareCompress()
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+from .core import (
+    Credit, Ledger, Operation, Transfer, Wallet, credit_locked, credited,
+    debit, replenish, replenish_batch, swept, transfer, transfer_batch,
+    transfer_wallets,
+)
+from .memory import MemoryLedger
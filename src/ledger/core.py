@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+import abc
+from datetime import datetime
+from typing import (
+    Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union,
+)
+from uuid import UUID, uuid4
+
+from src.exceptions import (
+    BillingError, RecipientNotExistError, SenderNotEnoughMoneyError,
+    SenderNotExistError,
+)
+
+
+class Credit(NamedTuple):
+    wallet_id: int
+    shard: int
+    amount: int
+    total: int
+
+
+class Wallet(NamedTuple):
+    id: int
+    customer_id: int
+    shards: int
+    # None for sharded wallets left unlocked.
+    amount: Optional[int]
+    locked: bool
+
+
+# The columns of OperationModel the rules decide on, ids and processed_at
+# are up to the storage.
+class Operation(NamedTuple):
+    transaction: UUID
+    wallet_id: int
+    amount_was: int
+    amount_become: int
+    operation_amount: int
+    shard: int = 0
+
+
+class Transfer(NamedTuple):
+    transaction: UUID
+    sender_amount_was: int
+    recipient_amount_was: int
+
+
+class Ledger(abc.ABC):
+    # Storage the rules below run against. Every call is a part of the
+    # caller's transaction, nothing is committed here.
+
+    @abc.abstractmethod
+    def lock(
+            self,
+            customer_ids: Iterable[int],
+            credit_only: Iterable[int] = (),
+    ) -> Dict[int, Wallet]:
+        # Wallets of existing customers by customer id, sharded wallets of
+        # ``credit_only`` customers may be left unlocked.
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def sweep(self, wallet_id: int, amount: int) -> int:
+        # Moves shard balances into the locked wallet, records the sweep and
+        # returns the new wallet amount, which is left for ``write``.
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def credit(
+            self,
+            customer_id: int,
+            amount: int,
+            transaction: UUID,
+    ) -> Optional[Credit]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def credit_shard(
+            self,
+            wallet_id: int,
+            shards: int,
+            amount: int,
+            transaction: UUID,
+    ) -> Credit:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def write(self, amounts: Dict[int, int]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def record(self, operations: List[Operation]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def record_many(self, operations: List[Operation], processed_at: datetime):
+        raise NotImplementedError
+
+
+def transfer_wallets(
+        wallets: Dict[int, Wallet],
+        sender_id: int,
+        recipient_id: int,
+) -> Tuple[Wallet, Wallet]:
+    sender_wallet = wallets.get(sender_id)
+    recipient_wallet = wallets.get(recipient_id)
+    if not sender_wallet:
+        raise SenderNotExistError('Sender not exist')
+    if not recipient_wallet:
+        raise RecipientNotExistError(
+            f"Customer {recipient_id} doesn't exist",
+        )
+    return sender_wallet, recipient_wallet
+
+
+def debit(
+        amounts: Dict[int, int],
+        wallet: Wallet,
+        amount: int,
+        transaction: UUID,
+) -> Operation:
+    # Takes ``amount`` off the locked wallet's entry in ``amounts``.
+    amount_was = amounts[wallet.id]
+    if amount_was < amount:
+        raise SenderNotEnoughMoneyError(
+            f"Customer {wallet.customer_id} doesn't have enough money",
+        )
+    amounts[wallet.id] -= amount
+    return Operation(
+        transaction, wallet.id, amount_was, amount_was - amount, -amount,
+    )
+
+
+def credit_locked(
+        amounts: Dict[int, int],
+        wallet: Wallet,
+        amount: int,
+        transaction: UUID,
+) -> Operation:
+    amount_was = amounts[wallet.id]
+    amounts[wallet.id] += amount
+    return Operation(
+        transaction, wallet.id, amount_was, amount_was + amount, amount,
+    )
+
+
+def credited(credit: Credit, amount: int, transaction: UUID) -> Operation:
+    # The operation of a credit the storage has already applied.
+    return Operation(
+        transaction,
+        credit.wallet_id,
+        credit.amount - amount,
+        credit.amount,
+        amount,
+        credit.shard,
+    )
+
+
+def swept(
+        wallet_id: int,
+        amount: int,
+        shards: Iterable[Tuple[int, int]],
+        transaction: UUID,
+) -> List[Operation]:
+    # Operations moving (shard, amount) balances into the wallet holding
+    # ``amount``: one per shard, then the wallet's own. The last one's
+    # amount_become is the wallet's new amount.
+    operations = []
+    total = 0
+    for shard, shard_amount in sorted(shards):
+        operations.append(Operation(
+            transaction, wallet_id, shard_amount, 0, -shard_amount, shard,
+        ))
+        total += shard_amount
+    operations.append(
+        Operation(transaction, wallet_id, amount, amount + total, total),
+    )
+    return operations
+
+
+def replenish(
+        ledger: Ledger,
+        customer_id: int,
+        amount: int,
+        transaction: UUID,
+) -> int:
+    # Returns the customer's total balance before the replenishment.
+    credit = ledger.credit(customer_id, amount, transaction)
+    if not credit:
+        raise SenderNotExistError('Sender not exist')
+    ledger.record([credited(credit, amount, transaction)])
+    return credit.total - amount
+
+
+def replenish_batch(
+        ledger: Ledger,
+        replenishments: List[Tuple[int, int, UUID]],
+        processed_at: datetime,
+) -> List[Union[int, BillingError]]:
+    # (customer_id, amount, transaction) replenishments applied in order,
+    # every unsharded wallet is locked and written once for all of its own.
+    # Returns the balance before each one or its error.
+    customer_ids = {customer_id for customer_id, _, _ in replenishments}
+    wallets = ledger.lock(customer_ids, credit_only=customer_ids)
+    amounts_was = {
+        wallet.id: wallet.amount
+        for wallet in wallets.values()
+        if wallet.locked
+    }
+    amounts = dict(amounts_was)
+
+    results: List[Union[int, BillingError]] = []
+    operations = []
+    for customer_id, amount, transaction in replenishments:
+        wallet = wallets.get(customer_id)
+        if not wallet:
+            results.append(SenderNotExistError('Sender not exist'))
+            continue
+        if wallet.locked:
+            operations.append(
+                credit_locked(amounts, wallet, amount, transaction),
+            )
+            results.append(operations[-1].amount_was)
+        else:
+            credit = ledger.credit_shard(
+                wallet.id, wallet.shards, amount, transaction,
+            )
+            operations.append(credited(credit, amount, transaction))
+            results.append(credit.total - amount)
+
+    ledger.write({
+        wallet_id: amount
+        for wallet_id, amount in amounts.items()
+        if amount != amounts_was[wallet_id]
+    })
+    ledger.record_many(operations, processed_at)
+    return results
+
+
+def transfer(
+        ledger: Ledger,
+        sender_id: int,
+        recipient_id: int,
+        amount: int,
+        transaction: UUID,
+) -> Transfer:
+    wallets = ledger.lock(
+        (sender_id, recipient_id),
+        credit_only={recipient_id} - {sender_id},
+    )
+    sender_wallet, recipient_wallet = \
+        transfer_wallets(wallets, sender_id, recipient_id)
+
+    amounts = {
+        wallet.id: wallet.amount
+        for wallet in wallets.values()
+        if wallet.locked
+    }
+    if sender_wallet.shards:
+        amounts[sender_wallet.id] = \
+            ledger.sweep(sender_wallet.id, amounts[sender_wallet.id])
+    operations = [debit(amounts, sender_wallet, amount, transaction)]
+    sender_amount_was = operations[0].amount_was
+    if recipient_wallet.locked:
+        operations.append(
+            credit_locked(amounts, recipient_wallet, amount, transaction),
+        )
+        recipient_amount_was = operations[1].amount_was
+    else:
+        credit = ledger.credit_shard(
+            recipient_wallet.id, recipient_wallet.shards, amount, transaction,
+        )
+        operations.append(credited(credit, amount, transaction))
+        recipient_amount_was = credit.total - amount
+    ledger.record(operations)
+    ledger.write(amounts)
+    return Transfer(transaction, sender_amount_was, recipient_amount_was)
+
+
+def transfer_batch(
+        ledger: Ledger,
+        transfers: List[Tuple[int, int, int]],
+        processed_at: datetime,
+        new_transaction: Callable[[], UUID] = uuid4,
+) -> Tuple[List[Union[Transfer, BillingError]], Set[int]]:
+    # (sender_id, recipient_id, amount) transfers applied in order under one
+    # lock of all their wallets. Failed ones don't stop the batch and come
+    # back as errors. Also returns ids of customers whose balance changed.
+    customer_ids = {
+        customer_id
+        for sender_id, recipient_id, _ in transfers
+        for customer_id in (sender_id, recipient_id)
+    }
+    wallets = ledger.lock(customer_ids)
+    amounts_was = {wallet.id: wallet.amount for wallet in wallets.values()}
+    amounts = dict(amounts_was)
+    for wallet in wallets.values():
+        if wallet.shards:
+            amounts[wallet.id] = ledger.sweep(wallet.id, wallet.amount)
+
+    results: List[Union[Transfer, BillingError]] = []
+    operations = []
+    for sender_id, recipient_id, amount in transfers:
+        sender_wallet = wallets.get(sender_id)
+        recipient_wallet = wallets.get(recipient_id)
+        if not sender_wallet:
+            results.append(SenderNotExistError(
+                f"Customer {sender_id} doesn't exist",
+            ))
+            continue
+        if not recipient_wallet:
+            results.append(RecipientNotExistError(
+                f"Customer {recipient_id} doesn't exist",
+            ))
+            continue
+        if amounts[sender_wallet.id] < amount:
+            results.append(SenderNotEnoughMoneyError(
+                f"Customer {sender_id} doesn't have enough money",
+            ))
+            continue
+
+        transaction = new_transaction()
+        debited = debit(amounts, sender_wallet, amount, transaction)
+        operations.append(debited)
+        operations.append(
+            credit_locked(amounts, recipient_wallet, amount, transaction),
+        )
+        results.append(Transfer(
+            transaction, debited.amount_was, operations[-1].amount_was,
+        ))
+
+    changed = {
+        wallet_id: amount
+        for wallet_id, amount in amounts.items()
+        if amount != amounts_was[wallet_id]
+    }
+    ledger.write(changed)
+    ledger.record_many(operations, processed_at)
+    return results, {
+        customer_id
+        for customer_id, wallet in wallets.items()
+        if wallet.id in changed
+    }
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from .core import Credit, Ledger, Operation, Wallet
+
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class MemoryLedger(Ledger):
+    # Wallet balances and operations in flat arrays of one process, for
+    # replaying operations without a database. Wallet ids are indexes of
+    # ``balances``, ``wallets`` maps customer ids to them with 0 for
+    # customers that don't exist or are deleted. Wallets are never sharded
+    # here: shards only spread lock contention, which a single process
+    # doesn't have.
+
+    def __init__(self):
+        self.wallets = array('q', [0])
+        self.balances = array('q', [0])
+        # Append-only operation buffer, one packed array per column:
+        # transactions are 16 bytes each, processed_at is in microseconds
+        # since the epoch.
+        self.transactions = bytearray()
+        self.wallet_ids = array('q')
+        self.amounts_was = array('q')
+        self.amounts_become = array('q')
+        self.operation_amounts = array('q')
+        self.processed_at = array('q')
+
+    @classmethod
+    def load(cls, wallets: Iterable[Tuple[int, int, int]]) -> 'MemoryLedger':
+        # (customer_id, wallet_id, amount) rows of existing customers, e.g.
+        # a snapshot of the wallets table with shards summed in.
+        ledger = cls()
+        for customer_id, wallet_id, amount in wallets:
+            ledger.wallets.extend(
+                [0] * (customer_id + 1 - len(ledger.wallets)),
+            )
+            ledger.balances.extend(
+                [0] * (wallet_id + 1 - len(ledger.balances)),
+            )
+            ledger.wallets[customer_id] = wallet_id
+            ledger.balances[wallet_id] = amount
+        return ledger
+
+    def add_customer(self, amount: int = 0) -> int:
+        # Customer and wallet ids are given out together, like a fresh
+        # database does for customers created one by one.
+        customer_id = len(self.wallets)
+        self.wallets.append(len(self.balances))
+        self.balances.append(amount)
+        return customer_id
+
+    def delete_customer(self, customer_id: int):
+        self.wallets[customer_id] = 0
+
+    def wallet_id(self, customer_id: int) -> int:
+        if 0 < customer_id < len(self.wallets):
+            return self.wallets[customer_id]
+        return 0
+
+    def balance(self, customer_id: int) -> Optional[int]:
+        wallet_id = self.wallet_id(customer_id)
+        return self.balances[wallet_id] if wallet_id else None
+
+    @property
+    def buffer_size(self) -> int:
+        # Bytes taken by the recorded operations.
+        return len(self.transactions) + sum(
+            column.itemsize * len(column)
+            for column in (
+                self.wallet_ids, self.amounts_was, self.amounts_become,
+                self.operation_amounts, self.processed_at,
+            )
+        )
+
+    def operations(self, start: int = 0) -> Iterator[Operation]:
+        for index in range(start, len(self.wallet_ids)):
+            offset = index * 16
+            yield Operation(
+                UUID(bytes=bytes(self.transactions[offset:offset + 16])),
+                self.wallet_ids[index],
+                self.amounts_was[index],
+                self.amounts_become[index],
+                self.operation_amounts[index],
+            )
+
+    def lock(
+            self,
+            customer_ids: Iterable[int],
+            credit_only: Iterable[int] = (),
+    ) -> Dict[int, Wallet]:
+        wallets = {}
+        for customer_id in customer_ids:
+            wallet_id = self.wallet_id(customer_id)
+            if wallet_id:
+                wallets[customer_id] = Wallet(
+                    wallet_id, customer_id, 0, self.balances[wallet_id], True,
+                )
+        return wallets
+
+    def sweep(self, wallet_id: int, amount: int) -> int:
+        return amount
+
+    def credit(
+            self,
+            customer_id: int,
+            amount: int,
+            transaction: UUID,
+    ) -> Optional[Credit]:
+        wallet_id = self.wallet_id(customer_id)
+        if not wallet_id:
+            return None
+        self.balances[wallet_id] += amount
+        total = self.balances[wallet_id]
+        return Credit(wallet_id, 0, total, total)
+
+    def credit_shard(
+            self,
+            wallet_id: int,
+            shards: int,
+            amount: int,
+            transaction: UUID,
+    ) -> Credit:
+        # Not reached: ``lock`` leaves no wallet unlocked.
+        self.balances[wallet_id] += amount
+        total = self.balances[wallet_id]
+        return Credit(wallet_id, 0, total, total)
+
+    def write(self, amounts: Dict[int, int]):
+        for wallet_id, amount in amounts.items():
+            self.balances[wallet_id] = amount
+
+    def record(
+            self,
+            operations: List[Operation],
+            processed_at: Optional[datetime] = None,
+    ):
+        # Operations recorded without a time get the current one, like the
+        # column default of the database.
+        if processed_at is None:
+            timestamp = time.time_ns() // 1000
+        else:
+            timestamp = (processed_at - EPOCH) // MICROSECOND
+        for operation in operations:
+            # Faster than UUID.bytes.
+            self.transactions += \
+                operation.transaction.int.to_bytes(16, 'big')
+            self.wallet_ids.append(operation.wallet_id)
+            self.amounts_was.append(operation.amount_was)
+            self.amounts_become.append(operation.amount_become)
+            self.operation_amounts.append(operation.operation_amount)
+            self.processed_at.append(timestamp)
+
+    def record_many(self, operations: List[Operation], processed_at: datetime):
+        self.record(operations, processed_at)
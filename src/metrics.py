@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+from flask import Flask, Response, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess,
+)
+from sqlalchemy import event
+
+from .extensions import db
+
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0,
+)
+# Errors counted on the database side, by SQLSTATE.
+DATABASE_ERRORS = {
+    '40P01': 'DeadlockDetected',
+    '40001': 'SerializationFailure',
+}
+
+REQUESTS = Counter(
+    'billing_http_requests_total',
+    'HTTP requests by route and status.',
+    ['endpoint', 'method', 'status'],
+)
+REQUEST_DURATION = Histogram(
+    'billing_http_request_duration_seconds',
+    'HTTP request handling time by route.',
+    ['endpoint', 'method'],
+    buckets=LATENCY_BUCKETS,
+)
+STATEMENT_DURATION = Histogram(
+    'billing_db_statement_duration_seconds',
+    'Database statement time by route and statement kind.',
+    ['endpoint', 'statement'],
+    buckets=LATENCY_BUCKETS,
+)
+TRANSACTIONS = Counter(
+    'billing_db_transactions_total',
+    'Finished database transactions.',
+    ['outcome'],
+)
+ERRORS = Counter(
+    'billing_errors_total',
+    'Handled domain errors and database conflicts.',
+    ['error'],
+)
+LOG_RECORDS_DROPPED = Counter(
+    'billing_log_records_dropped_total',
+    'Log records dropped because the logging queue was full.',
+)
+
+
+# Labelled children are looked up once, ``labels()`` is too slow to be
+# called for every statement.
+_children: Dict[Tuple, object] = {}
+# Route of the request handled by this thread, statements run outside of
+# a request are labelled "none".
+_current = threading.local()
+
+
+def child(metric, *labels):
+    key = (metric, *labels)
+    labelled = _children.get(key)
+    if labelled is None:
+        labelled = _children[key] = metric.labels(*labels)
+    return labelled
+
+
+def count_error(exc: Exception):
+    child(ERRORS, type(exc).__name__).inc()
+
+
+def statement_kind(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else 'NONE'
+
+
+def before_request():
+    _current.endpoint = request.endpoint or 'none'
+    _current.started_at = time.perf_counter()
+
+
+def after_request(response):
+    started_at = getattr(_current, 'started_at', None)
+    if started_at is not None:
+        endpoint = _current.endpoint
+        child(REQUEST_DURATION, endpoint, request.method)\
+            .observe(time.perf_counter() - started_at)
+        child(REQUESTS, endpoint, request.method, response.status_code)\
+            .inc()
+    _current.endpoint = 'none'
+    _current.started_at = None
+    return response
+
+
+def before_cursor_execute(conn, cursor, statement, *_):
+    # pylint: disable=unused-argument
+    conn.info.setdefault('statements_started_at', []).append(
+        time.perf_counter(),
+    )
+
+
+def after_cursor_execute(conn, cursor, statement, *_):
+    # pylint: disable=unused-argument
+    started_at = conn.info['statements_started_at'].pop()
+    endpoint = getattr(_current, 'endpoint', 'none')
+    child(STATEMENT_DURATION, endpoint, statement_kind(statement))\
+        .observe(time.perf_counter() - started_at)
+
+
+def handle_error(context):
+    if context.connection is not None:
+        started = context.connection.info.get('statements_started_at')
+        if started:
+            started.pop()
+    code = getattr(context.original_exception, 'pgcode', None)
+    if code in DATABASE_ERRORS:
+        child(ERRORS, DATABASE_ERRORS[code]).inc()
+
+
+def on_commit(_):
+    child(TRANSACTIONS, 'commit').inc()
+
+
+def on_rollback(_):
+    child(TRANSACTIONS, 'rollback').inc()
+
+
+def metrics():
+    # Under gunicorn every worker writes its samples into
+    # PROMETHEUS_MULTIPROC_DIR and any of them can serve the sum.
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST,
+    )
+
+
+def init_metrics(app: Flask):
+    # pylint: disable=no-member
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
+
+    engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
+    event.listen(engine, 'commit', on_commit)
+    event.listen(engine, 'rollback', on_rollback)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+from typing import Any, List
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except ValueError:
+        raise ValueError('invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('invalid cursor')
+    return values
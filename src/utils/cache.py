@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    # Thread safe LRU mapping whose entries also expire after ``ttl``
+    # seconds, every worker process keeps its own instance.
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Removals stamp their key with a new version, a value read before
+        # that may be stale. Only the latest ``maxsize`` stamps are kept,
+        # other keys share ``_floor``, the newest stamp forgotten.
+        self._stamp = 0
+        self._floor = 0
+        self._versions: OrderedDict = OrderedDict()
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] <= time.monotonic():
+                del self._items[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return item[1]
+
+    def version(self, key: Hashable) -> int:
+        # Taken before reading a value to ``set`` with it.
+        with self._lock:
+            return self._versions.get(key, self._floor)
+
+    def _bump(self, key: Hashable):
+        self._stamp += 1
+        self._versions[key] = self._stamp
+        self._versions.move_to_end(key)
+        while len(self._versions) > max(self.maxsize, 1):
+            _, self._floor = self._versions.popitem(last=False)
+
+    def set(
+            self,
+            key: Hashable,
+            value: Any,
+            ttl: Optional[float] = None,
+            version: Optional[int] = None,
+    ):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            if version is not None and \
+                    version != self._versions.get(key, self._floor):
+                return
+            if ttl <= 0 or self.maxsize <= 0:
+                self._items.pop(key, None)
+                return
+            self._items[key] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            self._bump(key)
+            item = self._items.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._stamp += 1
+            self._floor = self._stamp
+            self._versions.clear()
+            self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._items),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
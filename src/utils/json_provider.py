@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from typing import Any
+
+from flask import Flask, Response
+from flask import json as flask_json
+from flask import jsonify
+
+
+class JSONProvider:
+    # Flask's own encoder, honours JSON_SORT_KEYS, JSON_AS_ASCII and
+    # JSONIFY_PRETTYPRINT_REGULAR.
+    def __init__(self, app: Flask):
+        self.app = app
+
+    def dumps(self, obj: Any) -> str:
+        return flask_json.dumps(obj)
+
+    def response(self, obj: Any) -> Response:
+        return jsonify(obj)
+
+
+class OrjsonProvider(JSONProvider):
+    # Encodes UUID and datetime values natively and always writes UTF-8,
+    # only JSON_SORT_KEYS is honoured.
+    def __init__(self, app: Flask):
+        super().__init__(app)
+        import orjson  # pylint: disable=import-outside-toplevel
+        self.orjson = orjson
+        self.option = \
+            orjson.OPT_SORT_KEYS if app.config['JSON_SORT_KEYS'] else 0
+
+    def dumps(self, obj: Any) -> str:
+        return self.orjson.dumps(obj, option=self.option).decode()
+
+    def response(self, obj: Any) -> Response:
+        return self.app.response_class(
+            self.orjson.dumps(
+                obj, option=self.option | self.orjson.OPT_APPEND_NEWLINE,
+            ),
+            mimetype=self.app.config['JSONIFY_MIMETYPE'],
+        )
+
+
+JSON_PROVIDERS = {
+    'flask': JSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+class JSONProviderFlask(Flask):
+    # Dicts returned by views and error handlers, alone or with a status
+    # and headers, are encoded by the configured JSON_PROVIDER.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.json_provider: JSONProvider = JSONProvider(self)
+
+    def make_response(self, rv):
+        if isinstance(rv, dict):
+            rv = self.json_provider.response(rv)
+        elif isinstance(rv, tuple) and rv and isinstance(rv[0], dict):
+            rv = (self.json_provider.response(rv[0]),) + rv[1:]
+        return super().make_response(rv)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import atexit
+import json
+import os
+import queue
+import threading
+import weakref
+from typing import Callable, List, Optional
+
+
+def serialize(text: str, record: dict) -> str:
+    # The same document as loguru's ``serialize=True``, so readers of the
+    # log file see no difference. The traceback is already in the text.
+    exception = record['exception']
+    if exception and exception.type is not None:
+        exception = {
+            'type': exception.type.__name__,
+            'value': exception.value,
+            'traceback': bool(exception.traceback),
+        }
+    else:
+        exception = None
+    return json.dumps({
+        'text': text,
+        'record': {
+            'elapsed': {
+                'repr': record['elapsed'],
+                'seconds': record['elapsed'].total_seconds(),
+            },
+            'exception': exception,
+            'extra': record['extra'],
+            'file': {
+                'name': record['file'].name,
+                'path': record['file'].path,
+            },
+            'function': record['function'],
+            'level': {
+                'icon': record['level'].icon,
+                'name': record['level'].name,
+                'no': record['level'].no,
+            },
+            'line': record['line'],
+            'message': record['message'],
+            'module': record['module'],
+            'name': record['name'],
+            'process': {
+                'id': record['process'].id,
+                'name': record['process'].name,
+            },
+            'thread': {
+                'id': record['thread'].id,
+                'name': record['thread'].name,
+            },
+            'time': {
+                'repr': record['time'],
+                'timestamp': record['time'].timestamp(),
+            },
+        },
+    }, default=str) + '\n'
+
+
+class BatchingSink:
+    # Loguru sink that only puts records onto a bounded queue: a background
+    # thread serializes them and appends whole batches to the file. Records
+    # that don't fit into the queue are dropped and counted, the writer logs
+    # the count once it catches up.
+    def __init__(
+            self,
+            path: str,
+            maxsize: int = 10000,
+            batch_size: int = 512,
+            flush_interval: float = 0.5,
+            on_drop: Optional[Callable[[], None]] = None,
+    ):
+        self.path = path
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_drop = on_drop
+        self.dropped = 0
+        self.written = 0
+        self._reported = 0
+        self._drop_lock = threading.Lock()
+        self.closed = False
+        # Opened here, so a file that can't be written fails the caller
+        # instead of the writer thread.
+        self._stream = open(  # pylint: disable=consider-using-with
+            path, 'a', encoding='utf-8',
+        )
+        self._start()
+        _sinks.add(self)
+
+    def _restart(self):
+        # The parent's writer isn't forked along, the child gets its own
+        # queue, file object and writer thread.
+        self._stream = open(  # pylint: disable=consider-using-with
+            self.path, 'a', encoding='utf-8',
+        )
+        self._start()
+
+    def _start(self):
+        self._queue: queue.Queue = queue.Queue(self.maxsize)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._write,
+            args=(self._stream,),
+            name='log-writer',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def __call__(self, message):
+        try:
+            self._queue.put_nowait((str(message), message.record))
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+            if self.on_drop:
+                self.on_drop()
+
+    def _batch(self) -> List[tuple]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, stream):
+        with stream:
+            while not (self._stopped.is_set() and self._queue.empty()):
+                batch = self._batch()
+                lines = [serialize(text, record) for text, record in batch]
+                dropped = self.dropped - self._reported
+                if dropped:
+                    self._reported += dropped
+                    lines.append(json.dumps({
+                        'text': f'Dropped {dropped} log records\n',
+                        'record': {'dropped': dropped},
+                    }) + '\n')
+                if lines:
+                    stream.write(''.join(lines))
+                    stream.flush()
+                    self.written += len(batch)
+
+    def stop(self, timeout: float = 5.0):
+        # Writes out whatever is queued.
+        self.closed = True
+        _sinks.discard(self)
+        self._stopped.set()
+        self._thread.join(timeout)
+
+
+# Sinks that are not stopped yet. The hooks are registered once for all of
+# them and don't keep stopped or dropped sinks alive.
+_sinks: 'weakref.WeakSet[BatchingSink]' = weakref.WeakSet()
+
+
+def _restart_sinks():
+    for sink in list(_sinks):
+        sink._restart()  # pylint: disable=protected-access
+
+
+def _stop_sinks():
+    for sink in list(_sinks):
+        sink.stop()
+
+
+os.register_at_fork(after_in_child=_restart_sinks)
+atexit.register(_stop_sinks)
@@ -10,6 +10,8 @@ from loguru import logger
 
 from config import CONFIG
 from src import create_app
+from src.api.balances import customers
+from src.api.idempotency import replays
 
 
 @pytest.fixture
@@ -64,6 +66,13 @@ def prepare_db(current_app):  # pylint: disable=redefined-outer-name
         downgrade(config, 'base')
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Caches live as long as the process, the database is recreated per test.
+    customers.clear()
+    replays.clear()
+
+
 @pytest.fixture
 def client(current_app):  # pylint: disable=redefined-outer-name
     with current_app.test_client() as _client:
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import json
+from uuid import uuid4
+
+import pytest
+import status
+
+pytest.importorskip('asyncpg')
+pytest.importorskip('starlette')
+
+# pylint: disable=wrong-import-position
+from starlette.testclient import TestClient  # noqa: E402
+
+from src.asgi import create_asgi_app  # noqa: E402
+
+
+@pytest.fixture
+def asgi_client():
+    with TestClient(create_asgi_app()) as _client:
+        yield _client
+
+
+@pytest.mark.asgi
+def test_asgi_customer(asgi_client):
+    response = asgi_client.post('/v1/customer', json={'name': 'Иванов'})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == {'id': 1}
+
+    response = asgi_client.put('/v1/customer/1', json={'name': 'Петров'})
+    assert response.json() == {'id': 1, 'name': 'Петров'}
+    response = asgi_client.get('/v1/customer/1')
+    assert response.json() == {'id': 1, 'name': 'Петров'}
+
+    response = asgi_client.delete('/v1/customer/1')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = asgi_client.get('/v1/customer/1')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == \
+        {'status': 'error', 'message': 'Resource not found.'}
+    response = asgi_client.delete('/v1/customer/1')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asgi
+def test_asgi_operations(asgi_client):
+    for name in ('Иванов', 'Сидоров'):
+        asgi_client.post('/v1/customer', json={'name': name})
+
+    response = asgi_client.post(
+        '/v1/customer/1/replenishment', json={'amount': 100},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    body = response.json()
+    assert (body['amount_was'], body['amount_become']) == (0, 100)
+
+    response = asgi_client.post(
+        '/v1/customer/1/transfer', json={'customer_id': 2, 'amount': 30},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    body = response.json()
+    assert body['sender'] == {
+        'customer_id': 1,
+        'amount_was': 100,
+        'amount_become': 70,
+        'operation_amount': -30,
+    }
+    assert body['recipient']['amount_become'] == 30
+
+    response = asgi_client.get('/v1/customer/2/balance')
+    assert response.json() == {'id': 2, 'amount': 30}
+    response = asgi_client.get(
+        '/v1/customer/1/operations', params={'limit': 1},
+    )
+    page = response.json()
+    assert [row['operation_amount'] for row in page['operations']] == [-30]
+    response = asgi_client.get(
+        '/v1/customer/1/operations',
+        params={'limit': 1, 'cursor': page['next_cursor']},
+    )
+    page = response.json()
+    assert [row['operation_amount'] for row in page['operations']] == [100]
+    assert page['next_cursor'] is None
+
+
+@pytest.mark.asgi
+def test_asgi_errors(asgi_client, client):
+    asgi_client.post('/v1/customer', json={'name': 'Иванов'})
+
+    for path, data in (
+            ('/v1/customer/1/replenishment', {'amount': -1}),
+            ('/v1/customer/1/transfer', {'customer_id': 1}),
+            ('/v1/customer', {}),
+    ):
+        response = asgi_client.post(path, json=data)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json() == json.loads(client.post(path, json=data).data)
+
+    response = asgi_client.post(
+        '/v1/customer/1/transfer', json={'customer_id': 2, 'amount': 10},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == \
+        {'status': 'error', 'message': "Customer 2 doesn't exist"}
+    response = asgi_client.post(
+        '/v1/customer/2/transfer', json={'customer_id': 1, 'amount': 10},
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = asgi_client.post(
+        '/v1/customer/1/transfer', json={'customer_id': 1, 'amount': 10},
+    )
+    assert response.json() == \
+        {'status': 'error', 'message': "Customer 1 doesn't have enough money"}
+    response = asgi_client.get('/v1/customer/1/replenishment')
+    assert response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+
+@pytest.mark.asgi
+def test_asgi_idempotency(asgi_client, client):
+    asgi_client.post('/v1/customer', json={'name': 'Иванов'})
+    headers = {'Idempotency-Key': str(uuid4())}
+
+    first = asgi_client.post(
+        '/v1/customer/1/replenishment', json={'amount': 100}, headers=headers,
+    )
+    second = asgi_client.post(
+        '/v1/customer/1/replenishment', json={'amount': 100}, headers=headers,
+    )
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.json() == first.json()
+    # Keys are shared with the sync application.
+    third = client.post(
+        '/v1/customer/1/replenishment', json={'amount': 100}, headers=headers,
+    )
+    assert json.loads(third.data) == first.json()
+    assert asgi_client.get('/v1/customer/1/balance').json()['amount'] == 100
+
+
+@pytest.mark.asgi
+def test_asgi_sharded_wallet(asgi_client, current_app):
+    for name in ('Иванов', 'Сидоров'):
+        asgi_client.post('/v1/customer', json={'name': name})
+    asgi_client.post('/v1/customer/1/replenishment', json={'amount': 100})
+    result = current_app.test_cli_runner().invoke(
+        args=['wallets', 'shard', '2', '4'],
+    )
+    assert result.exit_code == 0, result.output
+
+    for _ in range(5):
+        response = asgi_client.post(
+            '/v1/customer/1/transfer', json={'customer_id': 2, 'amount': 10},
+        )
+        assert response.status_code == status.HTTP_200_OK
+    response = asgi_client.post(
+        '/v1/customer/2/replenishment', json={'amount': 5},
+    )
+    assert response.json()['amount_become'] == 55
+    response = asgi_client.post(
+        '/v1/customer/2/transfer', json={'customer_id': 1, 'amount': 55},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['sender']['amount_was'] == 55
+    assert asgi_client.get('/v1/customer/1/balance').json()['amount'] == 105
+    assert asgi_client.get('/v1/customer/2/balance').json()['amount'] == 0
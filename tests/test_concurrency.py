@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+import gc
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pytest
+import status
+
+from config import CONFIG
+from src import create_app, init_worker, prepare_fork
+from src.api.models import CustomerModel, OperationModel, WalletModel
+from src.extensions import db
+
+
+THREADS = 8
+TRANSFERS_PER_THREAD = 25
+
+
+@pytest.mark.operation
+@pytest.mark.parametrize('engine', ['orm', 'cte'])
+def test_opposite_transfers_do_not_deadlock(current_app, engine):
+    # pylint: disable=no-member
+    current_app.config['TRANSFER_ENGINE'] = engine
+    with current_app.app_context():
+        for name in ('Иванов', 'Сидоров', 'Петров'):
+            customer = CustomerModel(name=name)
+            customer.wallet.amount = 1000
+            db.session.add(customer)
+        db.session.commit()
+
+    routes = [(1, 2), (2, 1), (2, 3), (3, 1), (1, 3), (3, 2)]
+
+    def worker(number):
+        codes = []
+        with current_app.test_client() as client:
+            for step in range(TRANSFERS_PER_THREAD):
+                sender_id, recipient_id = routes[(number + step) % len(routes)]
+                response = client.post(
+                    f'/v1/customer/{sender_id}/transfer',
+                    json={'customer_id': recipient_id, 'amount': 7},
+                )
+                codes.append(response.status_code)
+                if response.status_code == status.HTTP_400_BAD_REQUEST:
+                    message = json.loads(response.data)['message']
+                    assert 'enough money' in message
+        return codes
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        codes = [
+            code
+            for result in executor.map(worker, range(THREADS))
+            for code in result
+        ]
+
+    assert set(codes) <= {status.HTTP_200_OK, status.HTTP_400_BAD_REQUEST}
+    with current_app.app_context():
+        assert db.session.query(db.func.sum(WalletModel.amount)).scalar() \
+            == 3000
+        assert OperationModel.query.count() == \
+            2 * codes.count(status.HTTP_200_OK)
+
+
+@pytest.mark.operation
+def test_opposite_transfers_with_sharded_recipient(current_app):
+    # pylint: disable=no-member
+    # Credits to the unlocked sharded wallet take a key share lock on it
+    # through the operations foreign key, while the opposite transfer holds
+    # the wallet and waits for the sender's one.
+    with current_app.app_context():
+        for name in ('Иванов', 'Сидоров'):
+            customer = CustomerModel(name=name)
+            customer.wallet.amount = 1000
+            db.session.add(customer)
+        db.session.commit()
+    result = current_app.test_cli_runner().invoke(
+        args=['wallets', 'shard', '1', '4'],
+    )
+    assert result.exit_code == 0, result.output
+
+    def worker(number):
+        sender_id, recipient_id = (1, 2) if number % 2 else (2, 1)
+        with current_app.test_client() as client:
+            return [
+                client.post(
+                    f'/v1/customer/{sender_id}/transfer',
+                    json={'customer_id': recipient_id, 'amount': 1},
+                ).status_code
+                for _ in range(TRANSFERS_PER_THREAD)
+            ]
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        codes = [
+            code
+            for result in executor.map(worker, range(THREADS))
+            for code in result
+        ]
+
+    assert set(codes) == {status.HTTP_200_OK}
+    with current_app.app_context():
+        balances = db.session.execute(
+            'SELECT sum(amount) FROM wallets',
+        ).scalar() + db.session.execute(
+            'SELECT sum(amount) FROM wallet_shards',
+        ).scalar()
+        assert balances == 2000
+
+
+@pytest.mark.operation
+def test_duplicate_replenishments_execute_once(current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.commit()
+
+    keys = [str(uuid4()) for _ in range(3)]
+
+    def worker(number):
+        with current_app.test_client() as client:
+            return [
+                client.post(
+                    '/v1/customer/1/replenishment',
+                    json={'amount': 10},
+                    headers={'Idempotency-Key': key},
+                )
+                for key in keys[number % len(keys):] + keys
+            ]
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        responses = [
+            response
+            for result in executor.map(worker, range(THREADS))
+            for response in result
+        ]
+
+    assert {response.status_code for response in responses} == \
+        {status.HTTP_200_OK}
+    transactions = {
+        json.loads(response.data)['transaction'] for response in responses
+    }
+    assert len(transactions) == len(keys)
+    with current_app.app_context():
+        assert CustomerModel.query.get(1).wallet.amount == 10 * len(keys)
+        assert OperationModel.query.count() == len(keys)
+
+
+@pytest.mark.operation
+def test_group_committed_replenishments(current_app):
+    # pylint: disable=no-member
+    current_app.config['REPLENISHMENT_GROUP_COMMIT'] = True
+    current_app.config['REPLENISHMENT_GROUP_WINDOW'] = 0.02
+    with current_app.app_context():
+        for name in ('Иванов', 'Сидоров'):
+            db.session.add(CustomerModel(name=name))
+        db.session.commit()
+
+    def worker(number):
+        with current_app.test_client() as client:
+            return [
+                client.post(
+                    f'/v1/customer/{1 + (number + step) % 3}/replenishment',
+                    json={'amount': number + 1},
+                )
+                for step in range(TRANSFERS_PER_THREAD)
+            ]
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        responses = [
+            response
+            for result in executor.map(worker, range(THREADS))
+            for response in result
+        ]
+
+    committed = [
+        json.loads(response.data)
+        for response in responses
+        if response.status_code == status.HTTP_200_OK
+    ]
+    # Customer 3 doesn't exist.
+    assert len(committed) + sum(
+        response.status_code == status.HTTP_404_NOT_FOUND
+        for response in responses
+    ) == len(responses)
+    committer = current_app.extensions['group_committer']
+    assert committer.committed == len(responses)
+    assert committer.batches < len(responses)
+    with current_app.app_context():
+        for customer_id in (1, 2):
+            replenishments = sorted(
+                (item['amount_was'], item['amount_become'])
+                for item in committed
+                if item['customer_id'] == customer_id
+            )
+            # Every request saw its own step of the balance.
+            for (_, become), (was, _) in \
+                    zip(replenishments, replenishments[1:]):
+                assert become == was
+            assert replenishments[0][0] == 0
+            assert CustomerModel.query.get(customer_id).wallet.amount == \
+                replenishments[-1][1]
+        assert OperationModel.query.count() == len(committed)
+        assert {
+            str(operation.transaction)
+            for operation in OperationModel.query
+        } == {item['transaction'] for item in committed}
+
+
+@pytest.mark.operation
+def test_requests_wait_for_pool_connections(current_app, monkeypatch):
+    # pylint: disable=no-member
+    monkeypatch.setattr(CONFIG, 'DATABASE_POOL_SIZE', 2)
+    monkeypatch.setattr(CONFIG, 'DATABASE_MAX_OVERFLOW', 1)
+    monkeypatch.setattr(CONFIG, 'DATABASE_POOL_TIMEOUT', 10.0)
+    app = create_app()
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.commit()
+
+    def worker(_):
+        with app.test_client() as client:
+            return [
+                client.post(
+                    '/v1/customer/1/replenishment', json={'amount': 1},
+                ).status_code
+                for _ in range(TRANSFERS_PER_THREAD)
+            ]
+
+    with ThreadPoolExecutor(max_workers=THREADS * 2) as executor:
+        codes = [
+            code
+            for result in executor.map(worker, range(THREADS * 2))
+            for code in result
+        ]
+
+    assert set(codes) == {status.HTTP_200_OK}
+    with app.test_client() as client:
+        stats = json.loads(client.get('/monitoring/pool').data)
+    assert stats['checked_out_max'] == 3
+    assert stats['timeouts'] == 0
+    assert stats['checkouts'] >= len(codes)
+    assert stats['acquire_seconds_max'] < 10.0
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.mark.operation
+def test_pool_checkout_times_out(current_app, monkeypatch):
+    # pylint: disable=no-member
+    monkeypatch.setattr(CONFIG, 'DATABASE_POOL_SIZE', 1)
+    monkeypatch.setattr(CONFIG, 'DATABASE_MAX_OVERFLOW', 0)
+    monkeypatch.setattr(CONFIG, 'DATABASE_POOL_TIMEOUT', 0.2)
+    app = create_app()
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.commit()
+
+    with app.app_context():
+        held = db.engine.connect()
+        with app.test_client() as client:
+            started = time.monotonic()
+            response = client.post(
+                '/v1/customer/1/replenishment', json={'amount': 1},
+            )
+            assert response.status_code == \
+                status.HTTP_500_INTERNAL_SERVER_ERROR
+            assert time.monotonic() - started < 2
+        held.close()
+        with app.test_client() as client:
+            stats = json.loads(client.get('/monitoring/pool').data)
+        assert stats['timeouts'] == 1
+        assert stats['acquire_seconds_max'] >= 0.2
+        db.engine.dispose()
+
+
+@pytest.mark.operation
+def test_preloaded_app_forks(current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.commit()
+
+    prepare_fork(current_app)
+    # Nothing for the worker to inherit.
+    assert db.get_engine(current_app).pool.checkedin() == 0
+    pid = os.fork()
+    if not pid:
+        code = 1
+        try:
+            init_worker(current_app)
+            with current_app.test_client() as client:
+                response = client.post(
+                    '/v1/customer/1/replenishment', json={'amount': 10},
+                )
+            code = 0 if response.status_code == status.HTTP_200_OK else 1
+        finally:
+            os._exit(code)  # pylint: disable=protected-access
+    gc.unfreeze()
+    _, code = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(code) == 0
+
+    # The connections of the master survive the exit of the worker.
+    with current_app.app_context():
+        assert CustomerModel.query.get(1).wallet.amount == 10
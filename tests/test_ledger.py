@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime
+from itertools import count
+from uuid import UUID
+
+import pytest
+
+from src import ledger
+from src.api.journal import materialize_journal
+from src.api.models import (
+    CustomerModel, OperationJournalModel, OperationModel, WalletModel,
+    WalletShardModel,
+)
+from src.api.wallets import PostgresLedger
+from src.exceptions import BillingError
+from src.extensions import db
+from src.ledger import MemoryLedger
+
+
+CUSTOMERS = 6
+
+
+def random_actions(seed: int, size: int):
+    # Unknown, deleted and self transfers and overdrafts included.
+    generator = random.Random(seed)
+
+    def customer():
+        return generator.randint(0, CUSTOMERS + 1)
+
+    for _ in range(size):
+        kind = generator.random()
+        if kind < 0.25:
+            yield 'replenish', (customer(), generator.randint(1, 500))
+        elif kind < 0.3:
+            yield 'replenish_batch', [
+                (customer(), generator.randint(1, 500))
+                for _ in range(generator.randint(1, 5))
+            ]
+        elif kind < 0.9:
+            yield 'transfer', \
+                (customer(), customer(), generator.randint(1, 300))
+        else:
+            yield 'transfer_batch', [
+                (customer(), customer(), generator.randint(1, 300))
+                for _ in range(generator.randint(1, 5))
+            ]
+
+
+def replay(backend: ledger.Ledger, actions, commit, rollback) -> list:
+    transactions = (UUID(int=n) for n in count(1))
+    outcomes = []
+    for kind, args in actions:
+        try:
+            if kind == 'replenish':
+                result = ledger.replenish(backend, *args, next(transactions))
+            elif kind == 'transfer':
+                result = ledger.transfer(backend, *args, next(transactions))
+            elif kind == 'replenish_batch':
+                result = [
+                    type(item).__name__
+                    if isinstance(item, BillingError) else item
+                    for item in ledger.replenish_batch(
+                        backend,
+                        [
+                            (customer_id, amount, next(transactions))
+                            for customer_id, amount in args
+                        ],
+                        datetime.utcnow(),
+                    )
+                ]
+            else:
+                results, changed = ledger.transfer_batch(
+                    backend, args, datetime.utcnow(),
+                    lambda: next(transactions),
+                )
+                result = (
+                    [
+                        type(item).__name__
+                        if isinstance(item, BillingError) else item
+                        for item in results
+                    ],
+                    sorted(changed),
+                )
+        except BillingError as error:
+            rollback()
+            outcomes.append(type(error).__name__)
+        else:
+            commit()
+            outcomes.append(result)
+    return outcomes
+
+
+def net_amounts(operations) -> dict:
+    # Sums by wallet: sweeps of shards only move money within one, so these
+    # agree whether or not the wallet is sharded.
+    amounts: dict = {}
+    for operation in operations:
+        amounts[operation.wallet_id] = \
+            amounts.get(operation.wallet_id, 0) + operation.operation_amount
+    return {
+        wallet_id: amount for wallet_id, amount in amounts.items() if amount
+    }
+
+
+@pytest.mark.wallet
+@pytest.mark.parametrize('seed', [1, 2, 3])
+@pytest.mark.parametrize('storage', ['wallets', 'shards', 'journal'])
+def test_ledger_backends_agree(client, current_app, seed, storage):
+    # pylint: disable=no-member
+    # MemoryLedger has no shards, so with customers 2 and 3 sharded on the
+    # Postgres side operations are compared by net amounts of wallets, and
+    # customers changed by a batch only have to be among the Postgres ones,
+    # which include the swept ones.
+    actions = list(random_actions(seed, 300))
+    memory = MemoryLedger()
+    current_app.config['OPERATIONS_JOURNAL'] = storage == 'journal'
+    with current_app.app_context():
+        for _ in range(CUSTOMERS):
+            customer = CustomerModel(name='Иванов')
+            customer.wallet.amount = 100
+            db.session.add(customer)
+            db.session.commit()
+            memory.add_customer(100)
+        CustomerModel.query.get(CUSTOMERS).deleted = True
+        db.session.commit()
+        memory.delete_customer(CUSTOMERS)
+        if storage == 'shards':
+            runner = current_app.test_cli_runner()
+            for customer_id in (2, 3):
+                result = runner.invoke(
+                    args=['wallets', 'shard', str(customer_id), '4'],
+                )
+                assert result.exit_code == 0, result.output
+
+        expected = replay(
+            PostgresLedger(), actions, db.session.commit, db.session.rollback,
+        )
+        outcomes = replay(memory, actions, lambda: None, lambda: None)
+        assert bool(db.session.query(OperationJournalModel).count()) == \
+            (storage == 'journal')
+        while materialize_journal(100):
+            pass
+
+        for customer_id in range(1, CUSTOMERS):
+            wallet = CustomerModel.query.get(customer_id).wallet
+            shards = db.session.query(db.func.sum(WalletShardModel.amount))\
+                .filter(WalletShardModel.wallet_id == wallet.id).scalar()
+            assert memory.balance(customer_id) == wallet.amount + (shards or 0)
+        operations = OperationModel.query.order_by(OperationModel.id).all()
+        assert db.session.query(OperationJournalModel).count() == 0
+        if storage == 'shards':
+            for outcome, sharded in zip(outcomes, expected):
+                if isinstance(outcome, tuple) and \
+                        not isinstance(outcome, ledger.Transfer):
+                    assert outcome[0] == sharded[0]
+                    assert set(outcome[1]) <= set(sharded[1])
+                else:
+                    assert outcome == sharded
+            assert len(outcomes) == len(expected)
+            assert net_amounts(memory.operations()) == \
+                net_amounts(operations)
+            return
+        assert outcomes == expected
+        assert list(memory.operations()) == [
+            ledger.Operation(
+                operation.transaction,
+                operation.wallet_id,
+                operation.amount_was,
+                operation.amount_become,
+                operation.operation_amount,
+                operation.shard,
+            )
+            for operation in operations
+        ]
+        assert sum(memory.balances) == \
+            db.session.query(db.func.sum(WalletModel.amount)).scalar()
+
+
+def test_ledger_backends_implement_every_method():
+    class PartialLedger(ledger.Ledger):
+        def lock(self, customer_ids, credit_only=()):
+            return {}
+
+    with pytest.raises(TypeError):
+        PartialLedger()  # pylint: disable=abstract-class-instantiated
+    PostgresLedger()
+    MemoryLedger()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+from loguru import logger
+
+from config import CONFIG
+from src import create_app
+from src.api.models import CustomerModel
+from src.extensions import db
+from src.utils.log_sink import BatchingSink
+
+
+def read_records(path):
+    with open(path, encoding='utf-8') as stream:
+        return [json.loads(line) for line in stream]
+
+
+@pytest.mark.basic
+def test_batching_sink_format(tmp_path):
+    expected, batched = tmp_path / 'expected.log', tmp_path / 'batched.log'
+    sink = BatchingSink(str(batched), flush_interval=0.05)
+    handler_ids = [
+        logger.add(str(expected), serialize=True, diagnose=False),
+        logger.add(sink, diagnose=False),
+    ]
+    try:
+        logger.bind(customer_id=1).info('Transfer {}', 100)
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            logger.exception('Failed')
+    finally:
+        for handler_id in handler_ids:
+            logger.remove(handler_id)
+    sink.stop()
+
+    assert sink.written == 2
+    assert read_records(batched) == read_records(expected)
+
+
+@pytest.mark.basic
+def test_batching_sink_drops(tmp_path):
+    dropped = []
+    sink = BatchingSink(
+        str(tmp_path / 'billing.log'), maxsize=2,
+        on_drop=lambda: dropped.append(1),
+    )
+    # Nothing drains the queue once the writer is stopped.
+    sink.stop()
+    handler_id = logger.add(sink)
+    try:
+        for number in range(5):
+            logger.info('Record {}', number)
+    finally:
+        logger.remove(handler_id)
+
+    assert sink.dropped == 3
+    assert len(dropped) == 3
+
+
+@pytest.mark.basic
+def test_batching_sink_unwritable_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        BatchingSink(str(tmp_path / 'missing' / 'billing.log'))
+
+
+@pytest.mark.basic
+def test_async_request_log(monkeypatch, tmp_path):
+    # pylint: disable=no-member
+    path = tmp_path / 'billing.log'
+    monkeypatch.setattr(CONFIG, 'LOG_FILE', str(path))
+    monkeypatch.setattr(CONFIG, 'LOG_ASYNC', True)
+    monkeypatch.setattr(CONFIG, 'LOG_REQUESTS', True)
+    monkeypatch.setattr(CONFIG, 'LOG_FLUSH_INTERVAL', 0.05)
+    app = create_app()
+    with app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.commit()
+
+        response = app.test_client().get(
+            '/v1/customer/1/balance', headers={'X-Request-Id': 'abc'},
+        )
+        assert response.status_code == 200
+
+    from src import log_sink  # pylint: disable=import-outside-toplevel
+    log_sink.stop()
+    records = [
+        record['record'] for record in read_records(path)
+        if record['record']['extra'].get('request_id') == 'outer-abc'
+    ]
+    assert len(records) == 1
+    assert records[0]['message'].startswith(
+        'GET /v1/customer/1/balance 200 '
+    )
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+import pytest
+import status
+from prometheus_client import REGISTRY
+
+from src.api.models import CustomerModel
+from src.extensions import db
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.basic
+def test_metrics(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        customer1 = CustomerModel(name='Иванов')
+        customer2 = CustomerModel(name='Сидоров')
+        customer1.wallet.amount = 100
+        db.session.add(customer1)
+        db.session.add(customer2)
+        db.session.commit()
+
+        samples = {
+            'ok': ('billing_http_requests_total', {
+                'endpoint': 'v1.transfer', 'method': 'POST', 'status': '200',
+            }),
+            'failed': ('billing_http_requests_total', {
+                'endpoint': 'v1.transfer', 'method': 'POST', 'status': '400',
+            }),
+            'requests': ('billing_http_request_duration_seconds_count', {
+                'endpoint': 'v1.transfer', 'method': 'POST',
+            }),
+            'statements': ('billing_db_statement_duration_seconds_count', {
+                'endpoint': 'v1.transfer', 'statement': 'INSERT',
+            }),
+            'commits': ('billing_db_transactions_total', {
+                'outcome': 'commit',
+            }),
+            'errors': ('billing_errors_total', {
+                'error': 'SenderNotEnoughMoneyError',
+            }),
+        }
+        before = {
+            key: sample(name, **labels)
+            for key, (name, labels) in samples.items()
+        }
+        for amount in (60, 60):
+            client.post(
+                '/v1/customer/1/transfer',
+                json={'customer_id': 2, 'amount': amount},
+            )
+        delta = {
+            key: sample(name, **labels) - before[key]
+            for key, (name, labels) in samples.items()
+        }
+        assert delta == {
+            'ok': 1,
+            'failed': 1,
+            'requests': 2,
+            'statements': 2,
+            'commits': 1,
+            'errors': 1,
+        }
+
+        response = client.get('/metrics')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.mimetype == 'text/plain'
+        assert 'billing_http_requests_total{endpoint="v1.transfer",' \
+            'method="POST",status="200"}' in response.data.decode()
+
+
+@pytest.mark.basic
+def test_metrics_item_errors(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        customer = CustomerModel(name='Иванов')
+        customer.wallet.amount = 10
+        db.session.add(customer)
+        db.session.commit()
+
+        def errors():
+            return [
+                sample('billing_errors_total', error=error)
+                for error in (
+                    'SenderNotExistError', 'SenderNotEnoughMoneyError',
+                )
+            ]
+
+        before = errors()
+        client.post('/v1/transfers/batch', json={'transfers': [
+            {'sender_id': 1, 'customer_id': 1, 'amount': 5},
+            {'sender_id': 1, 'customer_id': 1, 'amount': 50},
+            {'sender_id': 7, 'customer_id': 1, 'amount': 5},
+        ]})
+        client.post('/v1/customer/7/replenishment', json={'amount': 5})
+        assert [count - was for count, was in zip(errors(), before)] == [2, 1]
+
+
+@pytest.mark.basic
+def test_gunicorn_conf_enables_multiprocess_metrics():
+    # The value class of prometheus_client is picked on its import, so
+    # gunicorn_conf has to set the directory before it, or /metrics of the
+    # workers stays empty.
+    env = dict(os.environ)
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    output = subprocess.run(
+        [
+            sys.executable, '-c',
+            'import gunicorn_conf; from prometheus_client import values; '
+            'print(values.ValueClass.__name__)',
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    assert output.strip() == 'MmapedValue'
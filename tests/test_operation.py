@@ -1,10 +1,21 @@
 # -*- coding: utf-8 -*-
+import csv
+import gzip
 import json
+from datetime import datetime, timedelta
+from uuid import uuid4
 
 import pytest
 import status
 
-from src.api.models import CustomerModel
+from src.api.idempotency import replays
+from src.api.models import (
+    CustomerModel, OperationJournalModel, OperationModel, WalletModel,
+)
+from src.api.partitions import (
+    ArchiveError, archive_partitions, month_start, operations_partitions,
+)
+from src.api.snapshots import take_snapshot
 from src.extensions import db
 
 
@@ -73,7 +84,7 @@ def test_replenishment(client, current_app):
 def test_replenishment_consistency(client, current_app, mocker):
     # pylint: disable=no-member
     mocker.patch(
-        'src.api.views.register_operation', side_effect=RuntimeError('test'),
+        'src.api.wallets.register_operation', side_effect=RuntimeError('test'),
     )
     with current_app.app_context():
         customer = CustomerModel(name='Иванов')
@@ -192,7 +203,7 @@ def test_transfer_no_recipient(client, current_app):
 def test_transfer_consistency(client, current_app, mocker):
     # pylint: disable=no-member
     mocker.patch(
-        'src.api.views.register_operation', side_effect=RuntimeError('test'),
+        'src.api.wallets.register_operation', side_effect=RuntimeError('test'),
     )
     with current_app.app_context():
         customer1 = CustomerModel(name='Иванов')
@@ -219,3 +230,648 @@ def test_transfer_consistency(client, current_app, mocker):
         assert customer2.wallet.amount == 0
         operations2 = customer2.wallet.operations
         assert len(operations2) == 0
+
+
+@pytest.mark.operation
+def test_transfer_batch(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        customer1 = CustomerModel(name='Иванов')
+        customer2 = CustomerModel(name='Сидоров')
+        customer1.wallet.amount = 200
+        db.session.add(customer1)
+        db.session.add(customer2)
+        db.session.commit()
+        response = client.post(
+            '/v1/transfers/batch',
+            json={
+                'transfers': [
+                    {'sender_id': 1, 'customer_id': 2, 'amount': 150},
+                    {'sender_id': 1, 'customer_id': 2, 'amount': 100},
+                    {'sender_id': 2, 'customer_id': 1, 'amount': 50},
+                    {'sender_id': 1, 'customer_id': 3, 'amount': 10},
+                ],
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        results = json.loads(response.data)['transfers']
+        assert [result['status'] for result in results] == \
+            ['ok', 'error', 'ok', 'error']
+        assert results[0]['sender'] == {
+            'amount_become': 50,
+            'amount_was': 200,
+            'customer_id': 1,
+            'operation_amount': -150,
+        }
+        assert results[1]['message'] == \
+            "Customer 1 doesn't have enough money"
+        assert results[2]['recipient'] == {
+            'amount_become': 100,
+            'amount_was': 50,
+            'customer_id': 1,
+            'operation_amount': 50,
+        }
+        assert results[3]['message'] == "Customer 3 doesn't exist"
+
+        customer1 = CustomerModel.query.get(1)
+        assert customer1.wallet.amount == 100
+        operations1 = sorted(customer1.wallet.operations, key=lambda x: x.id)
+        assert [operation.operation_amount for operation in operations1] == \
+            [-150, 50]
+        customer2 = CustomerModel.query.get(2)
+        assert customer2.wallet.amount == 100
+        assert len(customer2.wallet.operations) == 2
+
+
+@pytest.mark.operation
+def test_transfer_batch_empty(client):
+    response = client.post('/v1/transfers/batch', json={'transfers': []})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.operation
+def test_transfer_cte(client, current_app):
+    # pylint: disable=no-member
+    current_app.config['TRANSFER_ENGINE'] = 'cte'
+    with current_app.app_context():
+        customer1 = CustomerModel(name='Иванов')
+        customer2 = CustomerModel(name='Сидоров')
+        customer1.wallet.amount = 200
+        db.session.add(customer1)
+        db.session.add(customer2)
+        db.session.commit()
+        response = client.post(
+            '/v1/customer/1/transfer',
+            json={'customer_id': 2, 'amount': 100},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        response_data = json.loads(response.data)
+        assert response_data['recipient'] == {
+            'amount_become': 100,
+            'amount_was': 0,
+            'customer_id': 2,
+            'operation_amount': 100,
+        }
+        assert response_data['sender'] == {
+            'amount_become': 100,
+            'amount_was': 200,
+            'customer_id': 1,
+            'operation_amount': -100,
+        }
+        customer1 = CustomerModel.query.get(1)
+        assert customer1.wallet.amount == 100
+        operations1 = customer1.wallet.operations
+        assert len(operations1) == 1
+        assert operations1[0].amount_was == 200
+        assert operations1[0].amount_become == 100
+        assert str(operations1[0].transaction) == response_data['transaction']
+        customer2 = CustomerModel.query.get(2)
+        assert customer2.wallet.amount == 100
+        operations2 = customer2.wallet.operations
+        assert len(operations2) == 1
+        assert operations2[0].amount_was == 0
+        assert operations2[0].amount_become == 100
+
+
+@pytest.mark.operation
+@pytest.mark.parametrize('sender_id, recipient_id, code, message', [
+    (1, 2, status.HTTP_400_BAD_REQUEST,
+     "Customer 1 doesn't have enough money"),
+    (1, 3, status.HTTP_400_BAD_REQUEST, "Customer 3 doesn't exist"),
+    (3, 1, status.HTTP_404_NOT_FOUND, 'Resource not found.'),
+])
+def test_transfer_cte_errors(
+        client, current_app, sender_id, recipient_id, code, message,
+):
+    # pylint: disable=no-member,too-many-arguments
+    current_app.config['TRANSFER_ENGINE'] = 'cte'
+    with current_app.app_context():
+        customer1 = CustomerModel(name='Иванов')
+        customer2 = CustomerModel(name='Сидоров')
+        customer1.wallet.amount = 50
+        db.session.add(customer1)
+        db.session.add(customer2)
+        db.session.commit()
+        response = client.post(
+            f'/v1/customer/{sender_id}/transfer',
+            json={'customer_id': recipient_id, 'amount': 100},
+        )
+        assert response.status_code == code
+        assert json.loads(response.data)['message'] == message
+        customer1 = CustomerModel.query.get(1)
+        assert customer1.wallet.amount == 50
+        assert len(customer1.wallet.operations) == 0
+
+
+@pytest.mark.operation
+def test_operations_history(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        customer1 = CustomerModel(name='Иванов')
+        customer2 = CustomerModel(name='Сидоров')
+        db.session.add(customer1)
+        db.session.add(customer2)
+        db.session.commit()
+        for amount in range(1, 6):
+            client.post(
+                '/v1/customer/1/replenishment', json={'amount': amount},
+            )
+        client.post(
+            '/v1/customer/1/transfer', json={'customer_id': 2, 'amount': 7},
+        )
+
+        pages = []
+        cursor = None
+        while True:
+            query = {'limit': 2}
+            if cursor:
+                query['cursor'] = cursor
+            response = client.get(
+                '/v1/customer/1/operations', query_string=query,
+            )
+            assert response.status_code == status.HTTP_200_OK
+            response_data = json.loads(response.data)
+            pages.append([
+                row['operation_amount']
+                for row in response_data['operations']
+            ])
+            cursor = response_data['next_cursor']
+            if not cursor:
+                break
+        assert pages == [[-7, 5], [4, 3], [2, 1]]
+
+        response = client.get(
+            '/v1/customer/1/operations', query_string={'sign': 'debit'},
+        )
+        operations = json.loads(response.data)['operations']
+        assert [row['operation_amount'] for row in operations] == [-7]
+        assert operations[0]['amount_was'] == 15
+        assert operations[0]['amount_become'] == 8
+
+        response = client.get(
+            '/v1/customer/1/operations',
+            query_string={'until': operations[0]['processed_at'], 'limit': 1},
+        )
+        operations = json.loads(response.data)['operations']
+        assert [row['operation_amount'] for row in operations] == [5]
+
+
+@pytest.mark.operation
+def test_operations_history_invalid(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        response = client.get('/v1/customer/1/operations')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.commit()
+        response = client.get(
+            '/v1/customer/1/operations', query_string={'cursor': 'broken'},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert json.loads(response.data)['message'][0]['loc'] == ['cursor']
+
+
+@pytest.mark.operation
+def test_operations_export(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        customer1 = CustomerModel(name='Иванов')
+        customer2 = CustomerModel(name='Сидоров')
+        customer1.wallet.amount = 200
+        db.session.add(customer1)
+        db.session.add(customer2)
+        db.session.commit()
+        client.post(
+            '/v1/customer/1/transfer', json={'customer_id': 2, 'amount': 50},
+        )
+        client.post('/v1/customer/2/replenishment', json={'amount': 10})
+
+        response = client.get(
+            '/v1/operations/export', headers={'Accept-Encoding': 'gzip'},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.mimetype == 'application/x-ndjson'
+        assert 'Content-Encoding' not in response.headers
+        rows = [json.loads(line) for line in response.data.splitlines()]
+        assert [row['operation_amount'] for row in rows] == [-50, 50, 10]
+        assert rows[0]['transaction'] == rows[1]['transaction']
+
+        response = client.get(
+            '/v1/operations/export',
+            query_string={'format': 'csv', 'wallet_id': 2},
+        )
+        assert response.mimetype == 'text/csv'
+        lines = response.data.decode().splitlines()
+        assert lines[0] == (
+            'id,transaction,wallet_id,shard,amount_was,amount_become,'
+            'operation_amount,processed_at'
+        )
+        assert [line.split(',')[6] for line in lines[1:]] == ['50', '10']
+
+        runner = current_app.test_cli_runner()
+        result = runner.invoke(
+            args=['operations', 'export', '--wallet-id', '1'],
+        )
+        assert result.exit_code == 0, result.output
+        rows = [json.loads(line) for line in result.output.splitlines()]
+        assert [row['operation_amount'] for row in rows] == [-50]
+
+
+@pytest.mark.operation
+def test_balance_snapshots(client, current_app):
+    # pylint: disable=no-member
+    def day(number):
+        return datetime(2020, 1, 1) + timedelta(days=number)
+
+    def balance(customer_id, at):
+        response = client.get(
+            f'/v1/customer/{customer_id}/balance',
+            query_string={'at': at.isoformat()},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return json.loads(response.data)['amount']
+
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.add(CustomerModel(name='Сидоров'))
+        db.session.commit()
+        requests = (
+            (1, ('/v1/customer/1/replenishment', {'amount': 100})),
+            (3, ('/v1/customer/1/replenishment', {'amount': 50})),
+            (5, ('/v1/customer/1/transfer', {'customer_id': 2, 'amount': 30})),
+        )
+        for number, (url, data) in requests:
+            client.post(url, json=data)
+            OperationModel.query\
+                .filter(OperationModel.processed_at > day(100))\
+                .update({'processed_at': day(number)})
+            db.session.commit()
+
+        run = take_snapshot(now=day(2), lag=0)
+        assert (run.taken_at, run.total, run.wallets) == (day(2), 100, 1)
+        run = take_snapshot(now=day(4), lag=0)
+        assert (run.taken_at, run.total, run.wallets) == (day(4), 150, 1)
+        assert take_snapshot(now=day(4), lag=0) is None
+
+        assert balance(1, day(0)) == 0
+        assert balance(1, day(2)) == 100
+        assert balance(1, day(3) + timedelta(hours=12)) == 150
+        assert balance(1, day(6)) == 120
+        assert balance(2, day(4)) == 0
+        assert balance(2, day(6)) == 30
+
+        response = client.get(
+            '/v1/reports/liabilities', query_string={'at': day(6)},
+        )
+        assert json.loads(response.data) == {
+            'at': day(6).isoformat(),
+            'amount': 150,
+            'snapshot_at': day(4).isoformat(),
+        }
+        response = client.get(
+            '/v1/reports/liabilities', query_string={'at': day(0)},
+        )
+        assert json.loads(response.data)['snapshot_at'] is None
+
+        response = client.get(
+            '/v1/customer/3/balance', query_string={'at': day(6)},
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = client.get(
+            '/v1/customer/1/balance', query_string={'at': 'yesterday'},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    runner = current_app.test_cli_runner()
+    result = runner.invoke(args=['snapshots', 'take'])
+    assert result.exit_code == 0, result.output
+    assert '2 wallets, total 150' in result.output
+
+
+@pytest.mark.operation
+def test_ledger_check(client, current_app):
+    # pylint: disable=no-member
+    runner = current_app.test_cli_runner()
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.add(CustomerModel(name='Сидоров'))
+        db.session.commit()
+        client.post('/v1/customer/1/replenishment', json={'amount': 100})
+        client.post(
+            '/v1/customer/1/transfer', json={'customer_id': 2, 'amount': 30},
+        )
+        current_app.config['TRANSFER_ENGINE'] = 'cte'
+        response = client.post(
+            '/v1/customer/2/transfer', json={'customer_id': 1, 'amount': 10},
+        )
+        transaction = json.loads(response.data)['transaction']
+
+    result = runner.invoke(args=['ledger', 'check', '--lag', '0'])
+    assert result.exit_code == 0, result.output
+    assert '5 operations, 2 chains, 0 problems' in result.output
+
+    with current_app.app_context():
+        # A balance changed without an operation breaks the next link of
+        # the chain, an operation without a balance change breaks both the
+        # balance and its transaction.
+        WalletModel.query.filter_by(customer_id=2).update({'amount': 21})
+        db.session.add(OperationModel(
+            transaction=transaction,
+            wallet_id=1,
+            amount_was=80,
+            amount_become=85,
+            operation_amount=5,
+        ))
+        db.session.commit()
+        client.post('/v1/customer/2/replenishment', json={'amount': 1})
+
+    result = runner.invoke(
+        args=['ledger', 'check', '--lag', '0', '--workers', '2'],
+    )
+    assert result.exit_code == 1, result.output
+    assert sorted(result.output.splitlines()[:-1]) == [
+        'balance: wallet_id=1 shard=0 expected=85 actual=80',
+        'chain: wallet_id=2 shard=0 operation_id=7 expected=20 actual=21',
+        f'transaction: transaction={transaction} expected=0 actual=5',
+    ]
+
+    result = runner.invoke(args=['ledger', 'check', '--lag', '0'])
+    assert result.exit_code == 0, result.output
+    assert '0 operations' in result.output
+
+
+@pytest.mark.operation
+def test_ledger_check_pending_journal(client, current_app):
+    # pylint: disable=no-member
+    runner = current_app.test_cli_runner()
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.add(CustomerModel(name='Сидоров'))
+        db.session.commit()
+        client.post('/v1/customer/1/replenishment', json={'amount': 100})
+        current_app.config['OPERATIONS_JOURNAL'] = True
+        client.post(
+            '/v1/customer/1/transfer', json={'customer_id': 2, 'amount': 30},
+        )
+        current_app.config['OPERATIONS_JOURNAL'] = False
+        client.post('/v1/customer/2/replenishment', json={'amount': 5})
+        assert OperationJournalModel.query.count() == 1
+
+    # Operations 2 and 3 are still in the journal, wallet 1 already has
+    # them in its amount.
+    result = runner.invoke(args=['ledger', 'check', '--lag', '0'])
+    assert result.exit_code == 0, result.output
+    assert '1 operations, 1 chains, 0 problems' in result.output
+
+    result = runner.invoke(args=['operations', 'materialize', '--once'])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(args=['ledger', 'check', '--lag', '0'])
+    assert result.exit_code == 0, result.output
+    assert '3 operations, 2 chains, 0 problems' in result.output
+
+
+@pytest.mark.operation
+def test_operations_journal(client, current_app):
+    # pylint: disable=no-member
+    def history():
+        response = client.get('/v1/customer/1/operations')
+        return [
+            (row['id'], row['operation_amount'], row['amount_become'])
+            for row in json.loads(response.data)['operations']
+        ]
+
+    runner = current_app.test_cli_runner()
+    current_app.config['OPERATIONS_JOURNAL'] = True
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.add(CustomerModel(name='Сидоров'))
+        db.session.commit()
+        client.post('/v1/customer/1/replenishment', json={'amount': 100})
+        client.post(
+            '/v1/customer/1/transfer', json={'customer_id': 2, 'amount': 30},
+        )
+        response = client.post(
+            '/v1/customer/1/transfer', json={'customer_id': 2, 'amount': 100},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        current_app.config['TRANSFER_ENGINE'] = 'cte'
+        client.post(
+            '/v1/customer/2/transfer', json={'customer_id': 1, 'amount': 10},
+        )
+        client.post('/v1/transfers/batch', json={'transfers': [
+            {'sender_id': 1, 'customer_id': 2, 'amount': 1},
+            {'sender_id': 1, 'customer_id': 2, 'amount': 2},
+        ]})
+
+        assert OperationModel.query.count() == 0
+        assert OperationJournalModel.query.count() == 4
+        journaled = history()
+        assert journaled == [
+            (8, -2, 77), (6, -1, 79), (5, 10, 80), (2, -30, 70), (1, 100, 100),
+        ]
+        response = client.get(
+            '/v1/customer/2/balance',
+            query_string={'at': datetime.utcnow().isoformat()},
+        )
+        assert json.loads(response.data)['amount'] == 23
+        # Entries still in the journal are snapshotted too.
+        run = take_snapshot(
+            now=datetime.utcnow() + timedelta(seconds=1), lag=0,
+        )
+        assert run.total == 100
+        assert run.wallets == 2
+
+    result = runner.invoke(args=['operations', 'materialize', '--once'])
+    assert result.exit_code == 0, result.output
+    assert 'Materialized 9 operations' in result.output
+
+    with current_app.app_context():
+        assert OperationModel.query.count() == 9
+        assert OperationJournalModel.query.count() == 0
+        assert history() == journaled
+
+    result = runner.invoke(args=['ledger', 'check', '--lag', '0'])
+    assert result.exit_code == 0, result.output
+
+
+@pytest.mark.operation
+def test_operations_partitions(client, current_app, tmp_path):
+    # pylint: disable=no-member
+    now = datetime.utcnow()
+    future = month_start(now, 6)
+    with current_app.app_context():
+        customer = CustomerModel(name='Иванов')
+        db.session.add(customer)
+        db.session.commit()
+        client.post('/v1/customer/1/replenishment', json={'amount': 10})
+        db.session.add(OperationModel(
+            transaction=uuid4(), wallet_id=customer.wallet.id,
+            amount_was=10, amount_become=30, operation_amount=20,
+            processed_at=future,
+        ))
+        db.session.commit()
+
+        runner = current_app.test_cli_runner()
+        result = runner.invoke(
+            args=['operations', 'partitions', '--months-ahead', '6'],
+        )
+        assert result.exit_code == 0, result.output
+        assert result.output.splitlines() == [
+            f'Created operations_{month_start(now, months):%Y_%m}'
+            for months in (4, 5, 6)
+        ]
+        count = db.session.execute(
+            f'SELECT count(*) FROM operations_{future:%Y_%m}',
+        ).scalar()
+        assert count == 1
+        count = db.session.execute(
+            'SELECT count(*) FROM operations_default',
+        ).scalar()
+        assert count == 0
+        db.session.commit()
+
+        result = runner.invoke(args=[
+            'operations', 'archive',
+            '--before', f'{month_start(now, 1):%Y-%m-%d}',
+            '--directory', str(tmp_path),
+        ])
+        assert result.exit_code == 0, result.output
+        assert 'operations_legacy' not in \
+            [partition.name for partition in operations_partitions()]
+        assert [row.operation_amount for row in OperationModel.query] == [20]
+        db.session.commit()
+
+    with gzip.open(tmp_path / 'operations_legacy.csv.gz', 'rt') as archive:
+        rows = list(csv.DictReader(archive))
+    assert [row['operation_amount'] for row in rows] == ['10']
+
+
+@pytest.mark.operation
+def test_archive_copies_without_locking_operations(
+        client, current_app, tmp_path, monkeypatch,
+):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.commit()
+        client.post('/v1/customer/1/replenishment', json={'amount': 10})
+
+        class GzipFile(gzip.GzipFile):
+            # Writes into the archived partition while it's being copied.
+            def write(self, data):
+                with db.engine.connect() as connection:
+                    connection.execute("SET lock_timeout = '2s'")
+                    connection.execute(
+                        'INSERT INTO operations (transaction, wallet_id, '
+                        'amount_was, amount_become, operation_amount) '
+                        "VALUES (%s, 1, 10, 30, 20)",
+                        str(uuid4()),
+                    )
+                return super().write(data)
+
+        monkeypatch.setattr(gzip, 'GzipFile', GzipFile)
+        with pytest.raises(ArchiveError):
+            archive_partitions(month_start(datetime.utcnow(), 1), tmp_path)
+        assert 'operations_legacy' in \
+            [partition.name for partition in operations_partitions()]
+        assert OperationModel.query.count() > 1
+        db.session.commit()
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.operation
+def test_replenishment_idempotency(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        customer = CustomerModel(name='Иванов')
+        db.session.add(customer)
+        db.session.commit()
+        headers = {'Idempotency-Key': str(uuid4())}
+
+        first = client.post(
+            '/v1/customer/1/replenishment', json={'amount': 100},
+            headers=headers,
+        )
+        assert first.status_code == status.HTTP_200_OK
+        assert 'Idempotent-Replayed' not in first.headers
+        second = client.post(
+            '/v1/customer/1/replenishment', json={'amount': 100},
+            headers=headers,
+        )
+        assert second.status_code == status.HTTP_200_OK
+        assert second.headers['Idempotent-Replayed'] == 'true'
+        assert json.loads(second.data) == json.loads(first.data)
+
+        replays.clear()
+        third = client.post(
+            '/v1/customer/1/replenishment', json={'amount': 100},
+            headers=headers,
+        )
+        assert third.status_code == status.HTTP_200_OK
+        assert json.loads(third.data) == json.loads(first.data)
+        assert OperationModel.query.count() == 1
+        assert CustomerModel.query.get(1).wallet.amount == 100
+        db.session.commit()
+
+        response = client.post(
+            '/v1/customer/1/replenishment', json={'amount': 200},
+            headers=headers,
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert json.loads(response.data)['message'] == \
+            'Idempotency-Key was already used with another request'
+
+        response = client.post(
+            '/v1/customer/1/replenishment', json={'amount': 200},
+            headers={'Idempotency-Key': 'k' * 256},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+        result = current_app.test_cli_runner().invoke(
+            args=['idempotency', 'purge', '--ttl', '0'],
+        )
+        assert result.exit_code == 0, result.output
+        assert result.output == 'Deleted 1 keys\n'
+
+
+@pytest.mark.operation
+@pytest.mark.parametrize('engine', ['orm', 'cte'])
+def test_transfer_idempotency(client, current_app, engine):
+    # pylint: disable=no-member
+    current_app.config['TRANSFER_ENGINE'] = engine
+    with current_app.app_context():
+        customer1 = CustomerModel(name='Иванов')
+        customer2 = CustomerModel(name='Сидоров')
+        customer1.wallet.amount = 100
+        db.session.add(customer1)
+        db.session.add(customer2)
+        db.session.commit()
+        headers = {'Idempotency-Key': str(uuid4())}
+
+        responses = [
+            client.post(
+                '/v1/customer/1/transfer',
+                json={'customer_id': 2, 'amount': 30},
+                headers=headers,
+            )
+            for _ in range(3)
+        ]
+        assert [response.status_code for response in responses] == \
+            [status.HTTP_200_OK] * 3
+        bodies = [json.loads(response.data) for response in responses]
+        assert bodies[1] == bodies[0] and bodies[2] == bodies[0]
+        assert bodies[0]['sender']['amount_become'] == 70
+        assert CustomerModel.query.get(1).wallet.amount == 70
+        assert CustomerModel.query.get(2).wallet.amount == 30
+        db.session.commit()
+
+        # Failed requests aren't remembered.
+        headers = {'Idempotency-Key': str(uuid4())}
+        for _ in range(2):
+            response = client.post(
+                '/v1/customer/1/transfer',
+                json={'customer_id': 2, 'amount': 1000},
+                headers=headers,
+            )
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+            assert 'Idempotent-Replayed' not in response.headers
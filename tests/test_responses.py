@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+
+import pytest
+import status
+
+from src.api.models import CustomerModel
+from src.extensions import db
+from src.utils.json_provider import OrjsonProvider
+
+
+@pytest.mark.basic
+def test_orjson_provider(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        customer = CustomerModel(name='Иванов')
+        customer.wallet.amount = 100
+        db.session.add(customer)
+        db.session.add(CustomerModel(name='Сидоров'))
+        db.session.commit()
+
+        current_app.json_provider = OrjsonProvider(current_app)
+        response = client.post(
+            '/v1/customer/1/transfer',
+            json={'customer_id': 2, 'amount': 10},
+            headers={'Idempotency-Key': 'key'},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.mimetype == 'application/json'
+        body = json.loads(response.data)
+        assert isinstance(body.pop('transaction'), str)
+        assert body['sender']['amount_become'] == 90
+
+        replayed = client.post(
+            '/v1/customer/1/transfer',
+            json={'customer_id': 2, 'amount': 10},
+            headers={'Idempotency-Key': 'key'},
+        )
+        assert json.loads(replayed.data) == json.loads(response.data)
+
+        response = client.get('/v1/customer/2')
+        assert response.data.decode() == '{"id":2,"name":"Сидоров"}\n'
+        response = client.post('/v1/customer')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert json.loads(response.data)['status'] == 'error'
+
+
+@pytest.mark.basic
+def test_compression_policy(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        customer = CustomerModel(name='Иванов')
+        customer.wallet.amount = 1000
+        db.session.add(customer)
+        db.session.add(CustomerModel(name='Сидоров'))
+        db.session.commit()
+        for _ in range(20):
+            client.post(
+                '/v1/customer/1/transfer',
+                json={'customer_id': 2, 'amount': 1},
+            )
+
+        headers = {'Accept-Encoding': 'gzip'}
+        response = client.get('/v1/customer/1/balance', headers=headers)
+        assert 'Content-Encoding' not in response.headers
+        assert json.loads(response.data) == {'id': 1, 'amount': 980}
+
+        response = client.get('/v1/customer/1/operations', headers=headers)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        body = json.loads(gzip.decompress(response.data))
+        assert len(body['operations']) == 20
+
+        response = client.get('/metrics', headers=headers)
+        assert 'Content-Encoding' not in response.headers
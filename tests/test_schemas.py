@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.api.schemas import (
+    CustomerSchema, CustomersLookupSchema, ExportQuerySchema,
+    OperationsQuerySchema, ReplenishmentSchema, TransferBatchSchema,
+    TransferSchema, compile_schema,
+)
+
+
+@pytest.mark.basic
+@pytest.mark.parametrize('schema, payload', [
+    (CustomerSchema, {'name': 'Иванов'}),
+    (ReplenishmentSchema, {'amount': 1}),
+    (TransferSchema, {'customer_id': 2, 'amount': 10}),
+    (CustomersLookupSchema, {'ids': [3, 1]}),
+    (TransferBatchSchema, {'transfers': [
+        {'sender_id': 1, 'customer_id': 2, 'amount': 5},
+        {'sender_id': 2, 'customer_id': 1, 'amount': 1},
+    ]}),
+])
+def test_compiled_schema(schema, payload):
+    fast_validate = compile_schema(schema)
+    if schema is CustomersLookupSchema:
+        # Lists of plain values are left to pydantic.
+        assert fast_validate is None
+        return
+    assert fast_validate(payload) == schema(**payload).dict()
+
+
+@pytest.mark.basic
+@pytest.mark.parametrize('payload', [
+    {'customer_id': '2', 'amount': 10},
+    {'customer_id': True, 'amount': 10},
+    {'customer_id': 2.0, 'amount': 10},
+    {'customer_id': 2, 'amount': 0},
+    {'customer_id': 2},
+    {'customer_id': 2, 'amount': 10, 'comment': ''},
+    {'customer_id': None, 'amount': 10},
+    [],
+])
+def test_compiled_schema_fallback(payload):
+    # Anything to coerce or to reject goes to pydantic.
+    assert compile_schema(TransferSchema)(payload) is None
+    assert compile_schema(TransferBatchSchema)({'transfers': [payload]}) \
+        is None
+
+
+@pytest.mark.basic
+def test_compiled_schema_unsupported():
+    assert compile_schema(OperationsQuerySchema) is None
+    assert compile_schema(ExportQuerySchema) is None
+    assert compile_schema(CustomerSchema)({'name': 'x' * 257}) is None
+    assert compile_schema(TransferBatchSchema)({'transfers': []}) is None
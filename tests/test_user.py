@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 import json
+import time
 
 import pytest
 import status
 
+from config import CONFIG
+from src.api.balances import NOTIFY_CHANNEL
 from src.api.models import CustomerModel
 from src.extensions import db
+from src.utils.cache import TTLCache
 
 
 @pytest.mark.user
@@ -89,3 +93,228 @@ def test_customer_delete_no_existing(client, current_app):
     with current_app.app_context():
         response = client.delete('/v1/customer/2')
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.user
+def test_customer_cache(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.commit()
+        before = json.loads(client.get('/monitoring/cache').data)
+
+        for _ in range(2):
+            response = client.get('/v1/customer/1/balance')
+            assert json.loads(response.data) == {'id': 1, 'amount': 0}
+        response = client.get('/v1/customer/1')
+        assert json.loads(response.data) == {'id': 1, 'name': 'Иванов'}
+        after = json.loads(client.get('/monitoring/cache').data)
+        assert after['customers']['hits'] - before['customers']['hits'] == 2
+        assert after['customers']['misses'] - \
+            before['customers']['misses'] == 1
+
+        client.post('/v1/customer/1/replenishment', json={'amount': 100})
+        response = client.get('/v1/customer/1/balance')
+        assert json.loads(response.data) == {'id': 1, 'amount': 100}
+        client.put('/v1/customer/1', json={'name': 'Петров'})
+        response = client.get('/v1/customer/1')
+        assert json.loads(response.data) == {'id': 1, 'name': 'Петров'}
+        client.delete('/v1/customer/1')
+        response = client.get('/v1/customer/1/balance')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.user
+def test_customer_cache_notification(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        db.session.add(CustomerModel(name='Иванов'))
+        db.session.commit()
+        response = client.get('/v1/customer/1/balance')
+        assert json.loads(response.data) == {'id': 1, 'amount': 0}
+
+        # Another worker changes the wallet, this one only gets notified.
+        with db.engine.begin() as connection:
+            connection.execute('UPDATE wallets SET amount = 50')
+            connection.execute(f"NOTIFY {NOTIFY_CHANNEL}, '1'")
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            response = client.get('/v1/customer/1/balance')
+            if json.loads(response.data)['amount'] == 50:
+                break
+            time.sleep(0.05)
+        assert json.loads(response.data) == {'id': 1, 'amount': 50}
+
+
+@pytest.mark.user
+def test_cache_versions_are_per_key():
+    cache = TTLCache(maxsize=2, ttl=60)
+    version = cache.version(1)
+    cache.pop(2)
+    cache.set(1, 'fresh', version=version)
+    assert cache.get(1) == 'fresh'
+
+    version = cache.version(1)
+    cache.pop(1)
+    cache.set(1, 'stale', version=version)
+    assert cache.get(1) is None
+
+    # Forgotten stamps still reject reads older than them.
+    version = cache.version(1)
+    cache.pop(1)
+    cache.pop(2)
+    cache.pop(3)
+    cache.set(1, 'stale', version=version)
+    assert cache.get(1) is None
+
+    version = cache.version(1)
+    cache.clear()
+    cache.set(1, 'stale', version=version)
+    assert cache.get(1) is None
+
+
+@pytest.mark.user
+def test_customers_bulk(client, current_app):
+    current_app.config['ONBOARDING_CHUNK_SIZE'] = 2
+    body = '\n'.join([
+        json.dumps({'name': 'Иванов'}),
+        json.dumps({'name': 'Петров', 'age': 30}),
+        '',
+        'not json',
+        json.dumps({'name': 'Сидоров'}),
+    ])
+    response = client.post(
+        '/v1/customers/bulk', data=body.encode(),
+        content_type='application/x-ndjson',
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.mimetype == 'application/x-ndjson'
+    mapping = [json.loads(line) for line in response.data.splitlines()]
+    assert mapping == [
+        {'row': 1, 'id': 1},
+        {
+            'row': 2,
+            'errors': [{
+                'loc': ['age'],
+                'msg': 'extra fields not permitted',
+                'type': 'value_error.extra',
+            }],
+        },
+        {
+            'row': 3,
+            'errors': [{
+                'loc': [], 'msg': 'invalid JSON',
+                'type': 'value_error.format',
+            }],
+        },
+        {'row': 4, 'id': 2},
+    ]
+
+    result = current_app.test_cli_runner().invoke(
+        args=['customers', 'import', '--format', 'csv'],
+        input='name\nКузнецов\n"Смирнов, мл."\n',
+    )
+    assert result.exit_code == 0
+    assert [json.loads(line) for line in result.output.splitlines()] == [
+        {'row': 1, 'id': 3},
+        {'row': 2, 'id': 4},
+    ]
+
+    with current_app.app_context():
+        customers = CustomerModel.query.order_by(CustomerModel.id).all()
+        assert [
+            (customer.name, customer.wallet.amount) for customer in customers
+        ] == [
+            ('Иванов', 0), ('Сидоров', 0), ('Кузнецов', 0),
+            ('Смирнов, мл.', 0),
+        ]
+
+
+@pytest.mark.user
+def test_customers_lookup(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        for name in ('Иванов', 'Петров', 'Сидоров'):
+            db.session.add(CustomerModel(name=name))
+        db.session.commit()
+        client.post('/v1/customer/2/replenishment', json={'amount': 100})
+        client.delete('/v1/customer/3')
+
+        response = client.post(
+            '/v1/customers/lookup', json={'ids': [3, 42, 1, 2, 3]},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.data) == {
+            'customers': [
+                {'id': 3, 'name': 'Сидоров', 'deleted': True, 'amount': 0},
+                {'id': 1, 'name': 'Иванов', 'deleted': False, 'amount': 0},
+                {'id': 2, 'name': 'Петров', 'deleted': False, 'amount': 100},
+            ],
+            'missing': [42],
+        }
+
+        for ids in ([], list(range(CONFIG.CUSTOMERS_LOOKUP_MAX_SIZE + 1))):
+            response = client.post('/v1/customers/lookup', json={'ids': ids})
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.user
+def test_customers_search(client, current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        names = (
+            'Иванов Иван', 'иванова Анна', 'Иванов Иван', 'Петров',
+            'Иваненко', '100% Иванов', 'Сидоров-Иванов',
+        )
+        for name in names:
+            db.session.add(CustomerModel(name=name))
+        db.session.commit()
+        client.delete('/v1/customer/5')
+
+        def search(**params):
+            response = client.get('/v1/customers', query_string=params)
+            assert response.status_code == status.HTTP_200_OK
+            return json.loads(response.data)
+
+        customers = []
+        cursor = None
+        while True:
+            params = {'q': 'ИВАНОВ', 'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            page = search(**params)
+            customers += page['customers']
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        assert customers == [
+            {'id': 1, 'name': 'Иванов Иван'},
+            {'id': 3, 'name': 'Иванов Иван'},
+            {'id': 2, 'name': 'иванова Анна'},
+        ]
+
+        assert search(q='100%')['customers'] == \
+            [{'id': 6, 'name': '100% Иванов'}]
+        assert search(q='%')['customers'] == []
+        assert search(q='иваненко')['customers'] == []
+
+        page = search(q='иванов', mode='fuzzy', limit=4)
+        assert len(page['customers']) == 4
+        rest = search(
+            q='иванов', mode='fuzzy', limit=4, cursor=page['next_cursor'],
+        )
+        assert rest['next_cursor'] is None
+        found = {customer['id'] for customer in page['customers']} | \
+            {customer['id'] for customer in rest['customers']}
+        assert found == {1, 2, 3, 6, 7}
+
+        for params in (
+                {},
+                {'q': ''},
+                {'q': 'x', 'mode': 'regex'},
+                {'q': 'x', 'limit': CONFIG.CUSTOMERS_SEARCH_PAGE_MAX_SIZE + 1},
+                {'q': 'x', 'cursor': 'garbage'},
+                {'q': 'x', 'cursor': page['next_cursor']},
+        ):
+            response = client.get('/v1/customers', query_string=params)
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
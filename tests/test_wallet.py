@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+import status
+
+from src.api.models import CustomerModel, OperationModel, WalletShardModel
+from src.extensions import db
+
+
+@pytest.fixture
+def customers(current_app):
+    # pylint: disable=no-member
+    with current_app.app_context():
+        customer1 = CustomerModel(name='Иванов')
+        customer2 = CustomerModel(name='Сидоров')
+        customer1.wallet.amount = 1000
+        db.session.add(customer1)
+        db.session.add(customer2)
+        db.session.commit()
+    runner = current_app.test_cli_runner()
+    result = runner.invoke(args=['wallets', 'shard', '2', '4'])
+    assert result.exit_code == 0, result.output
+
+
+@pytest.mark.wallet
+@pytest.mark.usefixtures('customers')
+def test_shard_command(current_app):
+    with current_app.app_context():
+        customer = CustomerModel.query.get(2)
+        assert customer.wallet.shards == 4
+        shards = WalletShardModel.query\
+            .filter_by(wallet_id=customer.wallet.id)\
+            .order_by(WalletShardModel.shard)\
+            .all()
+        assert [(shard.shard, shard.amount) for shard in shards] == \
+            [(1, 0), (2, 0), (3, 0), (4, 0)]
+
+
+@pytest.mark.wallet
+@pytest.mark.usefixtures('customers')
+@pytest.mark.parametrize('engine', ['orm', 'cte'])
+def test_credit_sharded_wallet(client, current_app, engine):
+    current_app.config['TRANSFER_ENGINE'] = engine
+    for _ in range(10):
+        response = client.post(
+            '/v1/customer/1/transfer',
+            json={'customer_id': 2, 'amount': 10},
+        )
+        assert response.status_code == status.HTTP_200_OK
+    response = \
+        client.post('/v1/customer/2/replenishment', json={'amount': 50})
+    assert response.status_code == status.HTTP_200_OK
+    response_data = json.loads(response.data)
+    assert response_data['amount_was'] == 100
+    assert response_data['amount_become'] == 150
+
+    response = client.get('/v1/customer/2/balance')
+    assert response.status_code == status.HTTP_200_OK
+    assert json.loads(response.data) == {'id': 2, 'amount': 150}
+
+    with current_app.app_context():
+        customer = CustomerModel.query.get(2)
+        assert customer.wallet.amount == 0
+        assert {operation.shard for operation in customer.wallet.operations} \
+            <= {1, 2, 3, 4}
+        shards = WalletShardModel.query\
+            .filter_by(wallet_id=customer.wallet.id)\
+            .all()
+        assert sum(shard.amount for shard in shards) == 150
+
+
+@pytest.mark.wallet
+@pytest.mark.usefixtures('customers')
+def test_debit_sharded_wallet(client, current_app):
+    for _ in range(5):
+        client.post('/v1/customer/2/replenishment', json={'amount': 20})
+    response = client.post(
+        '/v1/customer/2/transfer',
+        json={'customer_id': 1, 'amount': 90},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert json.loads(response.data)['sender'] == {
+        'amount_become': 10,
+        'amount_was': 100,
+        'customer_id': 2,
+        'operation_amount': -90,
+    }
+    response = client.get('/v1/customer/2/balance')
+    assert json.loads(response.data) == {'id': 2, 'amount': 10}
+
+    with current_app.app_context():
+        customer = CustomerModel.query.get(2)
+        assert customer.wallet.amount == 10
+        operations = OperationModel.query\
+            .filter_by(wallet_id=customer.wallet.id, shard=0)\
+            .order_by(OperationModel.id)\
+            .all()
+        assert [operation.operation_amount for operation in operations] == \
+            [100, -90]
+        swept = OperationModel.query\
+            .filter_by(transaction=operations[0].transaction)\
+            .all()
+        assert sum(operation.operation_amount for operation in swept) == 0
+
+
+@pytest.mark.wallet
+@pytest.mark.usefixtures('customers')
+def test_rebalance_command(client, current_app):
+    for _ in range(5):
+        client.post('/v1/customer/2/replenishment', json={'amount': 20})
+    runner = current_app.test_cli_runner()
+    result = runner.invoke(args=['wallets', 'rebalance'])
+    assert result.exit_code == 0, result.output
+
+    with current_app.app_context():
+        customer = CustomerModel.query.get(2)
+        assert customer.wallet.amount == 100
+        shards = WalletShardModel.query\
+            .filter_by(wallet_id=customer.wallet.id)\
+            .all()
+        assert sum(shard.amount for shard in shards) == 0